@@ -0,0 +1,129 @@
+"""
+Adaptive (AIMD) rate limiting shared by all sessions
+
+Signals:
+- chat completions: x-ratelimit-remaining/limit-requests and -tokens headers
+  and 429 responses (httpx response hook of model_factory)
+- realtime API: rate_limits.updated events (langchain_openai_voice.aconnect)
+
+Reactions, before the API starts returning 429:
+- chat models: the cap of calls below USER priority in llm_scheduler is halved
+  when the remaining share of requests or tokens drops below the low watermark
+  (multiplicative decrease) and grows by one slot per healthy response above the
+  high watermark (additive increase). User commands keep the full cap.
+- realtime API: new upstream connections wait until the reported reset time
+  (bounded) while the remaining share is below the low watermark.
+
+Settings (environment variables):
+- RATE_LIMIT_LOW_WATERMARK: remaining share that triggers a decrease (default 0.1)
+- RATE_LIMIT_HIGH_WATERMARK: remaining share that allows an increase (default 0.3)
+- RATE_LIMIT_DECREASE_COOLDOWN_SEC: min time between two decreases (default 2)
+- REALTIME_CONNECT_MAX_DELAY_SEC: max delay of a new upstream connection (default 5)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Mapping
+
+from llm_scheduler import scheduler
+from realtime_metrics import ADAPTIVE_LIMIT, RATE_LIMIT_DECREASES, REALTIME_CONNECT_DELAY_SECONDS
+
+LOW_WATERMARK = float(os.environ.get("RATE_LIMIT_LOW_WATERMARK", "0.1"))
+HIGH_WATERMARK = float(os.environ.get("RATE_LIMIT_HIGH_WATERMARK", "0.3"))
+DECREASE_COOLDOWN_SEC = float(os.environ.get("RATE_LIMIT_DECREASE_COOLDOWN_SEC", "2"))
+CONNECT_MAX_DELAY_SEC = float(os.environ.get("REALTIME_CONNECT_MAX_DELAY_SEC", "5"))
+
+
+class AdaptiveLimiter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # chat model -> current AIMD cap of background calls
+        self._limits: dict[str, float] = {}
+        self._last_decrease: dict[str, float] = {}
+        self._realtime_resume_at = 0.0
+
+    # --- chat completions ---
+
+    def _decrease(self, model: str, reason: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_decrease.get(model, 0.0) < DECREASE_COOLDOWN_SEC:
+                return
+            self._last_decrease[model] = now
+            current = self._limits.get(model, scheduler.limit(model))
+            new_limit = max(1.0, current / 2)
+            self._limits[model] = new_limit
+        RATE_LIMIT_DECREASES.labels(model, reason).inc()
+        scheduler.set_background_limit(model, int(new_limit))
+        logging.warning(f"Rate limit pressure on {model} ({reason}): background LLM cap -> {int(new_limit)}")
+
+    def _increase(self, model: str) -> None:
+        with self._lock:
+            current = self._limits.get(model)
+            if current is None:
+                return
+            full = scheduler.limit(model)
+            new_limit = current + 1
+            if new_limit >= full:
+                del self._limits[model]
+            else:
+                self._limits[model] = new_limit
+        scheduler.set_background_limit(model, None if new_limit >= full else int(new_limit))
+
+    def observe_headers(self, model: str, status_code: int, headers: Mapping[str, str]) -> None:
+        """Feed one chat completion response."""
+        if status_code == 429:
+            self._decrease(model, "429")
+            return
+        share = None
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            try:
+                if remaining is not None and limit and float(limit) > 0:
+                    kind_share = float(remaining) / float(limit)
+                    share = kind_share if share is None else min(share, kind_share)
+            except ValueError:
+                continue
+        if share is None:
+            return
+        if share < LOW_WATERMARK:
+            self._decrease(model, "remaining")
+        elif share > HIGH_WATERMARK:
+            self._increase(model)
+
+    def limits(self) -> dict:
+        with self._lock:
+            return {(model,): limit for model, limit in self._limits.items()}
+
+    # --- realtime API ---
+
+    def observe_realtime(self, rate_limits: list[dict]) -> None:
+        """Feed the rate_limits of a rate_limits.updated event."""
+        resume_at = 0.0
+        for rate_limit in rate_limits or []:
+            limit = rate_limit.get("limit") or 0
+            remaining = rate_limit.get("remaining")
+            if limit <= 0 or remaining is None:
+                continue
+            if remaining / limit < LOW_WATERMARK:
+                resume_at = max(resume_at, time.monotonic() + float(rate_limit.get("reset_seconds") or 0))
+        with self._lock:
+            if resume_at > self._realtime_resume_at:
+                self._realtime_resume_at = resume_at
+                logging.warning(f"Realtime rate limit pressure: new upstream connections delayed "
+                                f"{resume_at - time.monotonic():.1f}s")
+
+    async def wait_for_realtime_connect(self) -> None:
+        """Delay a new upstream realtime connection while the realtime rate limit is nearly exhausted."""
+        delay = min(CONNECT_MAX_DELAY_SEC, self._realtime_resume_at - time.monotonic())
+        if delay > 0:
+            REALTIME_CONNECT_DELAY_SECONDS.observe(delay)
+            await asyncio.sleep(delay)
+
+
+adaptive_limiter = AdaptiveLimiter()
+ADAPTIVE_LIMIT.set_callback(adaptive_limiter.limits)
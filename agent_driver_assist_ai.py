@@ -1,17 +1,45 @@
 import asyncio
+import os
 import uuid
 import logging
 import json
 from typing import Dict, Any
 
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import PromptTemplate
 
 from dummy_data.scenario_video import scenario_data
-from agent_video_suggestion_ai import VideoRecommender
+from agent_video_suggestion_ai import get_video_recommender
+from llm_scheduler import LLMShedError, Priority, llm_priority
+import ev_range
+from ev_range import RangeEstimate, RangeEstimator
 
 AGENT_MODES = ["video", "ev_charge"]
+# One JSON-schema-constrained call returning the results of all AGENT_MODES
+COMBINED_MODE = "combined"
+# "combined" (one call per cycle) or "separate" (one call per mode)
+DRIVER_ASSIST_LLM_MODE = os.environ.get("DRIVER_ASSIST_LLM_MODE", COMBINED_MODE)
+
+# Scheduling priority of the LLM calls of each mode (low battery beats entertainment)
+MODE_PRIORITY = {
+    "video": Priority.PROPOSAL_VIDEO,
+    "ev_charge": Priority.PROPOSAL_EV_CHARGE,
+    COMBINED_MODE: Priority.PROPOSAL_EV_CHARGE,
+}
+
+
+async def _ainvoke_with_priority(chain, inputs: dict, priority: Priority) -> Any:
+    with llm_priority(priority):
+        return await chain.ainvoke(inputs)
+
+
+def _apply_range_verdict(estimate: RangeEstimate | None, ev_charge_response: dict) -> dict:
+    """ev_charge result after the local range verdict: on "charge" the LLM only words the reason."""
+    if estimate is None or not ev_range.ENABLED or estimate.verdict != "charge":
+        return ev_charge_response
+    reason = str(ev_charge_response.get("reason") or "").strip() or estimate.reason()
+    return {**ev_charge_response, "need_ev_charge": True, "reason": reason}
 
 SYSTEM_PROMPT = {
     "video": '''
@@ -38,6 +66,8 @@ Output JSON format:
     "ev_charge": '''
 You are an AI assistant embedded in an electric vehicle (EV).
 Read the vehicle data below and analyze the situation.
+"trends", when present, is computed from the recent telemetry: drain_pct_per_km (battery % used per km),
+avg_speed_kmh, eta_drift (0 on schedule, positive when the arrival slips) and time_in_state_sec.
 
 ### Goal:
 If the battery level is low or insufficient to reach the destination, suggest to the driver to navigate to a nearby EV charging station.
@@ -48,8 +78,97 @@ If the battery level is low or insufficient to reach the destination, suggest to
   "reason": "<Explanation of why EV charging is being suggested>",
 }
 '''
+,
+    COMBINED_MODE: '''
+You are an AI assistant embedded in an electric vehicle (EV). Read the vehicle data below and produce two results at once.
+
+1. video_search_params: search parameters for the in-vehicle video recommendation engine, based on the user's
+   preferences and the current vehicle conditions.
+   - max_duration_sec: maximum duration (in seconds) based on driving or charging status
+   - viewer_role: "driver" or "passenger", depending on who is watching
+   - viewer_age: age of the viewer
+   - preferred_genres: genres the viewer prefers
+   - avoid_recently_watched: true if the user wants to avoid rewatching
+   - driving_status: e.g. "autonomous", "charging" or "manual"
+   - network_condition: e.g. "good", "poor"
+   - session_id: unique identifier for this session
+   - reason: a concise explanation of why these parameters were set, referencing the user's preferences and
+     vehicle conditions (e.g. battery level, ETA, passenger role)
+
+2. need_ev_charge / reason: true if the battery level is low or insufficient to reach the destination, in which
+   case the driver should navigate to a nearby EV charging station; reason explains why (or why not).
+
+"trends", when present, is computed from the recent telemetry: drain_pct_per_km (battery % used per km),
+avg_speed_kmh, eta_drift (0 on schedule, positive when the arrival slips) and time_in_state_sec.
+'''
 }
 
+# JSON schema of the combined call (strict structured output: every field required, no extra fields)
+COMBINED_SCHEMA = {
+    "name": "driver_assist",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "video_search_params": {
+                "type": "object",
+                "properties": {
+                    "max_duration_sec": {"type": "integer"},
+                    "viewer_role": {"type": "string", "enum": ["driver", "passenger"]},
+                    "viewer_age": {"type": "integer"},
+                    "preferred_genres": {"type": "array", "items": {"type": "string"}},
+                    "avoid_recently_watched": {"type": "boolean"},
+                    "driving_status": {"type": "string"},
+                    "network_condition": {"type": "string"},
+                    "session_id": {"type": "string"},
+                    "reason": {"type": "string"},
+                },
+                "required": [
+                    "max_duration_sec", "viewer_role", "viewer_age", "preferred_genres", "avoid_recently_watched",
+                    "driving_status", "network_condition", "session_id", "reason",
+                ],
+                "additionalProperties": False,
+            },
+            "need_ev_charge": {"type": "boolean"},
+            "reason": {"type": "string"},
+        },
+        "required": ["video_search_params", "need_ev_charge", "reason"],
+        "additionalProperties": False,
+    },
+}
+
+# Compiled chains, keyed by mode and shared chat model (model_factory caches one model per event loop),
+# so every chain is built once per process and loop instead of on every run_agent call
+_chains: Dict[tuple, Any] = {}
+
+
+def _chain(mode: str, model) -> Any:
+    key = (mode, id(model))
+    chain = _chains.get(key)
+    if chain is None:
+        if mode == COMBINED_MODE:
+            chain = PromptTemplate(
+                template="{system_prompt}\n{user_input}\n",
+                input_variables=["user_input", "system_prompt"],
+            ) | model.with_structured_output(COMBINED_SCHEMA, method="json_schema", strict=True)
+        else:
+            parser = JsonOutputParser()
+            chain = PromptTemplate(
+                template="{system_prompt}\n{format_instructions}\n{user_input}\n",
+                input_variables=["user_input", "system_prompt"],
+                partial_variables={"format_instructions": parser.get_format_instructions()},
+            ) | model | parser
+        chain = _chains.setdefault(key, chain)
+    return chain
+
+
+def _split_combined(result: dict) -> Dict[str, dict]:
+    """Results of the combined call in the shape of the separate modes."""
+    return {
+        "video": {"video_search_params": result["video_search_params"]} if "video_search_params" in result else {},
+        "ev_charge": {key: result[key] for key in ("need_ev_charge", "reason") if key in result},
+    }
+
 
 
 class AgentDriverAssistAI:
@@ -63,8 +182,8 @@ class AgentDriverAssistAI:
         """Create a new agent with thread ID"""
         thread_id = thread_id or str(uuid.uuid4())
         if thread_id not in self.agents:
-            models = {mode: ChatOpenAI(model_name=self.model_name) for mode in AGENT_MODES}
-            self.agents[thread_id] = {"models": models}
+            models = {mode: get_chat_model(self.model_name) for mode in (*AGENT_MODES, COMBINED_MODE)}
+            self.agents[thread_id] = {"models": models, "range": RangeEstimator()}
         return thread_id
 
     async def run_agent(self, user_data: str, thread_id: str) -> Dict[str, Any]:
@@ -73,40 +192,66 @@ class AgentDriverAssistAI:
             raise ValueError(f"Thread ID {thread_id} not found. Create an agent first.")
 
         agent_models = self.agents[thread_id]["models"]
-        parser = JsonOutputParser()
 
-        chains = {
-            mode: PromptTemplate(
-                template="{system_prompt}\n{format_instructions}\n{user_input}\n",
-                input_variables=["user_input", "system_prompt"],
-                partial_variables={"format_instructions": parser.get_format_instructions()},
-            ) | agent_models[mode] | parser
-            for mode in AGENT_MODES
-        }
+        # Local range estimate: clear "no charge" cases skip the ev_charge LLM call
+        inputs = {mode: user_data for mode in AGENT_MODES}
+        local_results = {}
+        estimate = self._estimate_range(thread_id, user_data)
+        if estimate is not None:
+            if ev_range.ENABLED and estimate.verdict == "no_charge":
+                local_results["ev_charge"] = {"need_ev_charge": False, "reason": estimate.reason()}
+            else:
+                inputs["ev_charge"] = f"{user_data}\n{estimate.describe()}"
+                if ev_range.ENABLED and estimate.verdict == "charge":
+                    inputs["ev_charge"] += "\nCharging is needed: set need_ev_charge to true and explain why in reason."
+
+        # One combined call for all modes still needing the LLM, or one call per mode
+        pending = [mode for mode in AGENT_MODES if mode not in local_results]
+        if DRIVER_ASSIST_LLM_MODE == COMBINED_MODE and len(pending) > 1:
+            inputs[COMBINED_MODE] = inputs["ev_charge"]
+            pending = [COMBINED_MODE]
 
         #logging.info("user_data: " + user_data)
-        # Run both video and ev_charge concurrently
+        # Run the calls concurrently
         tasks = [
-            chains[mode].ainvoke({
-                "user_input": user_data,
+            _ainvoke_with_priority(_chain(mode, agent_models[mode]), {
+                "user_input": inputs[mode],
                 "system_prompt": SYSTEM_PROMPT[mode]
-            }) for mode in AGENT_MODES
+            }, MODE_PRIORITY[mode]) for mode in pending
         ]
-        results = await asyncio.gather(*tasks)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        responses = dict(local_results)
+        for mode, result in zip(pending, results):
+            if isinstance(result, LLMShedError):
+                # Shed under load: no proposal of this mode this time
+                logging.warning(f"{mode} proposal skipped: {result}")
+                result = {}
+            elif isinstance(result, BaseException):
+                raise result
+            if mode == COMBINED_MODE:
+                responses.update(_split_combined(result))
+            else:
+                responses[mode] = result
 
         # Store results separately
-        video_response, ev_charge_response = results
+        video_response = responses.get("video", {})
+        ev_charge_response = _apply_range_verdict(estimate, responses.get("ev_charge") or {})
         final_response = {}
 
         # Extract video search params and run recommender
         if "video_search_params" in video_response:
-            recommender = VideoRecommender()
-            proposal_video = await recommender.recommend(video_response["video_search_params"])
-            # ここで return_direct を video_proposal レイヤーに追加する
-            if isinstance(proposal_video, dict):
-                proposal_video["return_direct"] = True  # 必ずdict内に格納する
-                proposal_video["type"] = "proposal_video"
-            final_response["proposal_video"] = proposal_video
+            recommender = get_video_recommender()
+            try:
+                with llm_priority(Priority.PROPOSAL_VIDEO):
+                    proposal_video = await recommender.recommend(video_response["video_search_params"])
+            except LLMShedError as e:
+                logging.warning(f"Video recommendation skipped: {e}")
+            else:
+                # ここで return_direct を video_proposal レイヤーに追加する
+                if isinstance(proposal_video, dict):
+                    proposal_video["return_direct"] = True  # 必ずdict内に格納する
+                    proposal_video["type"] = "proposal_video"
+                final_response["proposal_video"] = proposal_video
 
         # add proposal_ev_charge if needed
         if ev_charge_response.get("need_ev_charge") and "reason" in ev_charge_response:
@@ -119,6 +264,17 @@ class AgentDriverAssistAI:
         # logging.info(final_response_str)
         return final_response_str
 
+    def _estimate_range(self, thread_id: str, user_data: str) -> RangeEstimate | None:
+        """Range estimate of the vehicle status in user_data (None if it is not a vehicle status)."""
+        try:
+            status = json.loads(user_data)
+            vehicle_data = status.get("vehicle_data")
+        except (json.JSONDecodeError, AttributeError):
+            return None
+        if not isinstance(vehicle_data, dict):
+            return None
+        return self.agents[thread_id]["range"].estimate(vehicle_data, status.get("trends"))
+
     async def run_tasks(self, messages_per_thread: Dict[str, list]) -> None:
         """Batch process for multiple threads and messages"""
         tasks = [
@@ -11,6 +11,7 @@ Response JSON Format Specification:
     "video_url": str               # URL to access the video page
 }
 """
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -19,7 +20,7 @@ import json
 from typing import List, Dict, Any
 import urllib.parse
 
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 from langchain.schema import SystemMessage, HumanMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.prompts import PromptTemplate
@@ -76,8 +77,8 @@ IMPORTANT:
 
 class VideoRecommender:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
+        self.llm = get_chat_model(
+            "gpt-4o",
             temperature=0.1
         ).bind(
             response_format={"type": "json_object"}
@@ -146,6 +147,19 @@ class VideoRecommender:
         return response
 
 
+# Shared per event loop (its chat model's async HTTP pool belongs to the loop)
+_recommenders: Dict[int, VideoRecommender] = {}
+
+
+def get_video_recommender() -> VideoRecommender:
+    """VideoRecommender shared by all sessions (the trailer DB is loaded once per loop)."""
+    loop_id = id(asyncio.get_running_loop())
+    recommender = _recommenders.get(loop_id)
+    if recommender is None:
+        recommender = _recommenders[loop_id] = VideoRecommender()
+    return recommender
+
+
 async def main():
     proposal = {
         "max_duration_sec": 1800,
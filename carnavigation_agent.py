@@ -11,7 +11,7 @@ LangGraph's create_react_agent pattern.
 import asyncio
 import logging
 
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
@@ -57,7 +57,7 @@ Always respond in the same language as the user's input. However, for return_dir
     
     # Initialize components
     memory = MemorySaver()
-    model = ChatOpenAI(model_name=model_name, temperature=temperature)
+    model = get_chat_model(model_name, temperature=temperature)
     tools = [LaunchNavigation()]
     
     # Create and return react agent with name
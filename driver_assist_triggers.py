@@ -0,0 +1,168 @@
+"""
+Change triggers of driver assist
+
+Every driver assist run costs gpt-4o calls plus the video recommender, far
+too much for every vehicle_status at telemetry rates. TriggerEngine
+evaluates cheap rules on the previous and the new vehicle_data and the run
+only happens when one of them fires:
+- driving_status: the driving status changed (autonomous, charging, manual)
+- battery: energy_status.battery_level crossed one of DRIVER_ASSIST_BATTERY_LEVELS
+- eta: destination_info.eta_sec moved to another DRIVER_ASSIST_ETA_BUCKET_SEC bucket
+- network: network_status changed
+- eta_drift: the eta_drift trend (telemetry_buffer.py) rose above DRIVER_ASSIST_ETA_DRIFT
+The first status of a session always fires ("initial"). A trigger that fired
+less than its debounce time ago is suppressed (a flapping network status does
+not cause a run per flap); the next status is compared with the suppressed
+one, so a debounced transition is not replayed later.
+
+Settings (environment variables):
+- DRIVER_ASSIST_TRIGGERS: "0" runs driver assist for every status (default on)
+- DRIVER_ASSIST_BATTERY_LEVELS: comma separated battery levels in % (default "15,30,50")
+- DRIVER_ASSIST_ETA_BUCKET_SEC: width of an ETA bucket (default 600)
+- DRIVER_ASSIST_ETA_DRIFT: eta_drift above which the arrival is slipping (default 0.2)
+- DRIVER_ASSIST_TRIGGER_DEBOUNCE_SEC: comma separated trigger=seconds pairs
+  overriding the default debounce times below
+"""
+
+import logging
+import os
+import time
+from typing import Any, Callable
+
+from realtime_metrics import DRIVER_ASSIST_SUPPRESSED, DRIVER_ASSIST_TRIGGERS
+
+ENABLED = os.environ.get("DRIVER_ASSIST_TRIGGERS", "1") != "0"
+BATTERY_LEVELS = sorted(
+    float(level) for level in os.environ.get("DRIVER_ASSIST_BATTERY_LEVELS", "15,30,50").split(",") if level.strip())
+ETA_BUCKET_SEC = float(os.environ.get("DRIVER_ASSIST_ETA_BUCKET_SEC", "600"))
+ETA_DRIFT = float(os.environ.get("DRIVER_ASSIST_ETA_DRIFT", "0.2"))
+
+DEFAULT_DEBOUNCE_SEC = {
+    "initial": 0.0,
+    "driving_status": 0.0,
+    "battery": 60.0,
+    "eta": 300.0,
+    "network": 30.0,
+    "eta_drift": 300.0,
+}
+
+
+def _parse_debounce(spec: str) -> dict[str, float]:
+    debounce = dict(DEFAULT_DEBOUNCE_SEC)
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        trigger, _, value = pair.partition("=")
+        try:
+            debounce[trigger.strip()] = float(value)
+        except ValueError:
+            logging.warning(f"Ignoring invalid DRIVER_ASSIST_TRIGGER_DEBOUNCE_SEC entry: {pair!r}")
+    return debounce
+
+
+DEBOUNCE_SEC = _parse_debounce(os.environ.get("DRIVER_ASSIST_TRIGGER_DEBOUNCE_SEC", ""))
+
+
+def _get(data: dict, path: str) -> Any:
+    for key in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _number(value: Any) -> float | None:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _driving_status(previous: dict, current: dict) -> bool:
+    return _get(previous, "driving_status") != _get(current, "driving_status")
+
+
+def _network(previous: dict, current: dict) -> bool:
+    return _get(previous, "network_status") != _get(current, "network_status")
+
+
+def _battery(previous: dict, current: dict) -> bool:
+    before = _number(_get(previous, "energy_status.battery_level"))
+    after = _number(_get(current, "energy_status.battery_level"))
+    if before is None or after is None:
+        return False
+    low, high = min(before, after), max(before, after)
+    # Crossing in either direction: a level reached while charging is as relevant as one passed while driving
+    return any(low < level <= high for level in BATTERY_LEVELS)
+
+
+def _eta(previous: dict, current: dict) -> bool:
+    before = _number(_get(previous, "destination_info.eta_sec"))
+    after = _number(_get(current, "destination_info.eta_sec"))
+    if before is None or after is None or ETA_BUCKET_SEC <= 0:
+        return before != after
+    return before // ETA_BUCKET_SEC != after // ETA_BUCKET_SEC
+
+
+RULES: dict[str, Callable[[dict, dict], bool]] = {
+    "driving_status": _driving_status,
+    "battery": _battery,
+    "eta": _eta,
+    "network": _network,
+}
+
+
+def _eta_drift(previous: dict, current: dict) -> bool:
+    return previous.get("eta_drift", 0.0) <= ETA_DRIFT < current.get("eta_drift", 0.0)
+
+
+# Rules on the previous and the new telemetry features
+FEATURE_RULES: dict[str, Callable[[dict, dict], bool]] = {
+    "eta_drift": _eta_drift,
+}
+
+
+class TriggerEngine:
+    """Per session: decides which vehicle statuses are worth a driver assist run."""
+
+    def __init__(self, debounce: dict[str, float] | None = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.debounce = DEBOUNCE_SEC if debounce is None else debounce
+        self._clock = clock
+        self._previous: dict | None = None
+        self._previous_features: dict = {}
+        self._last_fired: dict[str, float] = {}
+
+    def _fire(self, names: list[str], now: float) -> list[str]:
+        fired = []
+        for name in names:
+            last = self._last_fired.get(name)
+            if last is not None and now - last < self.debounce.get(name, 0.0):
+                DRIVER_ASSIST_TRIGGERS.labels(name, "debounced").inc()
+                continue
+            self._last_fired[name] = now
+            DRIVER_ASSIST_TRIGGERS.labels(name, "fired").inc()
+            fired.append(name)
+        return fired
+
+    def evaluate(self, vehicle_data: dict, forced: str | None = None, features: dict | None = None) -> list[str]:
+        """Triggers fired by vehicle_data and its telemetry features (empty: skip the run).
+
+        forced fires unconditionally.
+        """
+        previous, self._previous = self._previous, vehicle_data
+        previous_features, self._previous_features = self._previous_features, features or {}
+        now = self._clock()
+        if forced:
+            self._last_fired[forced] = now
+            DRIVER_ASSIST_TRIGGERS.labels(forced, "fired").inc()
+            return [forced]
+        if not ENABLED:
+            return ["always"]
+        if previous is None:
+            return self._fire(["initial"], now)
+
+        matched = [name for name, rule in RULES.items() if rule(previous, vehicle_data)]
+        matched += [name for name, rule in FEATURE_RULES.items() if rule(previous_features, self._previous_features)]
+        if not matched:
+            DRIVER_ASSIST_SUPPRESSED.labels("no_trigger").inc()
+            return []
+        fired = self._fire(matched, now)
+        if not fired:
+            DRIVER_ASSIST_SUPPRESSED.labels("debounced").inc()
+        return fired
@@ -0,0 +1,129 @@
+"""
+Local EV range estimate gating the ev_charge LLM call
+
+The ev_charge mode of AgentDriverAssistAI asks gpt-4o whether charging is
+needed although it only looks at battery_level and destination_info. The
+range model here answers the common case deterministically:
+
+    range_km = (battery_level - EV_RESERVE_PCT) / 100 * EV_CAPACITY_KWH / consumption
+
+consumption (kWh/km) comes from the drain_pct_per_km trend of the session's
+telemetry (telemetry_buffer.py) when it is given, and is otherwise learned
+from the battery drop over the distance driven towards the destination
+between the statuses seen here (destination_info.distance_km decreasing).
+Either needs EV_MIN_LEARN_KM of driving; EV_CONSUMPTION_KWH_PER_KM is used
+until then.
+
+Verdicts:
+- "no_charge": charging, or range_km is at least (1 + EV_BORDERLINE_MARGIN)
+  times distance_km. need_ev_charge = false without an LLM call.
+- "charge": range_km is below (1 - EV_BORDERLINE_MARGIN) times distance_km.
+  need_ev_charge = true whatever the LLM says; the LLM only words the reason
+  (the local reason is used if it gives none).
+- "borderline" / "unknown" (fields missing): the LLM decides, with the
+  estimate added to its input.
+
+Settings (environment variables):
+- EV_RANGE_GATE: "0" always calls the LLM (default on)
+- EV_CAPACITY_KWH: usable battery capacity (default 60)
+- EV_CONSUMPTION_KWH_PER_KM: consumption before one is learned (default 0.17)
+- EV_RESERVE_PCT: battery level to keep at arrival (default 10)
+- EV_BORDERLINE_MARGIN: relative band around distance_km left to the LLM (default 0.25)
+- EV_MIN_LEARN_KM: driven distance before the learned consumption is used (default 5)
+"""
+
+import os
+from typing import Any, NamedTuple
+
+from realtime_metrics import EV_RANGE_VERDICTS
+
+ENABLED = os.environ.get("EV_RANGE_GATE", "1") != "0"
+CAPACITY_KWH = float(os.environ.get("EV_CAPACITY_KWH", "60"))
+DEFAULT_CONSUMPTION = float(os.environ.get("EV_CONSUMPTION_KWH_PER_KM", "0.17"))
+RESERVE_PCT = float(os.environ.get("EV_RESERVE_PCT", "10"))
+BORDERLINE_MARGIN = float(os.environ.get("EV_BORDERLINE_MARGIN", "0.25"))
+MIN_LEARN_KM = float(os.environ.get("EV_MIN_LEARN_KM", "5"))
+
+# Learned consumption is clamped to plausible values (a sensor glitch must not make the car look unlimited)
+MIN_CONSUMPTION = 0.08
+MAX_CONSUMPTION = 0.5
+
+
+def _number(value: Any) -> float | None:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class RangeEstimate(NamedTuple):
+    verdict: str
+    range_km: float | None
+    distance_km: float | None
+    consumption_kwh_per_km: float
+
+    def describe(self) -> str:
+        """Estimate as one line added to the LLM input."""
+        if self.range_km is None or self.distance_km is None:
+            return "Local range estimate: unavailable."
+        return (f"Local range estimate: {self.range_km:.0f} km with {RESERVE_PCT:.0f}% reserve "
+                f"({self.consumption_kwh_per_km:.3f} kWh/km), {self.distance_km:.0f} km to the destination.")
+
+    def reason(self) -> str:
+        if self.range_km is None:
+            return "The vehicle is charging."
+        covers = "does not cover" if self.verdict == "charge" else "covers"
+        return f"Estimated range of {self.range_km:.0f} km {covers} the remaining {self.distance_km:.0f} km."
+
+
+class RangeEstimator:
+    """Per driver assist thread: learns the consumption and classifies vehicle statuses."""
+
+    def __init__(self) -> None:
+        self._last: tuple[float, float] | None = None  # (battery_level, distance_km) of the previous status
+        self._energy_kwh = 0.0
+        self._driven_km = 0.0
+
+    def consumption(self, trends: dict | None = None) -> float:
+        trends = trends or {}
+        drain, driven_km = _number(trends.get("drain_pct_per_km")), _number(trends.get("driven_km"))
+        if drain is not None and driven_km is not None and driven_km >= MIN_LEARN_KM:
+            kwh_per_km = drain / 100 * CAPACITY_KWH
+        elif self._driven_km >= MIN_LEARN_KM:
+            kwh_per_km = self._energy_kwh / self._driven_km
+        else:
+            return DEFAULT_CONSUMPTION
+        return min(MAX_CONSUMPTION, max(MIN_CONSUMPTION, kwh_per_km))
+
+    def _learn(self, battery: float, distance: float, charging: bool) -> None:
+        last, self._last = self._last, (battery, distance)
+        if last is None or charging:
+            return
+        driven_km = last[1] - distance
+        used_pct = last[0] - battery
+        # Only segments driven towards the same destination without charging
+        if driven_km > 0 and used_pct >= 0:
+            self._driven_km += driven_km
+            self._energy_kwh += used_pct / 100 * CAPACITY_KWH
+
+    def estimate(self, vehicle_data: dict, trends: dict | None = None) -> RangeEstimate:
+        energy = vehicle_data.get("energy_status") or {}
+        battery = _number(energy.get("battery_level"))
+        distance = _number((vehicle_data.get("destination_info") or {}).get("distance_km"))
+        charging = bool(energy.get("charging")) or vehicle_data.get("driving_status") == "charging"
+
+        if battery is not None and distance is not None:
+            self._learn(battery, distance, charging)
+        consumption = self.consumption(trends)
+        if charging:
+            estimate = RangeEstimate("no_charge", None, distance, consumption)
+        elif battery is None or distance is None:
+            estimate = RangeEstimate("unknown", None, distance, consumption)
+        else:
+            range_km = max(0.0, battery - RESERVE_PCT) / 100 * CAPACITY_KWH / consumption
+            if range_km >= distance * (1 + BORDERLINE_MARGIN):
+                verdict = "no_charge"
+            elif range_km < distance * (1 - BORDERLINE_MARGIN):
+                verdict = "charge"
+            else:
+                verdict = "borderline"
+            estimate = RangeEstimate(verdict, range_km, distance, consumption)
+        EV_RANGE_VERDICTS.labels(estimate.verdict).inc()
+        return estimate
@@ -1,12 +1,14 @@
 import os
+import asyncio
 import openai
-import requests
 import json
 import logging
 from typing import Any, Type
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
 
+from model_factory import get_http_session
+
 
 #
 # call by openai functional calling
@@ -23,7 +25,7 @@ def get_weather_info(latitude:float, longitude:float):
         "forecast_days": "3",
         "timezone": "Asia/Tokyo",
     }
-    response = requests.get(base_url, params=parameters)
+    response = get_http_session().get(base_url, params=parameters)
     if response.status_code == 200:
         data = response.json()
         logging.info(data)
@@ -83,19 +85,9 @@ class WeatherInfo(BaseTool):
             logging.error(response)
             return json.dumps(response, indent=4, ensure_ascii=False)
 
-    def _arun(self, latitude: float, longitude: float):
-        logging.info(f"Fetching weather info for latitude: {latitude}, longitude: {longitude}")
-        try:
-            weather_data = get_weather_info(latitude, longitude)
-            logging.info("Weather data retrieved successfully.")
-            return weather_data
-        except Exception as e:
-            response = {
-                'error' : f"Failed to fetch weather data: {str(e)}"
-            }
-            logging.error(response)
-            return json.dumps(response, indent=4, ensure_ascii=False)      
-        #raise NotImplementedError("Asynchronous execution is not supported.")
+    async def _arun(self, latitude: float, longitude: float):
+        # requests blocks (and sleeps / reads files in cassette replay): keep it off the event loop
+        return await asyncio.to_thread(self._run, latitude, longitude)
 
 
 if __name__ == "__main__":
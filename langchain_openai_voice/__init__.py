@@ -2,7 +2,10 @@ import asyncio
 import json
 import websockets
 import logging
+import time
+import uuid
 
+from collections import deque
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator, AsyncIterator, Any, Callable, Coroutine
 from langchain_openai_voice.utils import amerge
@@ -15,6 +18,22 @@ from pydantic import BaseModel, Field, SecretStr, PrivateAttr
 
 import os
 
+from realtime_metrics import (
+    UPSTREAM_CONNECT_SECONDS,
+    SPEECH_TO_ANSWER_AUDIO_SECONDS,
+    SPEECH_TO_FIRST_AUDIO_SECONDS,
+    TOOL_SECONDS,
+)
+from realtime_tracing import TurnTracer, span
+from realtime_logging import log_event, lazy_json
+from realtime_recorder import recording
+from realtime_filler import filler_audio
+from realtime_compaction import ConversationCompactor
+from realtime_tts_cache import PhraseResponder
+from realtime_api_utils import assistant_text_item, text_to_realtime_api_json_as_role
+from adaptive_limiter import adaptive_limiter
+from llm_scheduler import Priority, llm_priority
+
 if os.getenv("OPENAI_VOICE_TEXT_MODE") is None:
     DEBUG_BY_WSCAT = False
     print("OPENAI_VOICE_TEXT_MODE is not set. Defaulting to False.")
@@ -24,19 +43,17 @@ else:
 
 DEFAULT_MODEL = "gpt-4o-mini-realtime-preview"
 DEFAULT_URL = "wss://api.openai.com/v1/realtime"
+VOICE = "sage"
 
 EVENTS_TO_IGNORE = {
     "response.function_call_arguments.delta",
-    "rate_limits.updated",
     "response.audio_transcript.delta",
-    "response.created",
     "response.content_part.added",
     "response.content_part.done",
-    "conversation.item.created",
+    "conversation.item.deleted",
     "response.audio.done",
     "session.created",
     "session.updated",
-    "response.done",
     "response.output_item.done",
     "response.text.delta",
     "response.output_item.added",
@@ -52,13 +69,34 @@ RESPONSE_CREATE_TEXT = {
     
 }
 
+def out_of_band_response(instructions: str, modalities: tuple[str, ...] = ("text", "audio")) -> dict:
+    """Out-of-band response.create answering instructions alone (no conversation items, no context)."""
+    response = {
+        "conversation": "none",
+        "input": [],
+        "modalities": list(modalities),
+        "instructions": instructions,
+    }
+    if "audio" in modalities:
+        response["voice"] = VOICE
+    return {"type": "response.create", "response": response}
+
+
+def tts_only_response(text: str) -> dict:
+    """Out-of-band response.create that only reads text aloud."""
+    return out_of_band_response(
+        "Read the following text aloud exactly as written, without translating, adding or changing anything:\n"
+        f"{text}"
+    )
+
+
 RESPONSE_CREATE_AUDIO = {
     "type": "response.create",
     "event_id": "audio_event",
     "response": {
         "modalities": ["text", "audio"],
         "instructions": "Please respond by audio.",
-        "voice": "sage",
+        "voice": VOICE,
     },
 }
 
@@ -87,7 +125,10 @@ async def connect(*, api_key: str, model: str, url: str) -> AsyncGenerator[
     url = url or DEFAULT_URL
     url += f"?model={model}"
 
-    websocket = await websockets.connect(url, extra_headers=headers)
+    # Back off while the realtime rate limit is nearly exhausted
+    await adaptive_limiter.wait_for_realtime_connect()
+    with UPSTREAM_CONNECT_SECONDS.time():
+        websocket = await websockets.connect(url, extra_headers=headers)
 
     try:
 
@@ -152,13 +193,17 @@ class VoiceToolExecutor(BaseModel):
             )
 
         async def run_tool() -> dict:
-            result = await tool.ainvoke(args)
+            # Parent span (turn) is attached by aconnect when the call arrives; tool calls are user commands
+            with TOOL_SECONDS.labels(tool.name).time(), span(
+                f"voice_tool:{tool.name}", parent=tool_call.get("_trace_parent")
+            ), llm_priority(Priority.USER):
+                result = await tool.ainvoke(args)
             try:
                 result_str = json.dumps(result)
             except TypeError:
                 # not json serializable, use str
                 result_str = str(result)
-            return {
+            output = {
                 "type": "conversation.item.create",
                 "item": {
                     "id": tool_call["call_id"],
@@ -167,6 +212,10 @@ class VoiceToolExecutor(BaseModel):
                     "output": result_str,
                 },
             }
+            if "_direct" in tool_call:
+                # Direct text call: answered to the client, not to the model
+                output["_direct"] = tool_call["_direct"]
+            return output
 
         task = asyncio.create_task(run_tool())
         return task
@@ -193,7 +242,7 @@ class VoiceToolExecutor(BaseModel):
                         new_task = await self._create_tool_call_task(tool_call)
                         tasks.add(new_task)
                     except ValueError as e:
-                        yield {
+                        output = {
                             "type": "conversation.item.create",
                             "item": {
                                 "id": tool_call["call_id"],
@@ -202,6 +251,9 @@ class VoiceToolExecutor(BaseModel):
                                 "output": (f"Error: {str(e)}"),
                             },
                         }
+                        if "_direct" in tool_call:
+                            output["_direct"] = tool_call["_direct"]
+                        yield output
                 else:
                     # Return the results of the tool execution as it is.
                     yield task.result()
@@ -221,7 +273,10 @@ class OpenAIVoiceReactAgent(BaseModel):
     )
     instructions: str | None = None
     tools: list[BaseTool] | None = None
-    url: str = Field(default=DEFAULT_URL)
+    # OPENAI_REALTIME_URL points the agent at another endpoint (e.g. realtime_mock_server.py)
+    url: str = Field(default_factory=lambda: os.environ.get("OPENAI_REALTIME_URL", DEFAULT_URL))
+    # Language of the spoken output (selects the filler audio, see realtime_filler.py)
+    lang: str = "ja"
 
     async def aconnect(
         self,
@@ -249,7 +304,7 @@ class OpenAIVoiceReactAgent(BaseModel):
         ) as (
             model_send,
             model_receive_stream,
-        ):
+        ), recording(model=self.model, tools=list(tools_by_name)) as recorder, filler_audio(self.lang) as filler:
             # sent tools and instructions with initial chunk
             tool_defs = [
                 {
@@ -260,6 +315,36 @@ class OpenAIVoiceReactAgent(BaseModel):
                 }
                 for tool in tools_by_name.values()
             ]
+            # Start of the silence after the user's speech (for time-to-first-audio)
+            speech_stopped_at: float | None = None
+            # Whether the model's answer audio has started in the current turn (no filler after it)
+            answer_audio_started = False
+            # Cached audio of fixed phrases (no-op unless TTS_CACHE=1)
+            phrases = PhraseResponder(VOICE)
+            # Deletes superseded items and summarizes old turns of the upstream conversation
+            compactor = ConversationCompactor()
+
+            # Direct text calls waiting for the tool executor (it takes one new call at a time)
+            pending_direct: deque[dict] = deque()
+
+            async def submit_direct() -> None:
+                """Hand queued direct text calls to the tool executor while it accepts them."""
+                while pending_direct:
+                    try:
+                        await tool_executor.add_tool_call(pending_direct[0])
+                    except ValueError:
+                        # Busy with another call: retried when the next tool output arrives
+                        log_event("direct_text", "Tool executor busy, %d direct text call(s) queued",
+                                  len(pending_direct))
+                        return
+                    pending_direct.popleft()
+
+            # Per-turn span tracing (no-op unless TRACE_FILE is set)
+            turn_tracer = TurnTracer()
+            # Session recording for replay (recorder is None unless RECORD_DIR is set)
+            if recorder is not None:
+                model_send = recorder.wrap_send(model_send, "to_upstream")
+                send_output_chunk = recorder.wrap_send(send_output_chunk, "to_client")
             await model_send(
                 {
                     "type": "session.update",
@@ -269,7 +354,7 @@ class OpenAIVoiceReactAgent(BaseModel):
                             "model": "whisper-1",
                         },
                         "tools": tool_defs,
-                        "voice": "sage",
+                        "voice": VOICE,
                     },
                 }
             )
@@ -306,19 +391,27 @@ class OpenAIVoiceReactAgent(BaseModel):
                     # Interpreted as text input
                     logging.error("Ignore received raw text input: %s", data_raw)
                     continue
+                if recorder is not None:
+                    recorder.record(stream_key, data)
 
                 # When text input is received from the client
                 if stream_key == "input_mic" and (is_input_text("user", data) or is_input_text("system", data)):
                     stream_key = "input_text"
+                elif stream_key == "input_mic" and data.get("type") in ("speak_phrase", "direct_text"):
+                    stream_key = data["type"]
+                elif stream_key == "tool_outputs" and pending_direct:
+                    await submit_direct()
 
 
                 if stream_key == "input_mic":
-                    logging.info(f"stream_key:{stream_key} data:{json.dumps(data, indent=2, ensure_ascii=False)[:100]}")
+                    log_event("input_mic", "stream_key:%s data:%s", stream_key, lazy_json(data, limit=100))
                     await model_send(data)
 
                 elif stream_key == "input_text":
+                    turn_tracer.begin("input_text", role=data["item"]["role"])
+                    answer_audio_started = False
                     await model_send(data)
-                    logging.info(f"stream_key:{stream_key} data:{json.dumps(data, indent=2, ensure_ascii=False)}")
+                    log_event("input_text", "stream_key:%s data:%s", stream_key, lazy_json(data))
                     await asyncio.sleep(0.1)
 
                     # Send ‘response.create’ to generate a text response
@@ -329,17 +422,64 @@ class OpenAIVoiceReactAgent(BaseModel):
                             event = RESPONSE_CREATE_AUDIO
                     else: 
                         event = RESPONSE_CREATE_TEXT
-                    logging.info("Sending response.create for text input: %s", json.dumps(event, indent=2, ensure_ascii=False))
+                    log_event("response.create", "Sending response.create for text input: %s", lazy_json(event))
                     await model_send(event)
 
+                elif stream_key == "speak_phrase":
+                    # Fixed phrase: cached audio if available, else the model speaks it (and it gets cached)
+                    turn_tracer.begin("speak_phrase")
+                    key = phrases.key(data["text"], data.get("lang") or self.lang)
+                    pcm = None if DEBUG_BY_WSCAT else await phrases.lookup(key)
+                    if pcm is not None:
+                        await phrases.play(key, pcm, send_output_chunk)
+                        log_event("speak_phrase", "Played cached phrase: %s", lazy_json(data["text"]))
+                        turn_tracer.first_output("phrase_cache")
+                    elif DEBUG_BY_WSCAT:
+                        await model_send(out_of_band_response(data["prompt"], modalities=("text",)))
+                    else:
+                        await model_send(phrases.response_create(out_of_band_response(data["prompt"]), key))
+                    # Hit or miss, the context gets the same phrase item (the spoken response adds none)
+                    await model_send(assistant_text_item(data["text"]))
+
+                elif stream_key == "direct_text":
+                    # Text input answered by the supervisor directly (no realtime model pass)
+                    turn_tracer.begin("direct_text")
+                    log_event("direct_text", "direct_text: %s", lazy_json(data))
+                    pending_direct.append({
+                        "name": "supervisor",
+                        "call_id": f"direct_{uuid.uuid4().hex[:16]}",
+                        "arguments": json.dumps({"query": data["text"]}),
+                        "_trace_parent": turn_tracer.tool_call("supervisor"),
+                        "_direct": {"text": data["text"], "speak": bool(data.get("speak"))},
+                    })
+                    await submit_direct()
+
+                elif stream_key == "tool_outputs" and "_direct" in data:
+                    direct = data.pop("_direct")
+                    output_str = data["item"]["output"]
+                    try:
+                        output = json.loads(output_str)
+                    except json.JSONDecodeError:
+                        output = output_str
+                    return_direct = isinstance(output, dict) and output.get("return_direct", False)
+                    answer = output if isinstance(output, str) else output_str
+                    # The client gets the tool output as the model would have relayed it
+                    await send_output_chunk(answer)
+                    turn_tracer.tool_output()
+                    turn_tracer.first_output("direct_text")
+                    # Keep the turn in the conversation context for later voice turns
+                    await model_send(text_to_realtime_api_json_as_role("user", direct["text"]))
+                    await model_send(assistant_text_item(answer))
+                    if direct["speak"] and not return_direct and not DEBUG_BY_WSCAT:
+                        await model_send(tts_only_response(answer))
+
                 elif stream_key == "tool_outputs":
                     # Returns the results of the tool execution to both model + client
-                    logging.info(f"stream_key:{stream_key} data:{json.dumps(data, indent=2, ensure_ascii=False)}")
+                    log_event("tool_outputs", "stream_key:%s data:%s", stream_key, lazy_json(data))
                     await model_send(data)
-                    if DEBUG_BY_WSCAT:
-                        await model_send(RESPONSE_CREATE_TEXT)
-                    else:
-                        await model_send(RESPONSE_CREATE_AUDIO)
+                    # The spoken confirmation is worded by the model for its context: never cached
+                    await model_send(RESPONSE_CREATE_TEXT if DEBUG_BY_WSCAT else RESPONSE_CREATE_AUDIO)
+                    turn_tracer.tool_output()
                     
 
                     # If the output from the tool contains ‘return_direct’: True, it can be displayed to the client as it is, etc.
@@ -348,49 +488,82 @@ class OpenAIVoiceReactAgent(BaseModel):
                         output_str = data["item"].get("output", "")
                         try:
                             output_json = json.loads(output_str)
-                            print(f"★★★ output_json: {json.dumps(output_json, ensure_ascii=False)}")
                             if isinstance(output_json, dict):
                                 return_direct = output_json.get("return_direct", False)
-                                print(f"★★★ return_direct: {return_direct}")
+                                log_event("tool_outputs", "return_direct: %s", return_direct, level=logging.DEBUG)
                                 if return_direct:
-                                    print(f"★★★ output_str: {json.dumps(output_json, ensure_ascii=False)}")
                                     # Send the JSON output as a special marker for extraction
                                     await send_output_chunk(output_str)
+                                    turn_tracer.first_output("return_direct")
                         except Exception:
-                            logging.error(f"Failed to parse output_str as JSON: {output_str}")
+                            logging.error("Failed to parse output_str as JSON: %s", lazy_json(output_str))
                             pass
 
                 elif stream_key == "output_speaker":
                     # Process response from OpenAI
                     t = data["type"]
                     if t == "response.audio.delta":
+                        answer_audio_started = True
+                        phrases.on_audio_delta(data)
+                        # The real answer replaces the filler
+                        filler_heard = await filler.stop()
+                        if speech_stopped_at is not None:
+                            elapsed = time.perf_counter() - speech_stopped_at
+                            SPEECH_TO_ANSWER_AUDIO_SECONDS.observe(elapsed)
+                            if not filler_heard:
+                                SPEECH_TO_FIRST_AUDIO_SECONDS.observe(elapsed)
+                            speech_stopped_at = None
                         # Send audio stream to the client
                         await send_output_chunk(json.dumps(data))
+                        turn_tracer.first_output(t)
                     elif t == "response.audio_buffer.speech_started":
                         # Audio playback start timing
                         await send_output_chunk(json.dumps(data))
                     elif t == "error":
-                        logging.error("error: %s", json.dumps(data, indent=2, ensure_ascii=False))
+                        logging.error("error: %s", lazy_json(data))
                     elif t == "response.function_call_arguments.done":
                         # Execute the tool when the final argument for the tool call is received
-                        logging.info("function_call: %s", json.dumps(data, indent=2, ensure_ascii=False))
+                        log_event("function_call", "function_call: %s", lazy_json(data))
+                        data["_trace_parent"] = turn_tracer.tool_call(data.get("name", ""))
                         await tool_executor.add_tool_call(data)
+                        if not answer_audio_started and not DEBUG_BY_WSCAT:
+                            filler.start(data.get("name", ""), send_output_chunk, speech_stopped_at)
                     elif t == "response.audio_transcript.done":
                         # When Whisper (speech recognition) is completed
                         # logging.info("model(audio transcript): %s", json.dumps(data["transcript"], indent=2, ensure_ascii=False))
-                        pass
+                        compactor.on_text(data.get("item_id", ""), data.get("transcript", ""))
                     elif t == "conversation.item.input_audio_transcription.completed":
                         # Transcript when microphone input is completed
-                        logging.info("user(audio): %s", json.dumps(data["transcript"], indent=2, ensure_ascii=False))
+                        log_event("transcription", "user(audio): %s", lazy_json(data["transcript"]))
+                        compactor.on_text(data.get("item_id", ""), data.get("transcript", ""))
                     elif t == "response.text.done":
                         # Text response is completed, send it to the client
-                        logging.info("response.text.done: %s", json.dumps(data, indent=2, ensure_ascii=False))
+                        log_event("response.text.done", "response.text.done: %s", lazy_json(data))
+                        compactor.on_text(data.get("item_id", ""), data.get("text", ""))
                         response_text = data.get("text", "")
                         await send_output_chunk(response_text)
+                        turn_tracer.first_output(t)
+                    elif t == "response.created":
+                        phrases.on_response_created(data)
+                    elif t == "response.done":
+                        phrases.on_response_done(data)
+                        # Between responses: replace old turns with a summary if the conversation is long
+                        for event in compactor.compact():
+                            await model_send(event)
+                    elif t == "conversation.item.created":
+                        for event in compactor.on_item_created(data.get("item") or {}):
+                            await model_send(event)
+                    elif t == "rate_limits.updated":
+                        adaptive_limiter.observe_realtime(data.get("rate_limits", []))
                     elif t in EVENTS_TO_IGNORE:
                         # Events to ignore
                         pass
+                    elif t == "input_audio_buffer.speech_stopped":
+                        speech_stopped_at = time.perf_counter()
+                        answer_audio_started = False
                     elif t == "input_audio_buffer.speech_started":
+                        # Voice turn: the input_mic stream became a user utterance
+                        turn_tracer.begin("input_mic")
                         logging.warning("[ignore] input_audio_buffer.speech_started. Consider handling interruptions or other processes on the client side")
                     else:
                         logging.warning("[ignore] Unhandled event type: %s", t)
@@ -0,0 +1,148 @@
+"""
+Hedged LLM requests
+
+When a call to a hedged model has not answered after the model's recent p95
+latency, a duplicate request is sent and the first answer wins (the loser is
+cancelled when possible; a blocking call in a thread runs to completion).
+Extra spend is capped by a token bucket: every primary request earns
+LLM_HEDGE_BUDGET hedges, so at most that share of requests is duplicated.
+Hedges skip the llm_scheduler queue (the primary already holds a slot).
+
+Settings (environment variables):
+- LLM_HEDGE: "1" enables hedging (default off)
+- LLM_HEDGE_MODELS: comma separated models to hedge (default "gpt-4o")
+- LLM_HEDGE_BUDGET: max share of duplicated requests (default 0.05)
+- LLM_HEDGE_MIN_SAMPLES: latencies needed before the p95 is trusted (default 20)
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from llm_scheduler import remaining_time
+from realtime_metrics import LLM_HEDGES
+
+T = TypeVar("T")
+
+ENABLED = os.environ.get("LLM_HEDGE", "0") == "1"
+HEDGE_MODELS = {m.strip() for m in os.environ.get("LLM_HEDGE_MODELS", "gpt-4o").split(",") if m.strip()}
+BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.05"))
+MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Unused hedge credit is capped so a quiet period cannot fund a burst of duplicates
+MAX_CREDIT = 10.0
+
+
+class HedgePolicy:
+    def __init__(self, budget: float = BUDGET, min_samples: int = MIN_SAMPLES, window: int = 200) -> None:
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies: dict[str, deque] = {}
+        self._credit = 0.0
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float) -> None:
+        with self._lock:
+            samples = self._latencies.get(model)
+            if samples is None:
+                samples = self._latencies[model] = deque(maxlen=self._window)
+            samples.append(latency)
+            self._credit = min(MAX_CREDIT, self._credit + self.budget)
+
+    def hedge_delay(self, model: str) -> float | None:
+        """p95 latency of model, or None if the call should not be hedged."""
+        if not ENABLED or model not in HEDGE_MODELS:
+            return None
+        with self._lock:
+            samples = self._latencies.get(model)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        delay = ordered[int(len(ordered) * 0.95) - 1]
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay:
+            return None  # the deadline would pass before the hedge could help
+        return delay
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            return True
+
+
+policy = HedgePolicy()
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+async def ahedged(model: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Await call(), duplicating it once if it is slower than the p95 of model."""
+    started = time.perf_counter()
+    delay = policy.hedge_delay(model)
+    primary = asyncio.ensure_future(call())
+    if delay is not None:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done:
+            if not policy.try_spend():
+                LLM_HEDGES.labels(model, "budget_exhausted").inc()
+            else:
+                LLM_HEDGES.labels(model, "sent").inc()
+                hedge = asyncio.ensure_future(call())
+                pending = {primary, hedge}
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        winner = next((f for f in done if not f.cancelled() and f.exception() is None), None)
+                        if winner is not None or not pending:
+                            break
+                finally:
+                    for future in pending:
+                        future.cancel()
+                if winner is None:
+                    return primary.result()  # both failed: raise the primary's error
+                LLM_HEDGES.labels(model, "won" if winner is hedge else "lost").inc()
+                policy.record(model, time.perf_counter() - started)
+                return winner.result()
+    result = await primary
+    policy.record(model, time.perf_counter() - started)
+    return result
+
+
+def hedged(model: str, call: Callable[[], T]) -> T:
+    """Blocking variant of ahedged(); the hedge runs in a worker thread."""
+    started = time.perf_counter()
+    delay = policy.hedge_delay(model)
+    if delay is None:
+        result = call()
+        policy.record(model, time.perf_counter() - started)
+        return result
+
+    primary = _executor.submit(contextvars.copy_context().run, call)
+    done, _ = concurrent.futures.wait({primary}, timeout=delay)
+    if not done:
+        if not policy.try_spend():
+            LLM_HEDGES.labels(model, "budget_exhausted").inc()
+        else:
+            LLM_HEDGES.labels(model, "sent").inc()
+            hedge = _executor.submit(contextvars.copy_context().run, call)
+            pending = {primary, hedge}
+            winner = None
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                winner = next((f for f in done if not f.cancelled() and f.exception() is None), None)
+                if winner is not None:
+                    break
+            if winner is None:
+                return primary.result()
+            LLM_HEDGES.labels(model, "won" if winner is hedge else "lost").inc()
+            policy.record(model, time.perf_counter() - started)
+            return winner.result()
+    result = primary.result()
+    policy.record(model, time.perf_counter() - started)
+    return result
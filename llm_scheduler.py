@@ -0,0 +1,392 @@
+"""
+Process-wide priority scheduler for LLM calls
+
+Every chat model returned by model_factory.get_chat_model() acquires a slot
+here before each request. Slots are limited per model; waiting calls are
+served by priority (then deadline, then arrival order):
+
+    USER (user commands) > PROPOSAL_EV_CHARGE > PROPOSAL_VIDEO > BACKGROUND
+
+The priority and deadline of a call come from the context (contextvars), so
+they follow asyncio tasks and LangGraph nodes:
+
+    with llm_priority(Priority.PROPOSAL_VIDEO, timeout=30):
+        await chain.ainvoke(...)
+
+Calls made outside llm_priority() run as BACKGROUND: user-facing entry points
+(the supervisor tool, tools called by the realtime model) tag themselves USER.
+
+The deadline is a per-turn budget: it bounds the wait for a slot here and is
+passed to the request itself as its timeout (model_factory, HTTP tools), so a
+slow tail request cannot outlive the turn that needs it.
+
+Load shedding: a call is rejected with LLMShedError when its priority already
+has more waiters than its queue budget, when its deadline passes while it
+waits, or when a higher priority call needs room in a full queue (the lowest
+priority waiter is evicted). User commands are never shed for budget or
+queue size reasons (a full queue takes them beyond LLM_QUEUE_MAX).
+A sync call made on an event loop thread never waits: it takes a free slot or
+is shed (waiting would block the aslot() holders that have to release one).
+
+Settings (environment variables):
+- LLM_CONCURRENCY: per-model caps, e.g. "gpt-4o=8,gpt-4o-mini=16"
+- LLM_CONCURRENCY_DEFAULT: cap of models not listed (default 8)
+- LLM_QUEUE_BUDGETS: waiters per priority, e.g. "proposal_video=20,background=5"
+- LLM_QUEUE_MAX: total waiters per model before lower priorities are evicted (default 100)
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import AsyncIterator, Iterator
+
+from realtime_metrics import (
+    LLM_SCHEDULER_IN_FLIGHT,
+    LLM_SCHEDULER_QUEUED,
+    LLM_SCHEDULER_SHED,
+    LLM_SCHEDULER_WAIT_SECONDS,
+)
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+
+    USER = 0
+    PROPOSAL_EV_CHARGE = 1
+    PROPOSAL_VIDEO = 2
+    BACKGROUND = 3
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+class LLMShedError(RuntimeError):
+    """The call was rejected by the scheduler (queue budget, deadline or eviction)."""
+
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.BACKGROUND)
+_deadline: ContextVar[float | None] = ContextVar("llm_deadline", default=None)
+# Set while the current context holds a slot (ChatOpenAI._generate may call _stream internally)
+_in_slot: ContextVar[bool] = ContextVar("llm_in_slot", default=False)
+
+
+@contextmanager
+def llm_priority(priority: Priority, timeout: float | None = None) -> Iterator[None]:
+    """Run the LLM calls of the block with priority (and a deadline timeout seconds from now)."""
+    priority_token = _priority.set(priority)
+    deadline_token = _deadline.set(time.monotonic() + timeout) if timeout is not None else None
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        if deadline_token is not None:
+            _deadline.reset(deadline_token)
+
+
+@contextmanager
+def llm_deadline(timeout: float) -> Iterator[None]:
+    """LLM and tool calls of the block must finish within timeout seconds from now (keeps an earlier deadline)."""
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+def current_deadline() -> float | None:
+    """Monotonic deadline of the current call, if any."""
+    return _deadline.get()
+
+
+def remaining_time(default: float | None = None) -> float | None:
+    """Seconds left until the current deadline (default if there is none), never negative."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    remaining = max(0.0, deadline - time.monotonic())
+    return remaining if default is None else min(remaining, default)
+
+
+def _on_running_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _parse_map(spec: str) -> dict[str, int]:
+    result = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            result[key.strip()] = int(value)
+        except ValueError:
+            logging.error(f"Invalid LLM scheduler setting: {item}")
+    return result
+
+
+DEFAULT_QUEUE_BUDGETS = {
+    Priority.USER: 10**9,
+    Priority.PROPOSAL_EV_CHARGE: 50,
+    Priority.PROPOSAL_VIDEO: 20,
+    Priority.BACKGROUND: 5,
+}
+
+
+class _Waiter:
+    """A queued call; woken either on an event loop or in a thread."""
+
+    __slots__ = ("priority", "deadline", "loop", "future", "event", "error")
+
+    def __init__(self, priority: Priority, deadline: float | None, loop: asyncio.AbstractEventLoop | None) -> None:
+        self.priority = priority
+        self.deadline = deadline
+        self.loop = loop
+        self.future: asyncio.Future | None = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.error: Exception | None = None
+
+    def wake(self, error: Exception | None = None) -> None:
+        self.error = error
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._set_future)
+        else:
+            self.event.set()
+
+    def _set_future(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _ModelQueue:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        # cap for calls below USER priority (lowered by the adaptive limiter); None = limit
+        self.background_limit: int | None = None
+        self.in_flight = 0
+        # entries: (priority, deadline, seq, waiter); cancelled waiters are removed lazily
+        self.heap: list[tuple[int, float, int, _Waiter]] = []
+        self.waiting: dict[_Waiter, Priority] = {}
+
+
+class LLMScheduler:
+    def __init__(self, limits: dict[str, int] | None = None, default_limit: int = 8,
+                 queue_budgets: dict[Priority, int] | None = None, queue_max: int = 100) -> None:
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.queue_budgets = {**DEFAULT_QUEUE_BUDGETS, **(queue_budgets or {})}
+        self.queue_max = queue_max
+        self._queues: dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        budgets = {
+            Priority[name.upper()]: value
+            for name, value in _parse_map(os.environ.get("LLM_QUEUE_BUDGETS", "")).items()
+            if name.upper() in Priority.__members__
+        }
+        return cls(
+            limits=_parse_map(os.environ.get("LLM_CONCURRENCY", "")),
+            default_limit=int(os.environ.get("LLM_CONCURRENCY_DEFAULT", "8")),
+            queue_budgets=budgets,
+            queue_max=int(os.environ.get("LLM_QUEUE_MAX", "100")),
+        )
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(self.limits.get(model, self.default_limit))
+        return queue
+
+    def set_limit(self, model: str, limit: int) -> None:
+        """Change the concurrency cap of model (e.g. by an adaptive limiter)."""
+        with self._lock:
+            queue = self._queue(model)
+            queue.limit = max(1, limit)
+            self._dispatch(queue)
+
+    def limit(self, model: str) -> int:
+        with self._lock:
+            return self._queue(model).limit
+
+    def set_background_limit(self, model: str, limit: int | None) -> None:
+        """Cap the calls below USER priority of model (None removes the extra cap)."""
+        with self._lock:
+            queue = self._queue(model)
+            queue.background_limit = None if limit is None else max(1, limit)
+            self._dispatch(queue)
+
+    @staticmethod
+    def _cap(queue: _ModelQueue, priority: Priority) -> int:
+        if priority == Priority.USER or queue.background_limit is None:
+            return queue.limit
+        return min(queue.limit, queue.background_limit)
+
+    # --- admission ---
+
+    def _enqueue(self, model: str, priority: Priority, deadline: float | None,
+                 loop: asyncio.AbstractEventLoop | None) -> _Waiter | None:
+        """Returns None if a slot was taken immediately, else the queued waiter."""
+        with self._lock:
+            queue = self._queue(model)
+            if queue.in_flight < self._cap(queue, priority) and not queue.waiting:
+                queue.in_flight += 1
+                return None
+
+            same_priority = sum(1 for p in queue.waiting.values() if p == priority)
+            if same_priority >= self.queue_budgets[priority]:
+                self._shed(priority, "queue_budget")
+                raise LLMShedError(f"{model}: queue budget of {priority.label} exceeded")
+            if len(queue.waiting) >= self.queue_max:
+                victim = max(queue.waiting, key=lambda w: queue.waiting[w])
+                if queue.waiting[victim] > priority:
+                    del queue.waiting[victim]
+                    self._shed(victim.priority, "evicted")
+                    victim.wake(LLMShedError(f"{model}: evicted by a higher priority call"))
+                elif priority != Priority.USER:
+                    self._shed(priority, "queue_full")
+                    raise LLMShedError(f"{model}: queue full")
+
+            waiter = _Waiter(priority, deadline, loop)
+            queue.waiting[waiter] = priority
+            heapq.heappush(queue.heap, (int(priority), deadline or float("inf"), next(self._seq), waiter))
+            # A USER call may pass background calls held back by background_limit
+            self._dispatch(queue)
+            return waiter
+
+    def _dispatch(self, queue: _ModelQueue) -> None:
+        """Hand free slots to the best waiters. Called with the lock held."""
+        now = time.monotonic()
+        while queue.heap:
+            waiter = queue.heap[0][3]
+            if waiter not in queue.waiting:
+                heapq.heappop(queue.heap)  # cancelled, timed out or evicted
+                continue
+            if queue.in_flight >= self._cap(queue, waiter.priority):
+                break
+            heapq.heappop(queue.heap)
+            del queue.waiting[waiter]
+            if waiter.deadline is not None and waiter.deadline <= now:
+                self._shed(waiter.priority, "deadline")
+                waiter.wake(LLMShedError("deadline passed while queued"))
+                continue
+            queue.in_flight += 1
+            waiter.wake()
+
+    def _withdraw(self, model: str, waiter: _Waiter) -> bool:
+        """Remove a waiter that gives up. False if it was already granted or rejected meanwhile."""
+        with self._lock:
+            return self._queue(model).waiting.pop(waiter, None) is not None
+
+    def release(self, model: str) -> None:
+        with self._lock:
+            queue = self._queue(model)
+            queue.in_flight -= 1
+            self._dispatch(queue)
+
+    @staticmethod
+    def _shed(priority: Priority, reason: str) -> None:
+        LLM_SCHEDULER_SHED.labels(priority.label, reason).inc()
+
+    @staticmethod
+    def _timeout(deadline: float | None) -> float | None:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    @asynccontextmanager
+    async def aslot(self, model: str) -> AsyncIterator[None]:
+        if _in_slot.get():
+            yield
+            return
+        priority, deadline = current_priority(), current_deadline()
+        started = time.perf_counter()
+        waiter = self._enqueue(model, priority, deadline, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._timeout(deadline))
+            except asyncio.TimeoutError:
+                if self._withdraw(model, waiter):
+                    self._shed(priority, "deadline")
+                    raise LLMShedError(f"{model}: deadline passed while queued") from None
+                # Granted (or rejected) while timing out: wait for the wake-up to land
+                await waiter.future
+            except asyncio.CancelledError:
+                if not self._withdraw(model, waiter) and waiter.error is None:
+                    self.release(model)
+                raise
+            if waiter.error is not None:
+                raise waiter.error
+        LLM_SCHEDULER_WAIT_SECONDS.labels(model, priority.label).observe(time.perf_counter() - started)
+        token = _in_slot.set(True)
+        try:
+            yield
+        finally:
+            _in_slot.reset(token)
+            self.release(model)
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        if _in_slot.get():
+            yield
+            return
+        priority, deadline = current_priority(), current_deadline()
+        started = time.perf_counter()
+        waiter = self._enqueue(model, priority, deadline, None)
+        if waiter is not None and _on_running_loop():
+            # Waiting here would block the loop whose aslot() holders must release the slot
+            if self._withdraw(model, waiter):
+                self._shed(priority, "event_loop")
+                logging.error(f"{model}: sync LLM call on the event loop while no slot is free; use the async API")
+                raise LLMShedError(f"{model}: no free slot and waiting would block the event loop")
+        if waiter is not None:
+            if not waiter.event.wait(self._timeout(deadline)):
+                if self._withdraw(model, waiter):
+                    self._shed(priority, "deadline")
+                    raise LLMShedError(f"{model}: deadline passed while queued")
+                waiter.event.wait()
+            if waiter.error is not None:
+                raise waiter.error
+        LLM_SCHEDULER_WAIT_SECONDS.labels(model, priority.label).observe(time.perf_counter() - started)
+        token = _in_slot.set(True)
+        try:
+            yield
+        finally:
+            _in_slot.reset(token)
+            self.release(model)
+
+    # --- metrics ---
+
+    def in_flight(self) -> dict:
+        with self._lock:
+            return {(model, ): q.in_flight for model, q in self._queues.items()}
+
+    def queued(self) -> dict:
+        with self._lock:
+            counts: dict[tuple[str, str], int] = {}
+            for model, queue in self._queues.items():
+                for priority in queue.waiting.values():
+                    counts[(model, priority.label)] = counts.get((model, priority.label), 0) + 1
+            return counts
+
+
+scheduler = LLMScheduler.from_env()
+LLM_SCHEDULER_IN_FLIGHT.set_callback(scheduler.in_flight)
+LLM_SCHEDULER_QUEUED.set_callback(scheduler.queued)
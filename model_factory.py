@@ -0,0 +1,474 @@
+"""
+Central factory for chat models and outbound HTTP
+
+Shared clients: get_chat_model() returns one ChatOpenAI per (model, settings)
+and event loop instead of one per session. Each model has its own keep-alive
+connection pool (HTTP/2 when the h2 package is installed) whose size bounds the
+concurrent requests to that model. get_http_session() is the shared requests
+Session for plain HTTP APIs. Connection reuse is exported as metrics.
+
+Cassette modes: the chat model HTTP clients go through a cassette transport,
+and install_http_patches() patches `requests` (Tavily, open-meteo, TMDB), so
+the whole pipeline can run offline:
+
+- off (default): live calls, nothing is recorded
+- record: live calls; every request/response pair is stored in CASSETTE_DIR
+- replay: responses are served from CASSETTE_DIR; a request without a
+  recording fails (no network access)
+
+Requests are matched by method, URL and canonical body (credentials removed).
+Identical requests recorded several times are replayed in the recorded order.
+
+Settings (environment variables):
+- LLM_CASSETTE_MODE: off / record / replay
+- CASSETTE_DIR: directory of the cassette files (default "cassettes")
+- CASSETTE_LATENCY_MS: synthetic latency added to every replayed response (default 0)
+- CASSETTE_LATENCY_JITTER_MS: uniform random jitter on top of it (default 0)
+- LLM_MAX_CONNECTIONS_PER_MODEL: connection pool size per model (default 20)
+- HTTP_KEEPALIVE_SEC: idle keep-alive of pooled connections (default 60)
+- HTTP2: "0" disables HTTP/2 even if h2 is installed
+
+Turn deadlines: chat model requests and `requests` calls made under
+llm_scheduler.llm_deadline() get the time left as their timeout, and are not
+sent at all once it has passed.
+
+Chat models created on a shard loop are dropped, and their async pools closed,
+by aclose_loop_clients() when the loop shuts down (realtime_shards.py).
+
+Importing this module patches nothing: the application calls
+install_http_patches() once at startup. The patched `requests` path sleeps and
+reads cassette files in the calling thread, so tools must call `requests` off
+the event loop (asyncio.to_thread).
+"""
+
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from adaptive_limiter import adaptive_limiter
+from llm_hedging import ahedged, hedged
+from llm_scheduler import LLMShedError, remaining_time, scheduler
+from realtime_metrics import HTTP_CLIENT_CONNECTIONS_OPENED, HTTP_CLIENT_REQUESTS, HTTP_SESSION_POOL, LLM_DEADLINE_EXCEEDED
+
+CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "off")
+CASSETTE_DIR = os.environ.get("CASSETTE_DIR", "cassettes")
+LATENCY_SEC = float(os.environ.get("CASSETTE_LATENCY_MS", "0")) / 1000
+LATENCY_JITTER_SEC = float(os.environ.get("CASSETTE_LATENCY_JITTER_MS", "0")) / 1000
+
+MAX_CONNECTIONS_PER_MODEL = int(os.environ.get("LLM_MAX_CONNECTIONS_PER_MODEL", "20"))
+KEEPALIVE_SEC = float(os.environ.get("HTTP_KEEPALIVE_SEC", "60"))
+HTTP2 = os.environ.get("HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+# Removed from URLs and JSON bodies before matching and storing
+SECRET_KEYS = {"api_key", "apikey", "key", "token", "access_token"}
+# Response headers that must not be replayed as-is
+DROP_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+
+def _replayable_headers(headers) -> dict[str, str]:
+    """Response headers without transfer details (bodies are stored decoded)."""
+    return {k: v for k, v in headers.items() if k.lower() not in DROP_RESPONSE_HEADERS}
+
+
+class CassetteMissError(RuntimeError):
+    """Replay mode got a request that was never recorded."""
+
+
+def _strip_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_KEYS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+
+
+def _canonical_body(body: bytes | None) -> str:
+    if not body:
+        return ""
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return hashlib.sha256(body).hexdigest()
+    if isinstance(payload, dict):
+        payload = {k: v for k, v in payload.items() if k.lower() not in SECRET_KEYS}
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+
+class Cassette:
+    """Request/response pairs stored as one JSON file per request key."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._replay_counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, url: str, body: bytes | None) -> str:
+        material = f"{method.upper()} {_strip_url(url)}\n{_canonical_body(body)}"
+        return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def record(self, method: str, url: str, body: bytes | None,
+               status: int, headers: dict[str, str], content: bytes) -> None:
+        key = self.key(method, url, body)
+        entry = {
+            "status": status,
+            "headers": headers,
+            "body_b64": base64.b64encode(content).decode(),
+        }
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            data = {"request": {"method": method.upper(), "url": _strip_url(url)}, "responses": []}
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            data["responses"].append(entry)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+
+    def replay(self, method: str, url: str, body: bytes | None) -> tuple[int, dict[str, str], bytes]:
+        key = self.key(method, url, body)
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise CassetteMissError(f"No recording for {method.upper()} {_strip_url(url)} (key {key})")
+        with open(path, encoding="utf-8") as f:
+            responses = json.load(f)["responses"]
+        with self._lock:
+            index = self._replay_counts.get(key, 0)
+            self._replay_counts[key] = index + 1
+        entry = responses[min(index, len(responses) - 1)]
+        return entry["status"], entry["headers"], base64.b64decode(entry["body_b64"])
+
+
+_cassette = Cassette(CASSETTE_DIR)
+
+
+def _synthetic_latency() -> float:
+    return LATENCY_SEC + (random.uniform(0, LATENCY_JITTER_SEC) if LATENCY_JITTER_SEC else 0.0)
+
+
+#
+# httpx (OpenAI SDK)
+#
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, mode: str, cassette: Cassette, live: httpx.BaseTransport) -> None:
+        self.mode = mode
+        self.cassette = cassette
+        self._live = live
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self.mode == "replay":
+            time.sleep(_synthetic_latency())
+            status, headers, content = self.cassette.replay(request.method, str(request.url), body)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+        response = self._live.handle_request(request)
+        content = response.read()
+        self.cassette.record(request.method, str(request.url), body, response.status_code, _replayable_headers(response.headers), content)
+        return httpx.Response(response.status_code, headers=_replayable_headers(response.headers), content=content,
+                              request=request)
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, mode: str, cassette: Cassette, live: httpx.AsyncBaseTransport) -> None:
+        self.mode = mode
+        self.cassette = cassette
+        self._live = live
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.mode == "replay":
+            await asyncio.sleep(_synthetic_latency())
+            # Cassette files are read and written in a worker thread, off the event loop
+            status, headers, content = await asyncio.to_thread(
+                self.cassette.replay, request.method, str(request.url), body)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+        response = await self._live.handle_async_request(request)
+        content = await response.aread()
+        await asyncio.to_thread(self.cassette.record, request.method, str(request.url), body, response.status_code,
+                                _replayable_headers(response.headers), content)
+        return httpx.Response(response.status_code, headers=_replayable_headers(response.headers), content=content,
+                              request=request)
+
+
+def _deadline_kwargs(model: str, kwargs: dict) -> dict:
+    """Request kwargs with the time left in the turn deadline as the request timeout."""
+    remaining = remaining_time()
+    if remaining is None:
+        return kwargs
+    if remaining <= 0:
+        LLM_DEADLINE_EXCEEDED.labels(model).inc()
+        raise LLMShedError(f"{model}: turn deadline passed before the request was sent")
+    return {**kwargs, "timeout": min(remaining, kwargs.get("timeout") or remaining)}
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose requests wait for a slot of llm_scheduler (priority from the context),
+    are bounded by the turn deadline and may be hedged (llm_hedging)."""
+
+    def _generate(self, *args: Any, **kwargs: Any):
+        with scheduler.slot(self.model_name):
+            kwargs = _deadline_kwargs(self.model_name, kwargs)
+            return hedged(self.model_name, lambda: ChatOpenAI._generate(self, *args, **kwargs))
+
+    async def _agenerate(self, *args: Any, **kwargs: Any):
+        async with scheduler.aslot(self.model_name):
+            kwargs = _deadline_kwargs(self.model_name, kwargs)
+            return await ahedged(self.model_name, lambda: ChatOpenAI._agenerate(self, *args, **kwargs))
+
+    def _stream(self, *args: Any, **kwargs: Any):
+        with scheduler.slot(self.model_name):
+            yield from super()._stream(*args, **_deadline_kwargs(self.model_name, kwargs))
+
+    async def _astream(self, *args: Any, **kwargs: Any):
+        async with scheduler.aslot(self.model_name):
+            async for chunk in super()._astream(*args, **_deadline_kwargs(self.model_name, kwargs)):
+                yield chunk
+
+
+#
+# Shared clients
+#
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS_PER_MODEL,
+        max_keepalive_connections=MAX_CONNECTIONS_PER_MODEL,
+        keepalive_expiry=KEEPALIVE_SEC,
+    )
+
+
+def _client_hooks(pool: str) -> tuple[dict, dict]:
+    """
+    httpx event hooks counting requests and newly opened connections (httpcore trace),
+    and feeding rate limit headers to the adaptive limiter.
+    """
+    requests_total = HTTP_CLIENT_REQUESTS.labels(pool)
+    connections_opened = HTTP_CLIENT_CONNECTIONS_OPENED.labels(pool)
+
+    def trace(event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            connections_opened.inc()
+
+    async def async_trace(event_name: str, info: dict) -> None:
+        trace(event_name, info)
+
+    def on_request(request: httpx.Request) -> None:
+        requests_total.inc()
+        request.extensions["trace"] = trace
+
+    async def on_async_request(request: httpx.Request) -> None:
+        requests_total.inc()
+        request.extensions["trace"] = async_trace
+
+    def on_response(response: httpx.Response) -> None:
+        adaptive_limiter.observe_headers(pool, response.status_code, response.headers)
+
+    async def on_async_response(response: httpx.Response) -> None:
+        on_response(response)
+
+    return (
+        {"request": [on_request], "response": [on_response]},
+        {"request": [on_async_request], "response": [on_async_response]},
+    )
+
+
+_sync_clients: dict[str, httpx.Client] = {}
+# Async pools belong to one event loop. Models and clients created on a running
+# loop are cached under the loop object itself (weakly, so a new loop never
+# inherits the entries of a dead one that happened to have the same id());
+# aclose_loop_clients() closes them before the loop stops.
+_async_clients: dict[str, httpx.AsyncClient] = {}
+_models: dict[tuple, ChatOpenAI] = {}
+_loop_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary())
+_loop_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, ChatOpenAI]]" = (
+    weakref.WeakKeyDictionary())
+_registry_lock = threading.Lock()
+
+
+def _http_clients(model: str, loop: asyncio.AbstractEventLoop | None) -> tuple[httpx.Client, httpx.AsyncClient]:
+    sync_hooks, async_hooks = _client_hooks(model)
+    client = _sync_clients.get(model)
+    if client is None:
+        transport: httpx.BaseTransport = httpx.HTTPTransport(limits=_limits(), http2=HTTP2)
+        if CASSETTE_MODE in ("record", "replay"):
+            transport = CassetteTransport(CASSETTE_MODE, _cassette, transport)
+        client = _sync_clients[model] = httpx.Client(transport=transport, event_hooks=sync_hooks)
+    async_clients = _async_clients if loop is None else _loop_async_clients.setdefault(loop, {})
+    async_client = async_clients.get(model)
+    if async_client is None:
+        async_transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(limits=_limits(), http2=HTTP2)
+        if CASSETTE_MODE in ("record", "replay"):
+            async_transport = AsyncCassetteTransport(CASSETTE_MODE, _cassette, async_transport)
+        async_client = async_clients[model] = httpx.AsyncClient(
+            transport=async_transport, event_hooks=async_hooks)
+    return client, async_client
+
+
+def get_chat_model(model: str = "gpt-4o-mini", **kwargs: Any) -> ScheduledChatOpenAI:
+    """
+    Shared ChatOpenAI for the agents (kwargs are passed to ChatOpenAI, e.g. temperature).
+    Instances are cached per model, kwargs and running event loop; do not mutate them.
+    """
+    try:
+        loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    key = (model, json.dumps(kwargs, sort_keys=True, default=repr))
+    chat_model = (_models if loop is None else _loop_models.get(loop, {})).get(key)
+    if chat_model is not None:
+        return chat_model
+
+    with _registry_lock:
+        models = _models if loop is None else _loop_models.setdefault(loop, {})
+        chat_model = models.get(key)
+        if chat_model is not None:
+            return chat_model
+        http_client, http_async_client = _http_clients(model, loop)
+        options = dict(kwargs)
+        options.setdefault("http_client", http_client)
+        options.setdefault("http_async_client", http_async_client)
+        if CASSETTE_MODE == "replay":
+            # No key is needed offline; retries would only repeat a cassette miss
+            options.setdefault("api_key", os.environ.get("OPENAI_API_KEY") or "replay")
+            options.setdefault("max_retries", 0)
+        chat_model = models[key] = ScheduledChatOpenAI(model=model, **options)
+        logging.info(f"Created shared chat model {model} (HTTP/2: {HTTP2})")
+        return chat_model
+
+
+async def aclose_loop_clients() -> None:
+    """Close the chat model pools of the running event loop (call before the loop stops)."""
+    loop = asyncio.get_running_loop()
+    with _registry_lock:
+        _loop_models.pop(loop, None)
+        async_clients = _loop_async_clients.pop(loop, {})
+    for async_client in async_clients.values():
+        await async_client.aclose()
+
+
+_http_session = None
+
+
+def get_http_session():
+    """Process-wide requests Session with a keep-alive pool (for plain HTTP APIs)."""
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _registry_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=MAX_CONNECTIONS_PER_MODEL)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def _http_session_pool_stats() -> dict:
+    if _http_session is None:
+        return {}
+    requests_total = connections_opened = 0
+    for adapter in set(_http_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is not None:
+                requests_total += pool.num_requests
+                connections_opened += pool.num_connections
+    return {("requests",): requests_total, ("connections_opened",): connections_opened}
+
+
+HTTP_SESSION_POOL.set_callback(_http_session_pool_stats)
+
+
+#
+# requests (Tavily, open-meteo, TMDB)
+#
+_requests_installed = False
+
+
+def install_http_cassette() -> None:
+    """Route `requests` through the cassette in record/replay mode (idempotent)."""
+    global _requests_installed
+    if CASSETTE_MODE not in ("record", "replay") or _requests_installed:
+        return
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+
+    live_send = HTTPAdapter.send
+
+    def cassette_send(adapter, request, *args, **kwargs):
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        if CASSETTE_MODE == "replay":
+            time.sleep(_synthetic_latency())
+            status, headers, content = _cassette.replay(request.method, request.url, body)
+            response = requests.Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response._content = content
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            response.connection = adapter
+            return response
+        response = live_send(adapter, request, *args, **kwargs)
+        _cassette.record(request.method, request.url, body, response.status_code, _replayable_headers(response.headers),
+                         response.content)
+        return response
+
+    HTTPAdapter.send = cassette_send
+    _requests_installed = True
+    logging.info(f"HTTP cassette installed (mode: {CASSETTE_MODE}, dir: {CASSETTE_DIR})")
+
+
+_deadline_installed = False
+
+
+def install_http_deadline() -> None:
+    """Bound the timeout of every `requests` call by the turn deadline of the context (idempotent)."""
+    global _deadline_installed
+    if _deadline_installed:
+        return
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    send = HTTPAdapter.send
+
+    def deadline_send(adapter, request, *args, **kwargs):
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise requests.Timeout(f"turn deadline passed before {request.method} {_strip_url(request.url)}")
+            timeout = kwargs.get("timeout")
+            if isinstance(timeout, tuple):
+                kwargs["timeout"] = tuple(remaining if t is None else min(t, remaining) for t in timeout)
+            else:
+                kwargs["timeout"] = remaining if timeout is None else min(timeout, remaining)
+        return send(adapter, request, *args, **kwargs)
+
+    HTTPAdapter.send = deadline_send
+    _deadline_installed = True
+
+
+def install_http_patches() -> None:
+    """Startup hook: turn deadlines for `requests`, and the cassette in record/replay mode."""
+    install_http_cassette()
+    install_http_deadline()
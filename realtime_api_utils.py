@@ -1,8 +1,14 @@
-def text_to_realtime_api_json_as_role(role: str, data_raw: str):
+import uuid
+
+from realtime_messages import render
+
+
+def text_to_realtime_api_json_as_role(role: str, data_raw: str, kind: str = "text"):
+    # Unique item id; the prefix tells realtime_compaction what the item is (text, status, delta, reminder)
     data = {
         "type": "conversation.item.create",
         "item": {
-            "id": "text_input",
+            "id": f"{kind}_{uuid.uuid4().hex[:20]}",
             "type": "message",
             "role": role,
             "content": [
@@ -14,4 +20,61 @@ def text_to_realtime_api_json_as_role(role: str, data_raw: str):
         },
     }
     #logging.info(f"Converted text to Realtime API JSON: {data}")
-    return data
\ No newline at end of file
+    return data
+
+def user_input_text(data: dict) -> str | None:
+    """Text of a user conversation.item.create with input_text content (None for other events)."""
+    item = data.get("item") if data.get("type") == "conversation.item.create" else None
+    if not isinstance(item, dict) or item.get("role") != "user":
+        return None
+    texts = [c.get("text", "") for c in item.get("content", []) if c.get("type") == "input_text"]
+    return "\n".join(texts) if texts else None
+
+
+def assistant_text_item(text: str):
+    """conversation.item.create of an assistant message (context only, no response)."""
+    return {
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+        },
+    }
+
+
+def direct_text_event(text: str, speak: bool = False):
+    """
+    Text input answered by SupervisorTool directly, without a realtime model pass
+    (handled by OpenAIVoiceReactAgent.aconnect). speak: also read the answer aloud.
+    """
+    return {"type": "direct_text", "text": text, "speak": speak}
+
+
+def speak_phrase_event(text: str, lang: str, prompt: str | None = None):
+    """
+    Ask the voice agent to speak a fixed phrase (handled by OpenAIVoiceReactAgent.aconnect).
+    Cached audio of (text, lang) is played directly; otherwise prompt (default: say text
+    verbatim) is sent to the model and the audio of its answer is cached.
+    """
+    return {
+        "type": "speak_phrase",
+        "text": text,
+        "lang": lang,
+        "prompt": prompt or (
+            "Say the following sentence exactly as it is, without translating, adding or changing anything:\n"
+            f"{text}"
+        ),
+    }
+
+
+def speak_message_event(key: str, lang: str, **params):
+    """speak_phrase_event for a message of the realtime_messages catalog, rendered in lang."""
+    text, text_lang = render(key, lang, **params)
+    if text_lang == lang:
+        return speak_phrase_event(text, lang)
+    # Not in the catalog for lang: the model translates it
+    return speak_phrase_event(
+        text, lang,
+        prompt=f"Please notify the user: {text}\nPlease respond in the language specified by {lang}.",
+    )
@@ -5,8 +5,9 @@ import logging
 import asyncio
 import json
 import uuid
+from contextlib import asynccontextmanager
 from starlette.applications import Starlette
-from starlette.responses import HTMLResponse, JSONResponse
+from starlette.responses import HTMLResponse, JSONResponse, Response
 from starlette.routing import Route, WebSocketRoute
 from starlette.staticfiles import StaticFiles
 from starlette.websockets import WebSocket
@@ -25,18 +26,44 @@ from generate_qr_code import generate_qr_code
 from dummy_login import dummy_login_page, demo_action_page
 from network_utils import get_server_url
 from page_video import page_video
-from realtime_api_utils import text_to_realtime_api_json_as_role
+from realtime_api_utils import (
+    direct_text_event,
+    speak_message_event,
+    text_to_realtime_api_json_as_role,
+    user_input_text,
+)
 from dummy_data.vehicle_data import vehicle_data as vehicle_data_list
 from supervisor_agent import create_supervisor_tool
+from realtime_shards import ShardedLoops, run_on_loop, put_threadsafe
+from realtime_session_lifecycle import SessionLifecycleManager, WS_PING_INTERVAL_SEC, WS_PING_TIMEOUT_SEC
+import realtime_metrics
+from realtime_metrics import ACTIVE_SESSIONS, QUEUE_DEPTH, WS_SEND_SECONDS
+from realtime_logging import log_event, lazy_json, setup_logging
+from realtime_loop_monitor import LoopWatchdog
+from model_factory import aclose_loop_clients, install_http_patches
+from telemetry_buffer import TelemetryBuffer
+from vehicle_state import VehicleStateStore
 
 # Global dictionary to manage connected clients/sessions
 # Key: client_id, Value: dict with websockets, queues, agent tasks, etc.
 connected_clients = {}
 
+# Event loops owning the sessions (single main loop unless REALTIME_LOOP_SHARDS is set)
+loop_shards = ShardedLoops.from_env()
+
+# Detects blocking calls on the event loops (disabled with LOOP_MONITOR=0)
+loop_watchdog = LoopWatchdog.from_env()
+
 
 
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
 
+# Default text input mode of new sessions (clients switch with {"type": "text_mode", ...}):
+# "realtime" relays text through the realtime model, "direct" sends it to the supervisor directly
+TEXT_INPUT_MODE = os.environ.get("TEXT_INPUT_MODE", "realtime")
+# Direct mode: also read the supervisor's answer aloud (one TTS-only response)
+DIRECT_TEXT_SPEAK = os.environ.get("DIRECT_TEXT_SPEAK", "0") == "1"
+
 if not AUTH_TOKEN:
     logging.error("\n" + "="*60)
     logging.error("🚨 AUTH_TOKEN is not set in environment variables.")
@@ -48,8 +75,8 @@ class TokenAuthMiddleware:
     def __init__(self, app: ASGIApp):
         self.app = app
         self.expected_token = os.environ.get("AUTH_TOKEN")
-        # Health check endpoint
-        self.exempt_paths = ["/health", "/"] 
+        # Health check and metrics endpoints
+        self.exempt_paths = ["/health", "/metrics", "/"]
 
         if not self.expected_token:
             logging.error("\n" + "="*60)
@@ -102,19 +129,26 @@ def get_vehicle_data_by_scenario(action):
     """
     for item in vehicle_data_list:
         if item["action"] == action:
-            logging.info(f"Scenario : %s", json.dumps(item["vehicle_data"], ensure_ascii=False, indent=2))
-            print(item["vehicle_data"])
+            logging.info("Scenario : %s", lazy_json(item["vehicle_data"]))
             return item["vehicle_data"]
         
     logging.error(f"Scenario not found: {action}")
     return None
 
 
-async def create_new_session(client_id: str, websocket: WebSocket):
+def session_put(session_data: dict, queue_name: str, item) -> None:
     """
-    Create a new session for this client_id with fresh queues, tasks, and agent.
+    Put item into one of the session queues.
+    Thread-safe: the session may live on another shard loop.
+    """
+    put_threadsafe(session_data["loop"], session_data[queue_name], item)
+
+
+async def start_session_tasks(client_id: str) -> dict:
+    """
+    Create queues, agent and background tasks of a session.
+    Runs on the shard loop that owns client_id.
     """
-    logging.info(f"Creating new session for client_id: {client_id}")
     input_queue = asyncio.Queue()
     ai_input_queue = asyncio.Queue()
 
@@ -134,17 +168,21 @@ async def create_new_session(client_id: str, websocket: WebSocket):
     # Callback to send driver assist messages back to client
     async def send_ai_output_to_client(suggestion: str):
         try:
-            ws = connected_clients[client_id]["websocket"]
-            # Check if WebSocket is still connected
-            if ws.application_state == WebSocketState.CONNECTED:
-                logging.info(f"Sending AI driver assist direct output to client {client_id}")
-                await ws.send_text(suggestion)
+            session_data = connected_clients[client_id]
+            log_event("output_chunk", "Sending AI driver assist direct output to client %s", client_id)
+            # The WebSocket belongs to the server loop
+            if not await run_on_loop(loop_shards.main_loop, send_to_session(session_data, suggestion)):
+                # Detached: waiting for the client to reconnect
+                logging.info(f"Client {client_id} is not connected, dropping output.")
         except Exception as e:
             logging.warning(f"Failed to send AI output: {e}")
 
+    # Vehicle status history of the session, fed by the gateway and read by driver assist
+    telemetry = TelemetryBuffer()
+
     # Launch driver_assist_ai (continuous in background)
     driver_assist_task = asyncio.create_task(
-        driver_assist_ai(ai_input_queue, input_queue, send_ai_output_to_client)
+        driver_assist_ai(ai_input_queue, input_queue, send_ai_output_to_client, telemetry=telemetry)
     )
 
     # Launch agent.aconnect in background (continuous)
@@ -158,33 +196,130 @@ async def create_new_session(client_id: str, websocket: WebSocket):
         agent.aconnect(merged_stream(), send_ai_output_to_client)
     )
 
-    # Store session data in connected_clients
-    connected_clients[client_id] = {
-        "websocket": websocket,
+    return {
+        "loop": asyncio.get_running_loop(),
         "input_queue": input_queue,
         "ai_input_queue": ai_input_queue,
         "agent": agent,
         "agent_task": agent_task,
         "driver_assist_task": driver_assist_task,
+        "vehicle_state": VehicleStateStore(),
+        "telemetry": telemetry,
+    }
+
+
+async def cancel_session_tasks(client_id: str, session_data: dict) -> None:
+    """
+    Cancel the agent and driver assist tasks of a session.
+    Runs on the shard loop that owns the tasks.
+    """
+    driver_assist_task = session_data.get("driver_assist_task")
+    agent_task = session_data.get("agent_task")
+
+    if driver_assist_task:
+        driver_assist_task.cancel()
+        try:
+            await driver_assist_task
+        except asyncio.CancelledError:
+            logging.info(f"driver_assist_task for {client_id} is cancelled.")
+
+    if agent_task:
+        agent_task.cancel()
+        try:
+            await agent_task
+        except asyncio.CancelledError:
+            logging.info(f"agent_task for {client_id} is cancelled.")
+
+
+async def release_session(client_id: str, session_data: dict) -> None:
+    """Cancel the background tasks of a freed session on its own loop."""
+    await run_on_loop(session_data["loop"], cancel_session_tasks(client_id, session_data))
+
+
+# Keeps sessions alive across short disconnects and reaps idle ones
+session_lifecycle = SessionLifecycleManager.from_env(connected_clients, release_session)
+
+
+# Display roles of the sockets subscribed to one car session
+ROLE_SPEAKER = "speaker"  # plays audio (default)
+ROLE_DISPLAY = "display"  # visual output only (e.g. rear-seat screen)
+SUBSCRIBER_ROLES = (ROLE_SPEAKER, ROLE_DISPLAY)
+
+# Audio chunks are json.dumps()ed upstream events; detect them without parsing again
+AUDIO_CHUNK_PREFIX = '{"type": "response.audio'
+
+
+async def send_to_session(session_data: dict, text: str) -> bool:
+    """
+    Broadcast already serialized text to the sockets subscribed to the session.
+    Audio chunks only go to speaker displays, everything else to all displays.
+    Returns False if no subscriber received it (detached session or closed sockets).
+    """
+    audio_only_to_speaker = text.startswith(AUDIO_CHUNK_PREFIX)
+    targets = [
+        ws for ws, role in list(session_data["subscribers"].items())
+        if ws.application_state == WebSocketState.CONNECTED
+        and (role == ROLE_SPEAKER or not audio_only_to_speaker)
+    ]
+    if not targets:
+        return False
+
+    with WS_SEND_SECONDS.time():
+        results = await asyncio.gather(*(ws.send_text(text) for ws in targets), return_exceptions=True)
+    delivered = 0
+    for result in results:
+        if isinstance(result, Exception):
+            logging.warning(f"Failed to send to a subscriber: {result}")
+        else:
+            delivered += 1
+    if delivered:
+        SessionLifecycleManager.record_output(session_data, text)
+    return delivered > 0
+
+
+async def create_new_session(client_id: str, websocket: WebSocket, role: str):
+    """
+    Create a new session for this client_id with fresh queues, tasks, and agent.
+    """
+    loop = loop_shards.loop_for(client_id)
+    logging.info(f"Creating new session for client_id: {client_id} (shard {loop_shards.shard_index(client_id)})")
+    session_data = await run_on_loop(loop, start_session_tasks(client_id))
+
+    # Store session data in connected_clients
+    connected_clients[client_id] = SessionLifecycleManager.init_session({
+        # WebSocket -> display role; all displays of the car share one upstream session
+        "subscribers": {websocket: role},
+        **session_data,
         "user_name": "Takeshi",  # default
         "lang": "ja",           # default
-    }
+        "text_mode": TEXT_INPUT_MODE,
+        "text_speak": DIRECT_TEXT_SPEAK,
+    })
 
     # Send client ID to the client (first time)
     await websocket.send_text(json.dumps({"type": "client_id", "client_id": client_id}))
 
 
-async def reuse_session(client_id: str, websocket: WebSocket):
+async def reuse_session(client_id: str, websocket: WebSocket, role: str):
     """
-    Reuse an existing session; simply reassign the websocket.
+    Reuse an existing session; subscribe the websocket to the still running tasks
+    (reconnect, or another display of the same car).
     """
-    logging.info(f"Reusing session for client_id: {client_id}")
-    connected_clients[client_id]["websocket"] = websocket
+    logging.info(f"Reusing session for client_id: {client_id} (role: {role})")
+    session_lifecycle.attach(client_id, websocket, role)
 
     # 通常はクライアントにID再通知するかは好み次第
     await websocket.send_text(json.dumps({"type": "client_id", "client_id": client_id}))
 
 
+# demo_action -> notice of realtime_messages spoken to the user
+DEMO_NOTICES = {
+    "start_autonomous": "demo.autonomous",
+    "start_ev_charge": "demo.ev_charge",
+    "start_battery_level_low": "demo.battery_low",
+}
+
+
 async def handle_websocket_messages(client_id: str, websocket: WebSocket):
     """
     Main loop that continuously receives messages from the (re)connected WebSocket.
@@ -210,22 +345,27 @@ async def handle_websocket_messages(client_id: str, websocket: WebSocket):
             # If the session is missing for some reason, break
             logging.warning(f"No session found for {client_id}, exiting message loop.")
             break
-
-        input_queue = session_data["input_queue"]
-        ai_input_queue = session_data["ai_input_queue"]
+        session_lifecycle.touch(session_data, msg)
 
         try:
             data = json.loads(msg)
         except json.JSONDecodeError:
+            if session_data.get("text_mode") == "direct":
+                # Direct text mode: the supervisor answers without a realtime model pass
+                session_put(session_data, "input_queue", direct_text_event(msg, session_data.get("text_speak", False)))
+                continue
             # Fallback: treat as user role text
-            await input_queue.put(
+            session_put(
+                session_data,
+                "input_queue",
                 text_to_realtime_api_json_as_role(
                     "system",
-                    "FORCE_TOOL: For the next user message, you MUST call the 'supervisor' tool and must not answer directly. You MUST return the tool's output VERBATIM, without any translation, rephrasing, or modification."
+                    "FORCE_TOOL: For the next user message, you MUST call the 'supervisor' tool and must not answer directly. You MUST return the tool's output VERBATIM, without any translation, rephrasing, or modification.",
+                    kind="reminder",
                 )
             )
             msg_as_json = text_to_realtime_api_json_as_role("user", msg)
-            await input_queue.put(msg_as_json)
+            session_put(session_data, "input_queue", msg_as_json)
             continue
 
         # data must be dict with "type"
@@ -235,10 +375,17 @@ async def handle_websocket_messages(client_id: str, websocket: WebSocket):
             continue
 
         data_type = data.get("type")
-        logging.info(f"Received data_type: {data_type}")
+        log_event(
+            "input_mic" if data_type == "input_audio_buffer.append" else "received",
+            "Received data_type: %s", data_type,
+        )
 
-        if data_type == "dummy_login":
-            logging.info(f"Received dummy_login: {json.dumps(data, ensure_ascii=False, indent=2)}")
+        if data_type == "ping":
+            # Application-level heartbeat (protocol pings are handled by uvicorn)
+            await websocket.send_text(json.dumps({"type": "pong"}))
+
+        elif data_type == "dummy_login":
+            logging.info("Received dummy_login: %s", lazy_json(data))
             # Forward message to target client
             target_id = data.get("target_id")
             msg_content = data.get("message")
@@ -249,22 +396,26 @@ async def handle_websocket_messages(client_id: str, websocket: WebSocket):
                 logging.info(f"dummy_login -> target_id:{target_id}, msg_content:{msg_content}, user_name:{user_name}, lang:{lang}")
                 connected_clients[target_id]["user_name"] = user_name
                 connected_clients[target_id]["lang"] = lang
+                if lang:
+                    # Language of the agent's filler and cached phrases
+                    connected_clients[target_id]["agent"].lang = lang
                 msg_login_notice = {
                     "type": "login_notice",
                     "user_name": user_name,
                     "lang": lang,
                 }
-                await connected_clients[target_id]["ai_input_queue"].put(json.dumps(msg_login_notice))
+                # Target session may live on another shard loop
+                session_put(connected_clients[target_id], "ai_input_queue", json.dumps(msg_login_notice))
 
                 logging.info(f"Forwarding login message to {target_id}: {msg_content}")
                 msg_content_json = text_to_realtime_api_json_as_role("user", msg_content)
-                await connected_clients[target_id]["input_queue"].put(msg_content_json)
+                session_put(connected_clients[target_id], "input_queue", msg_content_json)
             else:
                 logging.warning(f"Target client {target_id} not found.")
                 await websocket.send_text(json.dumps({"error": "Target client not found"}))
 
         elif data_type == "demo_action":
-            logging.info(f"Received demo_action: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            logging.info("Received demo_action: %s", lazy_json(data))
             target_id = data.get("target_id")
             if target_id in connected_clients:
                 action = data.get("action")
@@ -273,106 +424,97 @@ async def handle_websocket_messages(client_id: str, websocket: WebSocket):
                 data["video_url"] = video_url
 
                 action_str = json.dumps(data, ensure_ascii=False, indent=2)
-                logging.info(f"Send message to client: {action_str}")
+                logging.info("Send message to client: %s", action_str)
 
-                target_id_websocket = connected_clients[target_id]["websocket"]
-                target_id_input_queue = connected_clients[target_id]["input_queue"]
-                target_id_ai_input_queue = connected_clients[target_id]["ai_input_queue"]
+                target_session = connected_clients[target_id]
 
                 # Send the JSON to the target client to play dummy video
-                await target_id_websocket.send_text(action_str)
-
-                if action == "start_autonomous":
-                    demo_mode = "Autonomous"
-                elif action == "start_ev_charge":
-                    demo_mode = "EV Charge"
-                elif action == "start_battery_level_low":
-                    demo_mode = "Battery Level Low"
+                await send_to_session(target_session, action_str)
 
                 lang = connected_clients[target_id]["lang"]
 
-                if action == "start_autonomous" or action == "start_ev_charge":
-                    message = f"""
-                        Please notify the user: The car is now in {demo_mode} mode.
-                        Please respond in the language specified by {lang}.
-                    """
-                elif action == "start_battery_level_low":
-                    message = f"""
-                        Please notify the user: The car's battery level is low.
-                        Please respond in the language specified by {lang}.
-                    """
-                logging.info(f"Forwarding demo mode to AI: {message}")
-                # Also let the AI agent know to notify the user
-                await target_id_input_queue.put(
-                    text_to_realtime_api_json_as_role("user", message)
-                )
+                # Notice rendered locally in the user's language (realtime_messages), spoken verbatim
+                notice_key = DEMO_NOTICES.get(action)
+                if notice_key:
+                    event = speak_message_event(notice_key, lang)
+                    logging.info(f"Forwarding demo mode notice to AI: {event['text']}")
+                    session_put(target_session, "input_queue", event)
 
                 # Simulate wait and then send vehicle_status
                 await asyncio.sleep(5)
                 vehicle_data = get_vehicle_data_by_scenario(action)
-                vehicle_status = {
-                    "type": "vehicle_status",
-                    "vehicle_data": vehicle_data,
-                }
-                vs_msg = json.dumps(vehicle_status, ensure_ascii=False, indent=2)
-                await target_id_ai_input_queue.put(vs_msg)
-                logging.info(f"Forwarding vehicle_status to AI: {vs_msg}")
+                if vehicle_data is None:
+                    logging.warning(f"No vehicle_data for demo action {action}, vehicle_status not forwarded")
+                else:
+                    # Demo actions always reach driver assist, even if the scenario did not change
+                    vehicle_state = target_session["vehicle_state"]
+                    _, vs_msg = vehicle_state.driver_assist_update(vehicle_data, trigger="demo")
+                    target_session["telemetry"].append(vehicle_state.state)
+                    session_put(target_session, "ai_input_queue", vs_msg)
+                    logging.info("Forwarding vehicle_status to AI: %s", vs_msg)
             else:
                 logging.warning(f"Target client {target_id} not found.")
                 await websocket.send_text(json.dumps({"error": "Target client not found"}))
 
+        elif data_type == "text_mode":
+            # {"type": "text_mode", "mode": "direct" | "realtime", "speak": bool}
+            mode = data.get("mode")
+            if mode in ("direct", "realtime"):
+                session_data["text_mode"] = mode
+            if "speak" in data:
+                session_data["text_speak"] = bool(data["speak"])
+            await websocket.send_text(json.dumps({
+                "type": "text_mode", "mode": session_data["text_mode"], "speak": session_data["text_speak"],
+            }))
+
         elif data_type == "stop_conversation":
-            logging.info(f"Received demo_action: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            logging.info("Received stop_conversation: %s", lazy_json(data))
             target_id = data.get("target_id")
             if target_id in connected_clients:
                 # stop playing sound at the client app
                 action_str = json.dumps(data, ensure_ascii=False, indent=2)
-                await connected_clients[target_id]["websocket"].send_text(action_str)
+                await send_to_session(connected_clients[target_id], action_str)
                 logging.info(f"Send message to client: {action_str}")
 
         elif data_type == "vehicle_status":
-            logging.info(f"Received vehicle_status: {json.dumps(data, ensure_ascii=False, indent=2)}")
-            # Send to AI
-            await ai_input_queue.put(msg)
-            # Also store as system message
-            sys_msg = text_to_realtime_api_json_as_role("system", json.dumps(data))
-            await input_queue.put(sys_msg)
-            logging.info(f"Forwarding vehicle_status to AI: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            log_event("vehicle_status", "Received vehicle_status: %s", lazy_json(data))
+            vehicle_state = session_data["vehicle_state"]
+            # Driver assist: compact snapshot of the merged state, only when a field or the user_data changed
+            changed, vs_msg = vehicle_state.driver_assist_update(data.get("vehicle_data") or {}, data.get("user_data"))
+            session_data["telemetry"].append(vehicle_state.state)
+            if vs_msg is not None:
+                session_put(session_data, "ai_input_queue", vs_msg)
+            # Realtime model: full snapshot or delta, only when a field moved by its threshold
+            sys_msg = vehicle_state.realtime_item()
+            if sys_msg is not None:
+                session_put(session_data, "input_queue", sys_msg)
+            log_event("vehicle_status", "Forwarded vehicle_status to AI (changed: %s)", sorted(changed))
+
+        elif session_data.get("text_mode") == "direct" and user_input_text(data) is not None:
+            # Direct text mode: the supervisor answers without a realtime model pass
+            session_put(session_data, "input_queue",
+                        direct_text_event(user_input_text(data), session_data.get("text_speak", False)))
 
         else:
             # General message, store in input_queue (and/or ai_input_queue if needed)
             # Inject a system reminder to call 'supervisor' and relay output verbatim without language change
-            await input_queue.put(
+            session_put(
+                session_data,
+                "input_queue",
                 text_to_realtime_api_json_as_role(
                     "system",
-                    "FORCE_TOOL: For the next user message, you MUST call the 'supervisor' tool and must not answer directly. You MUST return the tool's output VERBATIM, without any translation, rephrasing, or modification."
+                    "FORCE_TOOL: For the next user message, you MUST call the 'supervisor' tool and must not answer directly. You MUST return the tool's output VERBATIM, without any translation, rephrasing, or modification.",
+                    kind="reminder",
                 )
             )
-            await input_queue.put(msg)
+            session_put(session_data, "input_queue", msg)
     except Exception as e:
         logging.warning(f"WebSocket {client_id} disconnected: {e}")
     finally:
         # End of while True: WebSocket is disconnected
         logging.info(f"Exited message loop for client_id: {client_id}")
-        # タスクのキャンセル処理
-        session_data = connected_clients.get(client_id)
-        if session_data:
-            driver_assist_task = session_data.get("driver_assist_task")
-            agent_task = session_data.get("agent_task")
-
-            if driver_assist_task:
-                driver_assist_task.cancel()
-                try:
-                    await driver_assist_task
-                except asyncio.CancelledError:
-                    logging.info(f"driver_assist_task for {client_id} is cancelled.")
-
-            if agent_task:
-                agent_task.cancel()
-                try:
-                    await agent_task
-                except asyncio.CancelledError:
-                    logging.info(f"agent_task for {client_id} is cancelled.")
+        # タスクはすぐにキャンセルせず、再接続猶予期間の後に reaper が解放する
+        await session_lifecycle.detach(client_id, websocket)
 
 
 async def websocket_endpoint(websocket: WebSocket):
@@ -380,8 +522,10 @@ async def websocket_endpoint(websocket: WebSocket):
     Main websocket endpoint:
     - Accepts WebSocket connection.
     - Extracts or assigns a client_id (preferably from query params).
-    - If session does not exist, creates a new one; otherwise reuses it.
-    - Continues reading messages until disconnect (but does not kill the AI session).
+    - If session does not exist, creates a new one; otherwise reuses it
+      (several displays of one car may subscribe with different roles).
+    - Continues reading messages until disconnect (but does not kill the AI session;
+      it is kept for the reconnect grace period by session_lifecycle).
     """
     # Accept the WebSocket
     await websocket.accept()
@@ -396,20 +540,24 @@ async def websocket_endpoint(websocket: WebSocket):
     else:
         logging.info(f"Incoming connection with client_id: {client_id}")
 
+    # Display role: "speaker" receives audio, "display" only visual output
+    role = websocket.query_params.get("role", ROLE_SPEAKER)
+    if role not in SUBSCRIBER_ROLES:
+        logging.warning(f"Unknown role '{role}', using '{ROLE_SPEAKER}'.")
+        role = ROLE_SPEAKER
+
     # 2) If we don't already have a session, create a new one
     if client_id not in connected_clients:
-        await create_new_session(client_id, websocket)
+        await create_new_session(client_id, websocket, role)
     else:
         # Reuse existing session
-        await reuse_session(client_id, websocket)
+        await reuse_session(client_id, websocket, role)
 
     # 3) Start handling messages from this WebSocket
     #    (this does not block the agent tasks)
     await handle_websocket_messages(client_id, websocket)
 
-    # 当面はセッションを削除しない：再接続を継続的に許容
-    # もし最終的にクライアントを完全終了したい場合は、ここで「削除」しても良い
-    del connected_clients[client_id]
+    # セッションは削除しない：猶予期間内の再接続を許容し、期限切れは reaper が削除する
     logging.info(f"WebSocket disconnected for client_id: {client_id}")
 
 
@@ -448,6 +596,28 @@ async def health_check(request):
     return JSONResponse({"status": "ok"})
 
 
+def _active_sessions() -> dict:
+    detached = sum(1 for s in list(connected_clients.values()) if s.get("detached_at") is not None)
+    return {("attached",): len(connected_clients) - detached, ("detached",): detached}
+
+
+def _queue_depths() -> dict:
+    sessions = list(connected_clients.values())
+    return {
+        (queue_name,): sum(s[queue_name].qsize() for s in sessions)
+        for queue_name in ("input_queue", "ai_input_queue")
+    }
+
+
+ACTIVE_SESSIONS.set_callback(_active_sessions)
+QUEUE_DEPTH.set_callback(_queue_depths)
+
+
+async def metrics(request):
+    """Prometheus scrape endpoint (unauthenticated like /health)."""
+    return Response(realtime_metrics.render(), media_type=realtime_metrics.CONTENT_TYPE)
+
+
 async def voice_input_toggle_client(request):
     """Toggles voice input (microphone) for the client by sending a WebSocket message."""
     target_id = request.query_params.get("target_id")
@@ -467,7 +637,8 @@ async def voice_input_toggle_client(request):
     }
 
     try:
-        await connected_clients[target_id]["websocket"].send_text(json.dumps(toggle_message))
+        if not await send_to_session(connected_clients[target_id], json.dumps(toggle_message)):
+            return JSONResponse({"error": "Target client not connected"}, status_code=404)
         logging.info(f"Sent voice_input_toggle to client {target_id} with enable={enable}")
         return JSONResponse({"status": "ok", "target_id": target_id, "enable": enable})
     except Exception as e:
@@ -475,6 +646,21 @@ async def voice_input_toggle_client(request):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+async def session_usage(request):
+    """Per-session resource usage (lifetime, idle time, traffic, queue depths)."""
+    return JSONResponse(session_lifecycle.usage_report())
+
+
+async def loop_stalls(request):
+    """Call sites that blocked an event loop, worst first (with the last captured stack)."""
+    if loop_watchdog is None:
+        return JSONResponse({"error": "Loop monitor is disabled (LOOP_MONITOR=0)"}, status_code=404)
+    return JSONResponse({
+        "threshold_ms": loop_watchdog.threshold * 1000,
+        "stalls": loop_watchdog.report(),
+    })
+
+
 # Define application routes
 routes = [
     WebSocketRoute("/ws", websocket_endpoint),
@@ -483,12 +669,35 @@ routes = [
     Route("/demo_action/{action}", demo_action_page),
     Route("/videos/{title}", page_video, methods=["GET"]),
     Route("/health", health_check, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
     Route("/voice_input_toggle", voice_input_toggle_client, methods=["GET"]),
+    Route("/sessions", session_usage, methods=["GET"]),
+    Route("/admin/loop_stalls", loop_stalls, methods=["GET"]),
     Route("/", health_check, methods=["GET"]),
 ]
 
+@asynccontextmanager
+async def lifespan(app):
+    # Turn deadlines (and the cassette in LLM_CASSETTE_MODE=record/replay) for `requests` based tools
+    install_http_patches()
+    # Start shard loops (no-op unless REALTIME_LOOP_SHARDS is set)
+    loop_shards.start()
+    if loop_watchdog is not None:
+        loop_watchdog.watch(loop_shards.main_loop, "main")
+        for index, shard in enumerate(loop_shards.shards):
+            loop_watchdog.watch(shard.loop, f"shard-{index}")
+        loop_watchdog.start()
+    session_lifecycle.start()
+    yield
+    await session_lifecycle.stop()
+    if loop_watchdog is not None:
+        loop_watchdog.stop()
+    loop_shards.stop()
+    await aclose_loop_clients()
+
+
 # Create Starlette application
-app = Starlette(debug=True, routes=routes)
+app = Starlette(debug=True, routes=routes, lifespan=lifespan)
 
 # Mount static directory
 app.mount("/", StaticFiles(directory="static"), name="static")
@@ -497,8 +706,14 @@ app.mount("/", StaticFiles(directory="static"), name="static")
 app.add_middleware(TokenAuthMiddleware)
 
 if __name__ == "__main__":
-    logging.basicConfig(
-        format="[%(asctime)s] [%(process)d] [%(levelname)s] [%(filename)s:%(lineno)d %(funcName)s] [%(message)s]",
-        level=logging.INFO,
+    # Non-blocking, queue-based logging (LOG_LEVEL / LOG_FORMAT / LOG_SAMPLE_RATES)
+    setup_logging()
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=3000,
+        ws_max_size=16777216,
+        # Protocol-level heartbeat: closes half-open sockets
+        ws_ping_interval=WS_PING_INTERVAL_SEC,
+        ws_ping_timeout=WS_PING_TIMEOUT_SEC,
     )
-    uvicorn.run(app, host="0.0.0.0", port=3000, ws_max_size=16777216)
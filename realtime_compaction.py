@@ -0,0 +1,168 @@
+"""
+Compaction of the upstream realtime conversation
+
+A session lives as long as a trip. Every vehicle_status is also added to the
+realtime conversation as a system item, and a FORCE_TOOL reminder precedes
+every text message, so without compaction the upstream context (and with it
+per-turn latency and cost) grows for the whole drive.
+
+ConversationCompactor follows conversation.item.created events and:
+- deletes superseded items right away (conversation.item.delete): only the
+  latest vehicle status and the latest reminder are kept, and vehicle status
+  deltas (vehicle_state.py) only until the next full status. The kind of an
+  item comes from its id prefix (realtime_api_utils.text_to_realtime_api_json_as_role).
+- when more than COMPACT_MAX_ITEMS turn items exist, replaces all but the last
+  COMPACT_KEEP_ITEMS with one system item summarizing them (built locally from
+  the transcripts and texts seen in the session, no model call). Compaction
+  runs at response.done, between responses. A function_call and its
+  function_call_output are evicted together (the API rejects an output whose
+  call is gone), and a call still waiting for its output is kept.
+
+Settings (environment variables):
+- CONVERSATION_COMPACTION: "0" disables compaction (default on)
+- COMPACT_MAX_ITEMS: turn items that trigger a compaction (default 60)
+- COMPACT_KEEP_ITEMS: most recent turn items kept verbatim (default 20)
+- COMPACT_SUMMARY_CHARS: max length of the summary (default 2000)
+"""
+
+import os
+import uuid
+from collections import OrderedDict
+
+from realtime_metrics import CONVERSATION_COMPACTIONS, CONVERSATION_ITEMS_DELETED
+
+ENABLED = os.environ.get("CONVERSATION_COMPACTION", "1") != "0"
+MAX_ITEMS = int(os.environ.get("COMPACT_MAX_ITEMS", "60"))
+KEEP_ITEMS = int(os.environ.get("COMPACT_KEEP_ITEMS", "20"))
+SUMMARY_CHARS = int(os.environ.get("COMPACT_SUMMARY_CHARS", "2000"))
+
+# Item kinds of which only the latest item is relevant
+SUPERSEDED_KINDS = ("status", "reminder")
+# Vehicle status deltas, superseded by the next full status
+DELTA_KIND = "delta"
+SUMMARY_KIND = "summary"
+# Max characters of one line of the summary
+LINE_CHARS = 200
+
+
+def item_kind(item_id: str) -> str:
+    """Kind encoded in the id of items created by the gateway ("status_<hex>"), "turn" otherwise."""
+    prefix, sep, _ = item_id.partition("_")
+    return prefix if sep and prefix in (*SUPERSEDED_KINDS, DELTA_KIND, SUMMARY_KIND, "text") else "turn"
+
+
+def _clip(text: str, limit: int = LINE_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _item_text(item: dict) -> str:
+    if item.get("type") == "function_call":
+        return f"{item.get('name', 'tool')}({item.get('arguments', '')})"
+    if item.get("type") == "function_call_output":
+        return item.get("output", "")
+    parts = []
+    for content in item.get("content") or []:
+        parts.append(content.get("text") or content.get("transcript") or "")
+    return " ".join(p for p in parts if p)
+
+
+class ConversationCompactor:
+    """Per session: tracks the upstream conversation items and returns the events that compact it."""
+
+    def __init__(self, max_items: int = MAX_ITEMS, keep_items: int = KEEP_ITEMS,
+                 summary_chars: int = SUMMARY_CHARS) -> None:
+        self.max_items = max_items
+        self.keep_items = keep_items
+        self.summary_chars = summary_chars
+        # item id -> [role, text] (in conversation order); turn and text items only
+        self._turns: OrderedDict[str, list[str]] = OrderedDict()
+        # call_id -> ids of its function_call and function_call_output items
+        self._calls: dict[str, list[str]] = {}
+        self._answered: set[str] = set()
+        # kind -> ids of superseded kinds, oldest first
+        self._latest: dict[str, list[str]] = {kind: [] for kind in SUPERSEDED_KINDS}
+        self._deltas: list[str] = []
+        self._summary_id: str | None = None
+        self._summary = ""
+
+    @staticmethod
+    def _delete(item_id: str, kind: str) -> dict:
+        CONVERSATION_ITEMS_DELETED.labels(kind).inc()
+        return {"type": "conversation.item.delete", "item_id": item_id}
+
+    def on_item_created(self, item: dict) -> list[dict]:
+        """Track an item of conversation.item.created; returns deletes of the items it supersedes."""
+        if not ENABLED:
+            return []
+        item_id = item.get("id", "")
+        kind = item_id and item_kind(item_id)
+        if not kind or kind == SUMMARY_KIND:
+            return []
+        if kind == DELTA_KIND:
+            self._deltas.append(item_id)
+            return []
+        if kind in SUPERSEDED_KINDS:
+            previous, self._latest[kind] = self._latest[kind], [item_id]
+            deletes = [self._delete(old_id, kind) for old_id in previous]
+            if kind == "status":
+                deletes += [self._delete(old_id, DELTA_KIND) for old_id in self._deltas]
+                self._deltas = []
+            return deletes
+        role = item.get("role") or ("tool" if item.get("type", "").startswith("function_call") else "")
+        self._turns[item_id] = [role or "item", ""]
+        self.on_text(item_id, _item_text(item))
+        if item.get("call_id"):
+            self._calls.setdefault(item["call_id"], []).append(item_id)
+            if item.get("type") == "function_call_output":
+                self._answered.add(item["call_id"])
+        return []
+
+    def on_text(self, item_id: str, text: str) -> None:
+        """Transcript or text of a tracked item that arrived after its creation."""
+        turn = self._turns.get(item_id)
+        if turn is not None and text:
+            turn[1] = _clip(text)
+
+    def compact(self) -> list[dict]:
+        """Events replacing the old turn items with a summary item (empty if below the threshold)."""
+        if not ENABLED or len(self._turns) <= self.max_items:
+            return []
+        evicted = set(list(self._turns)[:len(self._turns) - self.keep_items])
+        for call_id, call_ids in list(self._calls.items()):
+            if evicted.isdisjoint(call_ids):
+                continue
+            if call_id in self._answered:
+                evicted.update(call_ids)
+                del self._calls[call_id]
+                self._answered.discard(call_id)
+            else:
+                evicted.difference_update(call_ids)
+        if not evicted:
+            return []
+        old_ids = [item_id for item_id in self._turns if item_id in evicted]
+        turns = [self._turns.pop(item_id) for item_id in old_ids]
+        events = [self._delete(item_id, "turn") for item_id in old_ids]
+
+        lines = [f"{role}: {text}" for role, text in turns if text]
+        summary = "\n".join(filter(None, [self._summary, *lines]))
+        # Oldest lines go first when the summary is too long
+        self._summary = summary[-self.summary_chars:].partition("\n")[2] if len(summary) > self.summary_chars else summary
+        if self._summary_id is not None:
+            events.append(self._delete(self._summary_id, SUMMARY_KIND))
+        self._summary_id = f"{SUMMARY_KIND}_{uuid.uuid4().hex[:20]}"
+        events.append({
+            "type": "conversation.item.create",
+            "previous_item_id": "root",
+            "item": {
+                "id": self._summary_id,
+                "type": "message",
+                "role": "system",
+                "content": [{
+                    "type": "input_text",
+                    "text": "Summary of the earlier conversation in this drive:\n" + self._summary,
+                }],
+            },
+        })
+        CONVERSATION_COMPACTIONS.inc()
+        return events
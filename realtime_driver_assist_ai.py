@@ -1,15 +1,31 @@
 import json
 import logging
 import asyncio
+import os
+import time
 from typing import Callable, Coroutine, Any
 
 from agent_driver_assist_ai import AgentDriverAssistAI
+from driver_assist_triggers import TriggerEngine
+from telemetry_buffer import TelemetryBuffer
 from dummy_data.scenario_video import scenario_data
 from dummy_data.user import user_data as dummy_user_data
 from realtime_api_utils import text_to_realtime_api_json_as_role
+from realtime_messages import render
+from realtime_metrics import (
+    DRIVER_ASSIST_RUN_AGENT_SECONDS,
+    DRIVER_ASSIST_SUPERSEDED,
+    DRIVER_ASSIST_SUPPRESSED,
+    DRIVER_ASSIST_TIMEOUTS,
+)
+from llm_scheduler import llm_deadline
+from realtime_logging import lazy_json
+from vehicle_state import canonical_json
 
 ENABLE_DRIVER_ASSIST = True
 STOP_SIGNAL = "__STOP__"  # For graceful shutdown
+# Per-turn deadline of run_agent; every LLM and HTTP call of the turn gets the time left as its timeout
+DRIVER_ASSIST_TURN_TIMEOUT_SEC = float(os.environ.get("DRIVER_ASSIST_TURN_TIMEOUT_SEC", "30"))
 
 def is_vehicle_status(data: dict) -> bool:
     """Check if the received JSON data follows the expected format."""
@@ -23,7 +39,8 @@ async def driver_assist_ai(
     ai_input_queue: asyncio.Queue,
     output_queue: asyncio.Queue,
     send_output_chunk: Callable[[str], Coroutine[Any, Any, None]],
-    run_agent_timeout: float = 30.0
+    run_agent_timeout: float = DRIVER_ASSIST_TURN_TIMEOUT_SEC,
+    telemetry: TelemetryBuffer | None = None
 ):
     """
     Process valid JSON data and generate AI-based suggestions.
@@ -31,6 +48,8 @@ async def driver_assist_ai(
     - Timeout for run_agent
     - Exception logging
     - Graceful stop with STOP_SIGNAL
+    - Latest-wins: queued statuses coalesced, superseded runs cancelled
+    - Trend features of the session telemetry (fed by the gateway) for triggers and prompts
     """
     driver_assist = AgentDriverAssistAI()
     driver_assist_thread = driver_assist.create_agent()
@@ -40,67 +59,59 @@ async def driver_assist_ai(
     user_lang = "ja"  # デフォルト言語（例：日本語）
     user_name = "Takeshi"  # デフォルトユーザー名
     login_user_data = dummy_user_data.get(user_name, {})  # デフォルトの user_data を取得
-    previous_data = None  # 前回データ保持
+    # 車両状況が実質的に変わったときだけ run_agent を呼ぶ
+    triggers = TriggerEngine()
 
 
     async def ai_generate_suggestions(data: dict) -> str:
         """
         Generate AI suggestions and return them as a string, with timeout & exception handling.
         """
+        started_at = time.perf_counter()
         try:
             #logging.info(f"Processing vehicle data:\n{json.dumps(data, indent=2, ensure_ascii=False)}")
-            formatted_message = json.dumps(data, ensure_ascii=False, indent=2)
+            formatted_message = canonical_json(data)
             # Timeout to prevent infinite wait if model is stuck
-            suggestion = await asyncio.wait_for(
-                driver_assist.run_agent(formatted_message, driver_assist_thread),
-                timeout=run_agent_timeout
-            )
+            # The same deadline bounds every LLM/HTTP call of the turn (llm_scheduler, model_factory)
+            with llm_deadline(run_agent_timeout):
+                suggestion = await asyncio.wait_for(
+                    driver_assist.run_agent(formatted_message, driver_assist_thread),
+                    timeout=run_agent_timeout
+                )
+            DRIVER_ASSIST_RUN_AGENT_SECONDS.observe(time.perf_counter() - started_at)
             #logging.info(f"AI Suggestion: {json.dumps(suggestion, ensure_ascii=False, indent=2)}")
             return suggestion if suggestion else "No suggestion generated."
         except asyncio.TimeoutError:
+            DRIVER_ASSIST_TIMEOUTS.inc()
+            DRIVER_ASSIST_RUN_AGENT_SECONDS.observe(time.perf_counter() - started_at)
             logging.error("run_agent timed out. Possibly stuck or unresponsive.")
             return "{}"
         except Exception as e:
             logging.error(f"Exception in ai_generate_suggestions: {e}", exc_info=True)
             return "{}"
 
-    while True:
-        try:
-            incoming_data = await ai_input_queue.get()
-        except Exception as e:
-            logging.error(f"Exception while waiting for ai_input_queue: {e}", exc_info=True)
-            continue
-
-        # Check for stop signal
-        if incoming_data == STOP_SIGNAL:
-            logging.info("Stop signal received. Exiting driver_assist_ai loop.")
-            break
-
-        # 前回と同じデータならスキップ
-        # 現在は手動でデータがおくられてくるのでコメントアウト
-        # if incoming_data == previous_data:
-        #    logging.info("同一データ受信のためスキップします。")
-        #    continue
-        # previous_data = incoming_data
+    def parse_input(incoming_data) -> dict | None:
+        """Vehicle status of one ai_input_queue item (None for login notices and invalid input)."""
+        nonlocal user_lang, user_name, login_user_data
 
         if not ENABLE_DRIVER_ASSIST:
             logging.info("Driver assist is disabled. Skipping processing.")
-            continue
+            return None
 
         if incoming_data is None:
             logging.warning("Received NoneType input. Skipping.")
-            continue
+            return None
 
         if not isinstance(incoming_data, str):
             logging.warning(f"Expected string input but got {type(incoming_data)}. Skipping.")
-            continue
+            return None
 
         # Try to parse the incoming JSON string
         try:
             parsed_data = json.loads(incoming_data)
         except json.JSONDecodeError:
             logging.warning(f"Failed to parse JSON: {incoming_data[:100]}")
-            continue
+            return None
 
         if parsed_data.get("type") == "login_notice":
             user_lang = parsed_data.get("lang") or "ja"  # デフォルト言語（例：日本語）
@@ -114,36 +125,91 @@ async def driver_assist_ai(
 
             if isinstance(user_lookup, dict):
                 login_user_data = user_lookup
-                logging.info(f"User data loaded for {user_name}: {json.dumps(login_user_data, ensure_ascii=False, indent=2)}")
+                logging.info("User data loaded for %s: %s", user_name, lazy_json(login_user_data))
             else:
                 logging.warning(f"User name {user_name} not found in dummy data.")
-            continue
+            return None
 
         # Validate Vehicle Status
         if not is_vehicle_status(parsed_data):
-            logging.warning(f"Invalid JSON structure: {json.dumps(parsed_data)[:100]}")
-            continue
-        else:
-            vehicle_status = parsed_data
-
-        if "user_data" not in vehicle_status or not vehicle_status["user_data"]:
-            logging.info("vehicle_status に user_data が無いため、login_user_data を補完します。")      
-            if not login_user_data:
-                logging.error("login_user_data が空です。補完される user_data がありません。")
-            else:
-                logging.info("login_user_data : %s", json.dumps(login_user_data, ensure_ascii=False, indent=2))
-            vehicle_status["user_data"] = login_user_data
-
-        # Generate AI suggestion bundle (contains multiple proposals)
-        proposal_result = await ai_generate_suggestions(vehicle_status)
-
-        # Check video_proposal layer for return_direct flag
-        try:
-            proposal_json = json.loads(proposal_result)          
-        except json.JSONDecodeError:
-            proposal_json = {}
-
-        await handle_proposal_json(proposal_json, user_lang, output_queue, send_output_chunk)
+            logging.warning("Invalid JSON structure: %s", lazy_json(parsed_data, limit=100))
+            return None
+        return parsed_data
+
+    # Latest wins: queued statuses are coalesced to the newest one, and a run whose status was
+    # superseded by a materially different one (a trigger fired) is cancelled, never delivered.
+    getter: asyncio.Future | None = None
+    running: asyncio.Task | None = None
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(ai_input_queue.get())
+            await asyncio.wait({getter, running} - {None}, return_when=asyncio.FIRST_COMPLETED)
+
+            if getter.done():
+                items = [getter.result()]
+                getter = None
+                while not ai_input_queue.empty():
+                    items.append(ai_input_queue.get_nowait())
+
+                vehicle_status = None
+                for incoming_data in items:
+                    # Check for stop signal
+                    if incoming_data == STOP_SIGNAL:
+                        logging.info("Stop signal received. Exiting driver_assist_ai loop.")
+                        return
+                    parsed_data = parse_input(incoming_data)
+                    if parsed_data is None:
+                        continue
+                    if vehicle_status is not None:
+                        DRIVER_ASSIST_SUPPRESSED.labels("coalesced").inc()
+                        # A forced run (demo action) is not lost by coalescing
+                        if not parsed_data.get("trigger") and vehicle_status.get("trigger"):
+                            parsed_data["trigger"] = vehicle_status["trigger"]
+                    vehicle_status = parsed_data
+
+                if vehicle_status is not None:
+                    features = telemetry.features() if telemetry is not None else {}
+                    fired = triggers.evaluate(vehicle_status.get("vehicle_data") or {},
+                                              forced=vehicle_status.pop("trigger", None), features=features)
+                    if not fired:
+                        logging.info("No driver assist trigger fired. Skipping.")
+                    else:
+                        logging.info(f"Driver assist triggered by {', '.join(fired)}")
+                        if running is not None:
+                            # The proposal would be for a superseded situation
+                            DRIVER_ASSIST_SUPERSEDED.labels("finished" if running.done() else "in_flight").inc()
+                            running.cancel()
+                            logging.info("Cancelled driver assist run of a superseded vehicle status.")
+
+                        if "user_data" not in vehicle_status or not vehicle_status["user_data"]:
+                            logging.info("vehicle_status に user_data が無いため、login_user_data を補完します。")
+                            if not login_user_data:
+                                logging.error("login_user_data が空です。補完される user_data がありません。")
+                            else:
+                                logging.info("login_user_data : %s", lazy_json(login_user_data))
+                            vehicle_status["user_data"] = login_user_data
+                        if features:
+                            vehicle_status["trends"] = {name: round(value, 3) for name, value in features.items()}
+
+                        # Generate AI suggestion bundle (contains multiple proposals)
+                        running = asyncio.create_task(ai_generate_suggestions(vehicle_status))
+
+            if running is not None and running.done():
+                proposal_result = running.result()
+                running = None
+
+                # Check video_proposal layer for return_direct flag
+                try:
+                    proposal_json = json.loads(proposal_result)
+                except json.JSONDecodeError:
+                    proposal_json = {}
+
+                await handle_proposal_json(proposal_json, user_lang, output_queue, send_output_chunk)
+    finally:
+        for task in (getter, running):
+            if task is not None:
+                task.cancel()
 
 
 def select_highest_priority_proposal(proposal_json: dict, priority_table: dict) -> tuple[str, dict] | None:
@@ -197,13 +263,12 @@ async def handle_proposal_json(
         return
 
     proposal_key, proposal_data = proposal_entry
-    logging.info("選択された提案: %s", json.dumps(proposal_data, ensure_ascii=False, indent=2))
+    logging.info("選択された提案: %s", lazy_json(proposal_data))
 
     # check return_direct proposals and send them directly to the client
     if proposal_data.get("return_direct", True):
         proposal_to_client = json.dumps(proposal_data, ensure_ascii=False, indent=2)
         logging.info("%s は return_direct フラグ付きのため、クライアントに直接送信します.", proposal_data["type"])
-        logging.info("%s", proposal_to_client)
         await send_output_chunk(proposal_to_client)
 
     # special logic for each proposal type
@@ -236,6 +301,9 @@ async def handle_proposal_json(
     if "proposal_ev_charge" == proposal_key:
         proposal = proposal_json["proposal_ev_charge"]
         logging.info("EV充電提案を検出しました。")
+        # Fixed preamble rendered locally (realtime_messages) and spoken in the same response as the
+        # explanation: a separate phrase would be played before it (cache hit) or interleave with it
+        preamble, _ = render("proposal.ev_charge.preamble", user_lang)
         summary_for_ai = f"""
             You are an in-vehicle AI assistant in an electric vehicle (EV).
             The following "reason" is an internal explanation for why the AI decided to suggest EV charging to the driver.
@@ -250,18 +318,13 @@ async def handle_proposal_json(
             "reason": "{{proposal['reason']}}"
 
             ### Example Output:
-            - Your battery is running low, so it's a good time to charge. I'll show you the nearest EV charging station.
-            - You might not have enough charge to reach your destination safely. I'll show you the nearest EV charging station.
+            - Your battery is running low, so it's a good time to charge.
+            - You might not have enough charge to reach your destination safely.
 
             # ABSOLUTE RULE
             Respond in the language specified by '{user_lang}'.
-        """
-        await output_queue.put(text_to_realtime_api_json_as_role("user", summary_for_ai))
-        summary_for_ai = f"""
-            Repeat the following sentence exactly as it is, without adding or changing anything:
-            Let me show you nearby EV charging stations.
-            # ABSOLUTE RULE
-            Respond in the language specified by '{user_lang}'.
+            End your answer with the following sentence, word for word (translate it only if it is not in '{user_lang}'):
+            {preamble}
         """
         await output_queue.put(text_to_realtime_api_json_as_role("user", summary_for_ai))
         return
@@ -0,0 +1,176 @@
+"""
+Filler audio while the supervisor works
+
+A tool-routed turn is silent until SupervisorTool has run the whole
+supervisor -> worker -> tool chain and the realtime model speaks the result.
+With FILLER_AUDIO=1, a short acknowledgement ("少々お待ちください") is streamed to
+the client as response.audio.delta events as soon as the function call to the
+supervisor is complete. It is taken from a precomputed PCM cache (PCM16 mono
+24 kHz, the realtime API output format), so it costs no model call.
+
+When the real answer starts, the filler stops and the client is told to drop
+the filler audio it has buffered (output_audio_buffer.clear), so the answer is
+never queued behind it.
+
+Settings (environment variables):
+- FILLER_AUDIO: "1" enables the filler (default off)
+- FILLER_DIR: directory of the <lang>.pcm files (default "dummy_data/filler_audio")
+- FILLER_TOOLS: comma separated tools that trigger the filler (default "supervisor")
+
+Generate the cache (OpenAI text-to-speech, needs OPENAI_API_KEY):
+    python realtime_filler.py --lang ja --lang en
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Coroutine
+
+from realtime_metrics import FILLER_PLAYED, SPEECH_TO_FIRST_AUDIO_SECONDS
+
+ENABLED = os.environ.get("FILLER_AUDIO", "0") == "1"
+FILLER_DIR = os.environ.get("FILLER_DIR", os.path.join(os.path.dirname(__file__), "dummy_data", "filler_audio"))
+FILLER_TOOLS = {t.strip() for t in os.environ.get("FILLER_TOOLS", "supervisor").split(",") if t.strip()}
+
+PHRASES = {
+    "ja": "少々お待ちください。",
+    "en": "One moment, please.",
+}
+VOICE = "sage"
+SAMPLE_RATE = 24000
+BYTES_PER_SEC = SAMPLE_RATE * 2
+# 100 ms per delta; the client is kept at most LEAD_SEC ahead so a cancel drops little audio
+CHUNK_BYTES = BYTES_PER_SEC // 10
+LEAD_SEC = 0.3
+
+CLEAR_EVENT = json.dumps({"type": "output_audio_buffer.clear", "response_id": "filler"})
+
+_pcm_cache: dict[str, bytes | None] = {}
+
+
+def load_filler(lang: str) -> bytes | None:
+    """PCM of the filler phrase of lang (loaded once per process), None if not generated."""
+    if lang not in _pcm_cache:
+        path = os.path.join(FILLER_DIR, f"{lang}.pcm")
+        try:
+            with open(path, "rb") as f:
+                _pcm_cache[lang] = f.read()
+        except FileNotFoundError:
+            logging.warning(f"No filler audio for {lang} ({path}); run realtime_filler.py --lang {lang}")
+            _pcm_cache[lang] = None
+    return _pcm_cache[lang]
+
+
+def audio_delta_events(pcm: bytes, response_id: str) -> list[str]:
+    """response.audio.delta events (as sent to the client) carrying pcm in 100 ms chunks."""
+    return [
+        json.dumps({
+            "type": "response.audio.delta",
+            "response_id": response_id,
+            "item_id": response_id,
+            "delta": base64.b64encode(pcm[offset:offset + CHUNK_BYTES]).decode("ascii"),
+        })
+        for offset in range(0, len(pcm), CHUNK_BYTES)
+    ]
+
+
+async def stream_audio(send: Callable[[str], Coroutine[Any, Any, None]], events: list[str],
+                       on_first: Callable[[], None] | None = None) -> None:
+    """Send audio delta events paced at real time, LEAD_SEC ahead of the client's playback."""
+    started = time.perf_counter()
+    for index, event in enumerate(events):
+        ahead = index * 0.1 - (time.perf_counter() - started)
+        if ahead > LEAD_SEC:
+            await asyncio.sleep(ahead - LEAD_SEC)
+        await send(event)
+        if index == 0 and on_first is not None:
+            on_first()
+
+
+class FillerPlayer:
+    """Plays the filler of one session; at most one filler at a time."""
+
+    def __init__(self, lang: str) -> None:
+        self.lang = lang
+        self._task: asyncio.Task | None = None
+        self._send: Callable[[str], Coroutine[Any, Any, None]] | None = None
+        self._heard = False
+
+    def start(self, tool_name: str, send: Callable[[str], Coroutine[Any, Any, None]],
+              turn_started_at: float | None) -> None:
+        """Start the filler for a call to tool_name (no-op if disabled, playing or not generated)."""
+        if not ENABLED or tool_name not in FILLER_TOOLS or (self._task is not None and not self._task.done()):
+            return
+        pcm = load_filler(self.lang)
+        if not pcm:
+            return
+
+        def on_first() -> None:
+            self._heard = True
+            FILLER_PLAYED.labels(self.lang).inc()
+            if turn_started_at is not None:
+                SPEECH_TO_FIRST_AUDIO_SECONDS.observe(time.perf_counter() - turn_started_at)
+
+        self._send = send
+        self._heard = False
+        self._task = asyncio.create_task(stream_audio(send, audio_delta_events(pcm, "filler"), on_first))
+
+    async def stop(self) -> bool:
+        """Stop the filler; returns whether any filler audio reached the client in this turn."""
+        heard, self._heard = self._heard, False
+        task, self._task = self._task, None
+        if task is None:
+            return heard
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            if heard and self._send is not None:
+                await self._send(CLEAR_EVENT)
+        return heard
+
+
+@asynccontextmanager
+async def filler_audio(lang: str) -> AsyncIterator[FillerPlayer]:
+    """FillerPlayer of a session, stopped when the session ends."""
+    player = FillerPlayer(lang)
+    try:
+        yield player
+    finally:
+        task = player._task
+        if task is not None and not task.done():
+            task.cancel()
+
+
+def generate(lang: str, model: str) -> str:
+    """Synthesize the filler phrase of lang into FILLER_DIR/<lang>.pcm."""
+    import openai
+
+    response = openai.OpenAI().audio.speech.create(
+        model=model, voice=VOICE, input=PHRASES[lang], response_format="pcm")
+    os.makedirs(FILLER_DIR, exist_ok=True)
+    path = os.path.join(FILLER_DIR, f"{lang}.pcm")
+    with open(path, "wb") as f:
+        f.write(response.content)
+    return path
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate the filler audio cache")
+    parser.add_argument("--lang", action="append", choices=sorted(PHRASES), help="default: all languages")
+    parser.add_argument("--model", default="gpt-4o-mini-tts")
+    args = parser.parse_args(argv)
+    for lang in args.lang or sorted(PHRASES):
+        path = generate(lang, args.model)
+        print(f"{lang}: {path} ({os.path.getsize(path) / BYTES_PER_SEC:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Load generator for realtime_app.py
+
+Opens N /ws clients, streams PCM16 24kHz mono audio at real-time pace as
+input_audio_buffer.append events, optionally triggers demo_actions, and measures
+the turn latency: last audio chunk sent -> first response.audio.delta received.
+
+Usage (against the mock realtime API, see realtime_mock_server.py):
+    uv run python realtime_loadgen.py --clients 50 --turns 5 --server-pid <pid of realtime_app.py>
+
+Options:
+    --url          /ws endpoint (default ws://localhost:3000/ws)
+    --token        AUTH_TOKEN (default: $AUTH_TOKEN)
+    --clients      number of concurrent sessions
+    --turns        turns per session
+    --pcm          raw PCM16 24kHz mono file to stream (default: 1.5 s synthetic tone)
+    --demo-action  demo_action sent once per session (e.g. start_ev_charge)
+    --server-pid   pid of the server process, for CPU and memory per session (Linux /proc)
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import statistics
+import struct
+import time
+import uuid
+
+import websockets
+
+SAMPLE_RATE = 24000
+CHUNK_MS = 100
+CHUNK_BYTES = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+
+
+def synthetic_pcm(seconds: float = 1.5, frequency: float = 220.0) -> bytes:
+    samples = int(SAMPLE_RATE * seconds)
+    return struct.pack(
+        f"<{samples}h",
+        *(int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)) for i in range(samples)),
+    )
+
+
+def pcm_chunks(pcm: bytes) -> list[str]:
+    return [base64.b64encode(pcm[i:i + CHUNK_BYTES]).decode() for i in range(0, len(pcm), CHUNK_BYTES)]
+
+
+class ProcessSampler:
+    """CPU time and RSS of the server process from /proc (Linux only)."""
+
+    def __init__(self, pid: int | None) -> None:
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def cpu_seconds(self) -> float | None:
+        if not self.pid:
+            return None
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 (1-based), i.e. 11 and 12 after the command name
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self) -> int | None:
+        if not self.pid:
+            return None
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return None
+
+
+async def run_client(args, chunks: list[str], latencies: list[float], errors: list[str], connected: asyncio.Event,
+                     ready_count: list[int]) -> None:
+    client_id = f"loadgen-{uuid.uuid4().hex[:8]}"
+    url = f"{args.url}?client_id={client_id}&token={args.token}"
+    try:
+        async with websockets.connect(url, max_size=None) as websocket:
+            first_audio: asyncio.Future | None = None
+            last_audio_at = time.perf_counter()
+
+            async def receiver() -> None:
+                nonlocal last_audio_at
+                async for raw in websocket:
+                    if isinstance(raw, str) and raw.startswith('{"type": "response.audio.delta"'):
+                        last_audio_at = time.perf_counter()
+                        if first_audio is not None and not first_audio.done():
+                            first_audio.set_result(last_audio_at)
+
+            receive_task = asyncio.create_task(receiver())
+            ready_count[0] += 1
+            if ready_count[0] >= args.clients:
+                connected.set()
+            await connected.wait()
+
+            if args.demo_action:
+                await websocket.send(json.dumps({"type": "demo_action", "action": args.demo_action, "target_id": client_id}))
+
+            for _ in range(args.turns):
+                first_audio = asyncio.get_running_loop().create_future()
+                for chunk in chunks:
+                    await websocket.send(json.dumps({"type": "input_audio_buffer.append", "audio": chunk}))
+                    await asyncio.sleep(CHUNK_MS / 1000)
+                speech_end = time.perf_counter()
+                try:
+                    answered_at = await asyncio.wait_for(first_audio, timeout=args.turn_timeout)
+                    latencies.append(answered_at - speech_end)
+                except asyncio.TimeoutError:
+                    errors.append("turn timeout")
+                    continue
+                # Wait until the answer finished playing (no audio for a while)
+                while time.perf_counter() - last_audio_at < args.answer_gap:
+                    await asyncio.sleep(args.answer_gap / 2)
+
+            receive_task.cancel()
+    except Exception as e:
+        errors.append(repr(e))
+        ready_count[0] += 1
+        if ready_count[0] >= args.clients:
+            connected.set()
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def main(args) -> None:
+    pcm = open(args.pcm, "rb").read() if args.pcm else synthetic_pcm()
+    chunks = pcm_chunks(pcm)
+    sampler = ProcessSampler(args.server_pid)
+
+    rss_before = sampler.rss_bytes()
+    cpu_before = sampler.cpu_seconds()
+    started = time.perf_counter()
+
+    latencies: list[float] = []
+    errors: list[str] = []
+    connected = asyncio.Event()
+    ready_count = [0]
+    clients = []
+    for _ in range(args.clients):
+        clients.append(asyncio.create_task(run_client(args, chunks, latencies, errors, connected, ready_count)))
+        await asyncio.sleep(args.ramp / max(1, args.clients))
+    await connected.wait()
+    rss_loaded = sampler.rss_bytes()
+    await asyncio.gather(*clients)
+
+    wall = time.perf_counter() - started
+    cpu_after = sampler.cpu_seconds()
+
+    report = {
+        "clients": args.clients,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall_sec": round(wall, 1),
+    }
+    if latencies:
+        report.update({
+            "turn_latency_p50_ms": round(percentile(latencies, 50) * 1000),
+            "turn_latency_p95_ms": round(percentile(latencies, 95) * 1000),
+            "turn_latency_p99_ms": round(percentile(latencies, 99) * 1000),
+            "turn_latency_mean_ms": round(statistics.mean(latencies) * 1000),
+        })
+    if cpu_before is not None and cpu_after is not None:
+        cores_used = (cpu_after - cpu_before) / wall
+        report["server_cores_used"] = round(cores_used, 3)
+        report["sessions_per_core"] = round(args.clients / cores_used, 1) if cores_used > 0 else None
+    if rss_before is not None and rss_loaded is not None:
+        report["memory_per_session_kb"] = round((rss_loaded - rss_before) / args.clients / 1024)
+    print(json.dumps(report, indent=2))
+    if errors:
+        print("First errors:", errors[:5])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for realtime_app.py")
+    parser.add_argument("--url", default="ws://localhost:3000/ws")
+    parser.add_argument("--token", default=os.environ.get("AUTH_TOKEN", ""))
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--pcm", default=None)
+    parser.add_argument("--demo-action", default=None)
+    parser.add_argument("--server-pid", type=int, default=None)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds to open all clients")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--answer-gap", type=float, default=1.0, help="silence that ends an answer (seconds)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,197 @@
+"""
+Logging helpers for the realtime hot path
+
+- lazy_json(): payloads are serialized only if the record is actually emitted,
+  and truncated to LOG_PAYLOAD_LIMIT characters.
+- log_event(): per-event-type sampling (e.g. only 1 of 100 mic chunks) before
+  any formatting happens.
+- setup_logging(): records are handed to a background thread through a queue,
+  so formatting and writing never block the event loop.
+
+Settings (environment variables):
+- LOG_LEVEL: root log level (default INFO)
+- LOG_FORMAT: "text" (default) or "json" (one JSON object per line)
+- LOG_PAYLOAD_LIMIT: max characters of a logged payload (default 1000, 0 = unlimited)
+- LOG_SAMPLE_RATES: per-event sampling, e.g. "input_mic=0.01,vehicle_status=0.1"
+  (rate 1 logs everything, 0 nothing; unlisted events are not sampled)
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Any
+
+TEXT_FORMAT = "[%(asctime)s] [%(process)d] [%(levelname)s] [%(filename)s:%(lineno)d %(funcName)s] [%(message)s]"
+
+DEFAULT_SAMPLE_RATES = {
+    "input_mic": 0.01,      # microphone chunks from the client
+    "output_chunk": 0.01,   # audio deltas relayed to the client
+}
+
+
+def _parse_sample_rates(spec: str) -> dict[str, float]:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            rates[key.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            logging.error(f"Invalid LOG_SAMPLE_RATES entry: {item}")
+    return rates
+
+
+PAYLOAD_LIMIT = int(os.environ.get("LOG_PAYLOAD_LIMIT", "1000"))
+SAMPLE_RATES = _parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", ""))
+
+
+# Container levels copied by LazyJson.snapshot() (the callers mutate event dicts near the top level)
+SNAPSHOT_DEPTH = 2
+
+
+def _snapshot(value: Any, depth: int) -> Any:
+    if depth <= 0:
+        return value
+    if isinstance(value, dict):
+        return {key: _snapshot(item, depth - 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_snapshot(item, depth - 1) for item in value]
+    return value
+
+
+class LazyJson:
+    """Serializes payload to (truncated) JSON only when str() is called by a handler."""
+
+    __slots__ = ("payload", "limit", "indent")
+
+    def __init__(self, payload: Any, limit: int = PAYLOAD_LIMIT, indent: int | None = None) -> None:
+        self.payload = payload
+        self.limit = limit
+        self.indent = indent
+
+    def snapshot(self) -> "LazyJson":
+        """Copy whose payload no longer changes when the caller mutates its dicts afterwards."""
+        return LazyJson(_snapshot(self.payload, SNAPSHOT_DEPTH), self.limit, self.indent)
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self.payload, ensure_ascii=False, indent=self.indent, default=str)
+        except Exception:
+            # Logging must never raise in the listener thread
+            try:
+                text = repr(self.payload)
+            except Exception as e:
+                text = f"<unserializable payload: {e!r}>"
+        if self.limit and len(text) > self.limit:
+            return f"{text[:self.limit]}...(+{len(text) - self.limit} chars)"
+        return text
+
+
+def lazy_json(payload: Any, limit: int = PAYLOAD_LIMIT, indent: int | None = None) -> LazyJson:
+    return LazyJson(payload, limit, indent)
+
+
+class _Sampler:
+    """Deterministic 1-in-N sampling per event type (no random numbers on the hot path)."""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        self.every = {
+            event: (0 if rate <= 0 else max(1, round(1 / rate)))
+            for event, rate in rates.items()
+        }
+        self.counters: dict[str, itertools.count] = {}
+
+    def should_log(self, event_type: str) -> bool:
+        every = self.every.get(event_type, 1)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        counter = self.counters.get(event_type)
+        if counter is None:
+            counter = self.counters.setdefault(event_type, itertools.count())
+        return next(counter) % every == 0
+
+
+_sampler = _Sampler(SAMPLE_RATES)
+
+
+def log_event(event_type: str, msg: str, *args: Any, level: int = logging.INFO) -> None:
+    """
+    Log msg % args under event_type, honoring the level and the sampling rate
+    before anything is formatted. Use lazy_json() for payload arguments.
+    """
+    logger = logging.getLogger()
+    if not logger.isEnabledFor(level) or not _sampler.should_log(event_type):
+        return
+    logger.log(level, msg, *args, stacklevel=2, extra={"event": event_type})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "process": record.process,
+            "file": f"{record.filename}:{record.lineno}",
+            "func": record.funcName,
+            "event": getattr(record, "event", None),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that does NOT format in the calling thread.
+    Message arguments (e.g. LazyJson) are rendered by the listener thread, from a
+    snapshot taken here: the caller may mutate the payload right after logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, tuple) and any(isinstance(arg, LazyJson) for arg in record.args):
+            record.args = tuple(arg.snapshot() if isinstance(arg, LazyJson) else arg for arg in record.args)
+        if record.exc_info:
+            # Traceback objects must be rendered before the frames go away
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(level: int | str | None = None) -> None:
+    """Route all log records through a queue to a background writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    stream_handler = logging.StreamHandler()
+    if os.environ.get("LOG_FORMAT", "text") == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
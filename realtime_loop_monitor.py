@@ -0,0 +1,159 @@
+"""
+Event-loop lag watchdog
+
+Each watched loop runs a tiny heartbeat coroutine that measures how late its
+sleep wakes up (loop lag). A separate watchdog thread checks the heartbeats;
+when one is older than the threshold, the loop thread is blocked, so the
+watchdog captures the loop thread's current stack with sys._current_frames().
+
+Stalls are aggregated by call site (the innermost frame in this project plus
+the innermost frame overall, e.g. "function_weather.py:18 get_weather_info ->
+requests/sessions.py:...") and exposed via report() and the metrics surface.
+
+Settings (environment variables):
+- LOOP_MONITOR: "0" disables the watchdog (default enabled)
+- LOOP_LAG_INTERVAL_MS: heartbeat period (default 50)
+- LOOP_LAG_THRESHOLD_MS: lag that counts as a stall (default 200)
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+
+from realtime_metrics import LOOP_LAG_SECONDS, LOOP_STALL_SECONDS, LOOP_STALLS
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_project_frame(filename: str) -> bool:
+    return (
+        filename.startswith(PROJECT_DIR)
+        and "site-packages" not in filename
+        and os.sep + ".venv" + os.sep not in filename
+        and filename != __file__
+    )
+
+
+def _call_site(frame: FrameType) -> str:
+    """'<innermost project frame> -> <innermost frame>' for a blocked thread."""
+    innermost = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+    current: FrameType | None = frame
+    while current is not None:
+        filename = current.f_code.co_filename
+        if _is_project_frame(filename):
+            site = f"{os.path.relpath(filename, PROJECT_DIR)}:{current.f_lineno} {current.f_code.co_name}"
+            return site if current is frame else f"{site} -> {innermost}"
+        current = current.f_back
+    return innermost
+
+
+class _WatchedLoop:
+    def __init__(self, name: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.name = name
+        self.loop = loop
+        self.thread_id: int | None = None
+        self.last_beat = time.monotonic()
+        self.stall_site: str | None = None
+        self.stall_started = 0.0
+        self.task: asyncio.Task | None = None
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.05, threshold: float = 0.2) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._loops: list[_WatchedLoop] = []
+        self._sites: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls) -> "LoopWatchdog | None":
+        if os.environ.get("LOOP_MONITOR", "1") == "0":
+            return None
+        return cls(
+            interval=float(os.environ.get("LOOP_LAG_INTERVAL_MS", "50")) / 1000,
+            threshold=float(os.environ.get("LOOP_LAG_THRESHOLD_MS", "200")) / 1000,
+        )
+
+    async def _heartbeat(self, watched: _WatchedLoop) -> None:
+        watched.thread_id = threading.get_ident()
+        lag_histogram = LOOP_LAG_SECONDS.labels(watched.name)
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_histogram.observe(max(0.0, now - before - self.interval))
+            watched.last_beat = now
+            if watched.stall_site is not None:
+                self._end_stall(watched, now)
+
+    def watch(self, loop: asyncio.AbstractEventLoop, name: str) -> None:
+        """Start the heartbeat on loop (may belong to another thread)."""
+        watched = _WatchedLoop(name, loop)
+        self._loops.append(watched)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is running:
+            watched.task = loop.create_task(self._heartbeat(watched))
+        else:
+            asyncio.run_coroutine_threadsafe(self._heartbeat(watched), loop)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        for watched in self._loops:
+            if watched.task is not None:
+                watched.task.cancel()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            now = time.monotonic()
+            for watched in self._loops:
+                if watched.stall_site is None and watched.thread_id is not None \
+                        and now - watched.last_beat > self.interval + self.threshold:
+                    self._capture(watched, now)
+
+    def _capture(self, watched: _WatchedLoop, now: float) -> None:
+        frame = sys._current_frames().get(watched.thread_id)
+        if frame is None:
+            return
+        site = _call_site(frame)
+        stack = "".join(traceback.format_stack(frame))
+        watched.stall_site = site
+        watched.stall_started = watched.last_beat + self.interval
+        with self._lock:
+            entry = self._sites.setdefault(site, {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            entry["count"] += 1
+            entry["loop"] = watched.name
+            entry["stack"] = stack
+        LOOP_STALLS.labels(site).inc()
+        logging.warning(f"Event loop '{watched.name}' blocked at {site}")
+
+    def _end_stall(self, watched: _WatchedLoop, now: float) -> None:
+        duration = max(0.0, now - watched.stall_started)
+        site = watched.stall_site
+        watched.stall_site = None
+        with self._lock:
+            entry = self._sites[site]
+            entry["total_sec"] += duration
+            entry["max_sec"] = max(entry["max_sec"], duration)
+        LOOP_STALL_SECONDS.labels(site).inc(duration)
+
+    def report(self) -> list[dict]:
+        """Blocking call sites, worst first."""
+        with self._lock:
+            entries = [{"site": site, **entry} for site, entry in self._sites.items()]
+        return sorted(entries, key=lambda e: e["total_sec"], reverse=True)
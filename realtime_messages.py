@@ -0,0 +1,69 @@
+"""
+Message catalog of fixed spoken notifications
+
+System notifications (demo mode changes, proposal preambles) are rendered
+locally in the user's language and the voice agent only speaks the result
+verbatim (or plays its cached audio, see realtime_tts_cache.py), instead of
+asking the realtime model to translate and paraphrase an English prompt.
+Proposal preambles are appended verbatim to the explanation the model speaks,
+so both are one response.
+
+Templates use str.format fields. The catalog is checked when the module is
+imported: every language of a message must use the same fields. Languages
+missing from a message fall back to English, and the model is asked to speak
+it in the requested language.
+"""
+
+import string
+
+DEFAULT_LANG = "en"
+
+MESSAGES: dict[str, dict[str, str]] = {
+    "demo.autonomous": {
+        "ja": "自動運転モードになりました。",
+        "en": "The car is now in autonomous driving mode.",
+    },
+    "demo.ev_charge": {
+        "ja": "EV充電モードになりました。",
+        "en": "The car is now in EV charging mode.",
+    },
+    "demo.battery_low": {
+        "ja": "バッテリー残量が少なくなっています。",
+        "en": "The car's battery level is low.",
+    },
+    "proposal.ev_charge.preamble": {
+        "ja": "近くのEV充電スタンドをご案内します。",
+        "en": "Let me show you nearby EV charging stations.",
+    },
+}
+
+
+def _fields(template: str) -> set[str]:
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+def _compile(messages: dict[str, dict[str, str]]) -> dict[str, dict[str, tuple[str, frozenset[str]]]]:
+    compiled = {}
+    for key, by_lang in messages.items():
+        if DEFAULT_LANG not in by_lang:
+            raise ValueError(f"message {key} has no {DEFAULT_LANG} text")
+        expected = _fields(by_lang[DEFAULT_LANG])
+        for lang, template in by_lang.items():
+            if _fields(template) != expected:
+                raise ValueError(f"message {key} ({lang}) uses fields {_fields(template)}, expected {expected}")
+        compiled[key] = {lang: (template, frozenset(expected)) for lang, template in by_lang.items()}
+    return compiled
+
+
+_CATALOG = _compile(MESSAGES)
+
+
+def render(key: str, lang: str, **params) -> tuple[str, str]:
+    """Text of message key in lang, and the language it is written in (DEFAULT_LANG if lang is missing)."""
+    by_lang = _CATALOG[key]
+    text_lang = lang if lang in by_lang else DEFAULT_LANG
+    template, fields = by_lang[text_lang]
+    missing = fields - params.keys()
+    if missing:
+        raise KeyError(f"message {key} needs {sorted(missing)}")
+    return template.format(**params), text_lang
@@ -0,0 +1,311 @@
+"""
+Prometheus-compatible metrics for realtime_app.py
+
+Counters and histograms are recorded into per-thread cells: the hot path only
+adds to a list owned by the current thread (no lock, no contention between
+shard loops), and the cells are summed when /metrics is scraped.
+Gauges are evaluated by callbacks at scrape time.
+
+Usage:
+    from realtime_metrics import TOOL_SECONDS
+    with TOOL_SECONDS.labels("supervisor").time():
+        ...
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds (LLM turns are slow, WebSocket sends are fast)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: list["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+class _Cells:
+    """Per-thread float cells. Writers touch only their own thread's list."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._local = threading.local()
+        self._all: list[list[float]] = []
+        self._lock = threading.Lock()
+
+    def local(self) -> list[float]:
+        cells = getattr(self._local, "cells", None)
+        if cells is None:
+            cells = [0.0] * self._size
+            with self._lock:  # once per thread
+                self._all.append(cells)
+            self._local.cells = cells
+        return cells
+
+    def snapshot(self) -> list[float]:
+        with self._lock:
+            all_cells = list(self._all)
+        totals = [0.0] * self._size
+        for cells in all_cells:
+            for i, value in enumerate(cells):
+                totals[i] += value
+        return totals
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues: str):
+        key = tuple(str(v) for v in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_str(self, labelvalues: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labelvalues)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, child in list(self._children.items()):
+            lines.extend(self._render_child(labelvalues, child))
+        return lines
+
+    def _render_child(self, labelvalues, child) -> list[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    def __init__(self) -> None:
+        self._cells = _Cells(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._cells.local()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.snapshot()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, labelvalues, child) -> list[str]:
+        return [f"{self.name}{self._label_str(labelvalues)} {_fmt(child.value())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self._buckets = buckets
+        # one cell per bucket + "+Inf", then sum and count
+        self._cells = _Cells(len(buckets) + 3)
+
+    def observe(self, value: float) -> None:
+        cells = self._cells.local()
+        cells[bisect_left(self._buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> tuple[list[float], float, float]:
+        cells = self._cells.snapshot()
+        return cells[:-2], cells[-2], cells[-1]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, labelvalues, child) -> list[str]:
+        bucket_counts, total, count = child.snapshot()
+        lines = []
+        cumulative = 0.0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else _fmt(bound)
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{self._label_str(labelvalues, le_label)} {_fmt(cumulative)}")
+        lines.append(f"{self.name}_sum{self._label_str(labelvalues)} {_fmt(total)}")
+        lines.append(f"{self.name}_count{self._label_str(labelvalues)} {_fmt(count)}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge evaluated at scrape time. callback returns a value, or {labelvalues: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 callback: Callable[[], float | dict[tuple[str, ...], float]] | None = None) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set_callback(self, callback: Callable[[], float | dict[tuple[str, ...], float]]) -> None:
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is None:
+            return lines
+        try:
+            values = self.callback()
+        except Exception:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in values.items():
+            lines.append(f"{self.name}{self._label_str(labelvalues)} {_fmt(value)}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: list[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#
+# Metrics of the realtime gateway
+#
+ACTIVE_SESSIONS = CallbackGauge(
+    "realtime_active_sessions", "Number of sessions in connected_clients", ("state",))
+QUEUE_DEPTH = CallbackGauge(
+    "realtime_queue_depth", "Items waiting in session queues (sum over sessions)", ("queue",))
+UPSTREAM_CONNECT_SECONDS = Histogram(
+    "realtime_upstream_connect_seconds", "Time to open the upstream realtime WebSocket")
+SPEECH_TO_ANSWER_AUDIO_SECONDS = Histogram(
+    "realtime_speech_to_answer_audio_seconds", "End of user speech to the first audio of the model's answer (filler excluded)")
+SPEECH_TO_FIRST_AUDIO_SECONDS = Histogram(
+    "realtime_speech_stopped_to_first_audio_seconds",
+    "Time from input_audio_buffer.speech_stopped to the first response.audio.delta")
+TOOL_SECONDS = Histogram(
+    "realtime_tool_seconds", "Tool execution time requested by the realtime model", ("tool",))
+SUPERVISOR_AGENT_SECONDS = Histogram(
+    "supervisor_agent_seconds", "Time spent in each supervisor graph node (supervisor or worker agent)", ("agent",))
+DRIVER_ASSIST_RUN_AGENT_SECONDS = Histogram(
+    "driver_assist_run_agent_seconds", "Duration of AgentDriverAssistAI.run_agent")
+DRIVER_ASSIST_TIMEOUTS = Counter(
+    "driver_assist_run_agent_timeouts_total", "run_agent calls that exceeded run_agent_timeout")
+WS_SEND_SECONDS = Histogram(
+    "realtime_ws_send_seconds", "Time to send one message to the client WebSocket(s)")
+LOOP_LAG_SECONDS = Histogram(
+    "realtime_loop_lag_seconds", "Event loop wake-up delay measured by the heartbeat", ("loop",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = Counter(
+    "realtime_loop_stalls_total", "Event loop stalls above the threshold, by blocking call site", ("site",))
+LOOP_STALL_SECONDS = Counter(
+    "realtime_loop_stall_seconds_total", "Total blocked time of the event loop, by blocking call site", ("site",))
+HTTP_CLIENT_REQUESTS = Counter(
+    "http_client_requests_total", "Requests sent through the shared chat model HTTP pools", ("pool",))
+HTTP_CLIENT_CONNECTIONS_OPENED = Counter(
+    "http_client_connections_opened_total",
+    "New TCP connections opened by the shared chat model HTTP pools (requests minus this = reused)", ("pool",))
+HTTP_SESSION_POOL = CallbackGauge(
+    "http_session_pool_total", "Requests and opened connections of the shared requests Session", ("stat",))
+LLM_SCHEDULER_WAIT_SECONDS = Histogram(
+    "llm_scheduler_wait_seconds", "Time an LLM call waited for a slot", ("model", "priority"))
+LLM_SCHEDULER_SHED = Counter(
+    "llm_scheduler_shed_total", "LLM calls rejected by the scheduler", ("priority", "reason"))
+LLM_SCHEDULER_IN_FLIGHT = CallbackGauge(
+    "llm_scheduler_in_flight", "LLM calls holding a slot", ("model",))
+LLM_SCHEDULER_QUEUED = CallbackGauge(
+    "llm_scheduler_queued", "LLM calls waiting for a slot", ("model", "priority"))
+ADAPTIVE_LIMIT = CallbackGauge(
+    "llm_adaptive_background_limit", "AIMD cap of background LLM calls per model (absent = full cap)", ("model",))
+RATE_LIMIT_DECREASES = Counter(
+    "llm_rate_limit_decreases_total", "Multiplicative decreases of the background cap", ("model", "reason"))
+REALTIME_CONNECT_DELAY_SECONDS = Histogram(
+    "realtime_upstream_connect_delay_seconds", "Delay of new upstream connections under realtime rate limit pressure")
+LLM_HEDGES = Counter(
+    "llm_hedges_total", "Hedged LLM requests (outcome: sent, won, lost, budget_exhausted)", ("model", "outcome"))
+LLM_DEADLINE_EXCEEDED = Counter(
+    "llm_deadline_exceeded_total", "LLM calls not sent because the turn deadline had passed", ("model",))
+FILLER_PLAYED = Counter(
+    "realtime_filler_played_total", "Filler acknowledgements played while the supervisor works", ("lang",))
+PHRASE_CACHE_LOOKUPS = Counter(
+    "realtime_phrase_cache_lookups_total", "Phrase audio cache lookups", ("result",))
+PHRASE_CACHE_EVICTIONS = Counter(
+    "realtime_phrase_cache_evictions_total", "Phrases evicted from the audio cache (size bound)")
+PHRASE_CACHE_BYTES = CallbackGauge(
+    "realtime_phrase_cache_bytes", "PCM bytes held by the phrase audio cache")
+CONVERSATION_ITEMS_DELETED = Counter(
+    "realtime_conversation_items_deleted_total", "Upstream conversation items deleted by compaction", ("kind",))
+CONVERSATION_COMPACTIONS = Counter(
+    "realtime_conversation_compactions_total", "Old turns replaced by a summary item")
+VEHICLE_STATUS_FORWARDED = Counter(
+    "vehicle_status_forwarded_total",
+    "vehicle_status updates by what was forwarded (target: realtime, driver_assist)", ("target", "kind"))
+DRIVER_ASSIST_TRIGGERS = Counter(
+    "driver_assist_triggers_total", "Driver assist triggers matched by a vehicle status (outcome: fired, debounced)",
+    ("trigger", "outcome"))
+DRIVER_ASSIST_SUPPRESSED = Counter(
+    "driver_assist_suppressed_total", "Vehicle statuses that did not start a driver assist run", ("reason",))
+DRIVER_ASSIST_SUPERSEDED = Counter(
+    "driver_assist_superseded_total",
+    "Driver assist runs dropped because a materially different status arrived (state: in_flight, finished)",
+    ("state",))
+EV_RANGE_VERDICTS = Counter(
+    "ev_range_verdicts_total",
+    "Local EV range estimates by verdict (no_charge skips the ev_charge LLM call)", ("verdict",))
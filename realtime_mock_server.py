@@ -0,0 +1,215 @@
+"""
+Local stand-in for the OpenAI Realtime WebSocket API (for benchmarks without quota)
+
+Speaks the subset of the protocol used by langchain_openai_voice.aconnect:
+- session.update -> session.updated
+- input_audio_buffer.append: a turn starts with the first chunk and ends when
+  no chunk arrived for MOCK_VAD_SILENCE_MS (server VAD stand-in)
+  -> speech_started / speech_stopped / committed / transcription.completed
+- conversation.item.create (input_text / function_call_output) + response.create
+- Each user turn is answered with a scripted function call to the first tool
+  registered by session.update (usually "supervisor"); after the tool output
+  arrives, audio deltas (a 24kHz PCM16 tone) or a text response are streamed.
+- response.create with conversation "none" (out-of-band) is answered directly;
+  response metadata is echoed in response.created / response.done
+
+Start the mock and point the app at it:
+    uv run python realtime_mock_server.py            # ws://localhost:8765
+    OPENAI_REALTIME_URL=ws://localhost:8765 uv run python realtime_app.py
+
+Settings (environment variables):
+- MOCK_REALTIME_HOST / MOCK_REALTIME_PORT: listen address (default localhost / 8765)
+- MOCK_FIRST_EVENT_MS: model latency before the first response event (default 300)
+- MOCK_AUDIO_CHUNKS: audio deltas per answer (default 20, 100 ms each)
+- MOCK_CHUNK_INTERVAL_MS: pacing between audio deltas (default 50)
+- MOCK_VAD_SILENCE_MS: gap in appended audio that ends a turn (default 300)
+- MOCK_TOOL_CALLS: "0" answers directly instead of calling a tool (default 1).
+  Note that the app's supervisor tool calls the chat completions API.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import struct
+import uuid
+
+import websockets
+
+SAMPLE_RATE = 24000
+CHUNK_MS = 100
+
+FIRST_EVENT_SEC = float(os.environ.get("MOCK_FIRST_EVENT_MS", "300")) / 1000
+AUDIO_CHUNKS = int(os.environ.get("MOCK_AUDIO_CHUNKS", "20"))
+CHUNK_INTERVAL_SEC = float(os.environ.get("MOCK_CHUNK_INTERVAL_MS", "50")) / 1000
+VAD_SILENCE_SEC = float(os.environ.get("MOCK_VAD_SILENCE_MS", "300")) / 1000
+TOOL_CALLS = os.environ.get("MOCK_TOOL_CALLS", "1") != "0"
+
+ANSWER_TEXT = "これはモックサーバーからの応答です。"
+TRANSCRIPT_TEXT = "モックの音声入力です。"
+
+
+def _tone_chunk(frequency: float = 440.0, volume: float = 0.2) -> str:
+    """One CHUNK_MS chunk of a sine tone, base64 encoded PCM16 mono."""
+    samples = SAMPLE_RATE * CHUNK_MS // 1000
+    pcm = struct.pack(
+        f"<{samples}h",
+        *(int(32767 * volume * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)) for i in range(samples)),
+    )
+    return base64.b64encode(pcm).decode()
+
+
+AUDIO_CHUNK_B64 = _tone_chunk()
+
+
+def _event_id() -> str:
+    return f"event_{uuid.uuid4().hex[:12]}"
+
+
+class MockRealtimeSession:
+    """One upstream connection of the app (one car session)."""
+
+    def __init__(self, websocket) -> None:
+        self.websocket = websocket
+        self.tools: list[dict] = []
+        self.pending_text: str | None = None
+        self.pending_tool_output: str | None = None
+        self.speaking = False
+        self.vad_timer: asyncio.TimerHandle | None = None
+        self.response_task: asyncio.Task | None = None
+
+    async def send(self, event: dict) -> None:
+        event.setdefault("event_id", _event_id())
+        await self.websocket.send(json.dumps(event))
+
+    async def run(self) -> None:
+        await self.send({"type": "session.created", "session": {"id": f"sess_{uuid.uuid4().hex[:12]}"}})
+        async for raw in self.websocket:
+            try:
+                event = json.loads(raw)
+            except json.JSONDecodeError:
+                await self.send({"type": "error", "error": {"message": "invalid JSON"}})
+                continue
+            await self.handle(event)
+
+    async def handle(self, event: dict) -> None:
+        t = event.get("type")
+        if t == "session.update":
+            session = event.get("session", {})
+            self.tools = session.get("tools") or []
+            await self.send({"type": "session.updated", "session": session})
+
+        elif t == "input_audio_buffer.append":
+            if not self.speaking:
+                self.speaking = True
+                await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": 0})
+            if self.vad_timer is not None:
+                self.vad_timer.cancel()
+            loop = asyncio.get_running_loop()
+            self.vad_timer = loop.call_later(
+                VAD_SILENCE_SEC, lambda: asyncio.ensure_future(self.end_of_speech()))
+
+        elif t == "conversation.item.create":
+            item = event.get("item", {})
+            if item.get("type") == "function_call_output":
+                self.pending_tool_output = item.get("output", "")
+            elif item.get("role") == "user":
+                self.pending_text = "".join(
+                    c.get("text", "") for c in item.get("content", []) if c.get("type") == "input_text")
+            await self.send({"type": "conversation.item.created", "item": item})
+
+        elif t == "response.create":
+            response = event.get("response", {})
+            modalities = response.get("modalities", ["text", "audio"])
+            if response.get("conversation") == "none":
+                # Out-of-band response (e.g. read a text aloud): answers without using the conversation
+                self.start_response(self.answer(modalities, response.get("metadata")))
+            elif self.pending_tool_output is not None:
+                self.pending_tool_output = None
+                self.start_response(self.answer(modalities, response.get("metadata")))
+            elif self.pending_text is not None:
+                query, self.pending_text = self.pending_text, None
+                self.start_response(self.respond_to_user(query, modalities))
+
+        elif t == "response.cancel":
+            if self.response_task is not None:
+                self.response_task.cancel()
+
+    def start_response(self, coro) -> None:
+        if self.response_task is not None and not self.response_task.done():
+            self.response_task.cancel()
+        self.response_task = asyncio.create_task(coro)
+
+    async def end_of_speech(self) -> None:
+        self.speaking = False
+        self.vad_timer = None
+        item_id = f"item_{uuid.uuid4().hex[:12]}"
+        await self.send({"type": "input_audio_buffer.speech_stopped", "item_id": item_id})
+        await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+        await self.send({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "item_id": item_id,
+            "transcript": TRANSCRIPT_TEXT,
+        })
+        self.start_response(self.respond_to_user(TRANSCRIPT_TEXT, ["text", "audio"]))
+
+    async def respond_to_user(self, query: str, modalities: list[str]) -> None:
+        if not (TOOL_CALLS and self.tools):
+            await self.answer(modalities)
+            return
+        await asyncio.sleep(FIRST_EVENT_SEC)
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        tool = self.tools[0]
+        await self.send({"type": "response.created", "response": {"id": response_id}})
+        await self.send({
+            "type": "response.function_call_arguments.done",
+            "response_id": response_id,
+            "call_id": f"call_{uuid.uuid4().hex[:12]}",
+            "name": tool["name"],
+            "arguments": json.dumps({"query": query}, ensure_ascii=False),
+        })
+        await self.send({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+
+    async def answer(self, modalities: list[str], metadata: dict | None = None) -> None:
+        await asyncio.sleep(FIRST_EVENT_SEC)
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        await self.send({"type": "response.created", "response": {"id": response_id, "metadata": metadata}})
+        if "audio" in modalities:
+            for _ in range(AUDIO_CHUNKS):
+                await self.send({"type": "response.audio.delta", "response_id": response_id, "delta": AUDIO_CHUNK_B64})
+                await asyncio.sleep(CHUNK_INTERVAL_SEC)
+            await self.send({"type": "response.audio.done", "response_id": response_id})
+            await self.send({"type": "response.audio_transcript.done", "response_id": response_id, "transcript": ANSWER_TEXT})
+        else:
+            await self.send({"type": "response.text.done", "response_id": response_id, "text": ANSWER_TEXT})
+        await self.send({"type": "response.done",
+                         "response": {"id": response_id, "status": "completed", "metadata": metadata}})
+        await self.send({"type": "rate_limits.updated", "rate_limits": []})
+
+
+async def handle_connection(websocket) -> None:
+    logging.info(f"Mock realtime session connected: {websocket.remote_address}")
+    session = MockRealtimeSession(websocket)
+    try:
+        await session.run()
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        if session.response_task is not None:
+            session.response_task.cancel()
+        logging.info(f"Mock realtime session closed: {websocket.remote_address}")
+
+
+async def main() -> None:
+    host = os.environ.get("MOCK_REALTIME_HOST", "localhost")
+    port = int(os.environ.get("MOCK_REALTIME_PORT", "8765"))
+    async with websockets.serve(handle_connection, host, port, max_size=None):
+        logging.info(f"Mock realtime API listening on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
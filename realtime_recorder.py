@@ -0,0 +1,309 @@
+"""
+Session recorder and replayer for OpenAIVoiceReactAgent.aconnect
+
+Recording: every event of a session is appended to a gzip compressed JSONL file
+with a timestamp relative to the session start:
+    {"t": 1.234, "dir": "input_mic", "event": {...}}
+Directions: input_mic (from the client via the gateway), output_speaker (from
+the realtime API), tool_outputs, to_upstream (sent to the realtime API) and
+to_client (sent to the client). Audio appends and audio deltas that are
+forwarded verbatim are recorded only once (as input_mic / output_speaker).
+Events are serialized on the event loop and written by one background thread.
+
+Settings (environment variables):
+- RECORD_DIR: directory of the recordings (recording is disabled when unset)
+- RECORD_AUDIO: "inline" (default), "external" (raw PCM in a sidecar
+  <name>.audio file, events hold {"$audio": [offset, length]}) or "drop"
+
+Replay a recording (plain .jsonl fixtures work as well):
+    python realtime_recorder.py <file> --target upstream --url ws://localhost:8765
+    python realtime_recorder.py <file> --target gateway --url ws://localhost:3000/ws --token $AUTH_TOKEN
+    --speed 4 replays 4x faster, --speed 0 as fast as possible.
+
+- upstream: acts as the voice agent (sends to_upstream and audio events) against
+  the realtime API or realtime_mock_server.py
+- gateway: acts as the car client; sends the recorded microphone audio and user
+  text (as plain text, which the gateway wraps like the original input)
+"""
+
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
+
+RECORD_DIR = os.environ.get("RECORD_DIR")
+RECORD_AUDIO = os.environ.get("RECORD_AUDIO", "inline")
+
+# gap in the recorded microphone audio that ends a turn (replayer)
+AUDIO_GAP_SEC = 0.5
+
+# field holding base64 audio, by event type
+AUDIO_FIELDS = {
+    "input_audio_buffer.append": "audio",
+    "response.audio.delta": "delta",
+}
+
+
+class _Writer:
+    """One background thread writing the files of all recorders."""
+
+    def __init__(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def put(self, item: tuple) -> None:
+        self._queue.put(item)
+
+    def _run(self) -> None:
+        files: dict[str, Any] = {}
+        while True:
+            kind, path, payload = self._queue.get()
+            try:
+                if kind == "close":
+                    for key in (path, path + ".audio"):
+                        f = files.pop(key, None)
+                        if f is not None:
+                            f.close()
+                    continue
+                f = files.get(path)
+                if f is None:
+                    f = files[path] = gzip.open(path, "at", encoding="utf-8") if kind == "line" else open(path, "ab")
+                f.write(payload)
+            except Exception as e:
+                logging.error(f"Session recorder failed to write {path}: {e}")
+
+
+_writer: _Writer | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _Writer:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _Writer()
+        return _writer
+
+
+class SessionRecorder:
+    def __init__(self, path: str, audio_mode: str = "inline") -> None:
+        self.path = path
+        self.audio_path = path + ".audio"
+        self.audio_mode = audio_mode
+        self._audio_offset = 0
+        self._started = time.monotonic()
+        self._writer = _get_writer()
+
+    @classmethod
+    def from_env(cls, **header: Any) -> "SessionRecorder | None":
+        if not RECORD_DIR:
+            return None
+        os.makedirs(RECORD_DIR, exist_ok=True)
+        name = f"{datetime.now():%Y%m%d-%H%M%S}_{uuid.uuid4().hex[:8]}.jsonl.gz"
+        recorder = cls(os.path.join(RECORD_DIR, name), RECORD_AUDIO)
+        recorder.record("header", {"started_at": datetime.now().isoformat(), "audio": RECORD_AUDIO, **header})
+        logging.info(f"Recording session to {recorder.path}")
+        return recorder
+
+    def _externalize_audio(self, event: dict) -> dict:
+        field = AUDIO_FIELDS.get(event.get("type"))
+        if field is None or not isinstance(event.get(field), str):
+            return event
+        audio = base64.b64decode(event[field])
+        if self.audio_mode == "drop":
+            return {**event, field: {"$audio": None, "length": len(audio)}}
+        self._writer.put(("audio", self.audio_path, audio))
+        reference = {"$audio": [self._audio_offset, len(audio)]}
+        self._audio_offset += len(audio)
+        return {**event, field: reference}
+
+    def record(self, direction: str, event: Any) -> None:
+        if isinstance(event, dict) and self.audio_mode != "inline":
+            event = self._externalize_audio(event)
+        line = json.dumps(
+            {"t": round(time.monotonic() - self._started, 4), "dir": direction, "event": event},
+            ensure_ascii=False,
+            default=str,
+        )
+        self._writer.put(("line", self.path, line + "\n"))
+
+    def wrap_send(self, send: Callable[[Any], Awaitable[None]], direction: str) -> Callable[[Any], Awaitable[None]]:
+        """Record what send() sends, except audio that is already recorded on the way in."""
+
+        async def recording_send(event: Any) -> None:
+            if isinstance(event, dict):
+                if event.get("type") != "input_audio_buffer.append":
+                    self.record(direction, event)
+            elif not event.startswith('{"type": "response.audio.delta"'):
+                self.record(direction, event)
+            await send(event)
+
+        return recording_send
+
+    def close(self) -> None:
+        self._writer.put(("close", self.path, None))
+
+
+@asynccontextmanager
+async def recording(**header: Any) -> AsyncIterator[SessionRecorder | None]:
+    """Recorder of one session (None when recording is disabled), closed on exit."""
+    recorder = SessionRecorder.from_env(**header)
+    try:
+        yield recorder
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+#
+# Replayer
+#
+def load_recording(path: str) -> Iterator[dict]:
+    """Records of a recording, with externalized audio inlined again (dropped audio becomes silence)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    audio_file = open(path + ".audio", "rb") if os.path.exists(path + ".audio") else None
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                event = record.get("event")
+                field = AUDIO_FIELDS.get(event.get("type")) if isinstance(event, dict) else None
+                if field and isinstance(event.get(field), dict):
+                    reference = event[field]
+                    if reference.get("$audio") is not None and audio_file is not None:
+                        offset, length = reference["$audio"]
+                        audio_file.seek(offset)
+                        audio = audio_file.read(length)
+                    else:
+                        audio = bytes(reference.get("length") or (reference.get("$audio") or [0, 0])[1])
+                    event[field] = base64.b64encode(audio).decode()
+                yield record
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+
+def _is_user_text(event: dict) -> str | None:
+    item = event.get("item", {}) if event.get("type") == "conversation.item.create" else {}
+    if item.get("role") != "user":
+        return None
+    return "".join(c.get("text", "") for c in item.get("content", []) if c.get("type") == "input_text")
+
+
+def _to_send(record: dict, target: str) -> Any:
+    direction, event = record["dir"], record["event"]
+    if not isinstance(event, dict):
+        return None
+    if target == "upstream":
+        if direction == "to_upstream":
+            return event
+        if direction == "input_mic" and event.get("type") == "input_audio_buffer.append":
+            return event
+        return None
+    # gateway
+    if direction != "input_mic":
+        return None
+    if event.get("type") == "input_audio_buffer.append":
+        return event
+    return _is_user_text(event)
+
+
+async def replay(path: str, target: str, url: str, speed: float, token: str | None = None) -> dict:
+    import websockets
+
+    if target == "upstream":
+        headers = {"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}", "OpenAI-Beta": "realtime=v1"}
+        connection = websockets.connect(url, extra_headers=headers, max_size=None)
+    else:
+        separator = "&" if "?" in url else "?"
+        connection = websockets.connect(f"{url}{separator}client_id=replay-{uuid.uuid4().hex[:8]}&token={token}",
+                                        max_size=None)
+
+    latencies: list[float] = []
+    received = 0
+    # start of the turn being answered (perf_counter), None while idle
+    turn_started: float | None = None
+
+    async with connection as websocket:
+        async def receiver() -> None:
+            nonlocal received, turn_started
+            async for raw in websocket:
+                received += 1
+                if not isinstance(raw, str):
+                    continue
+                head = raw[:64]
+                if '"type": "input_audio_buffer.speech_stopped"' in head:
+                    turn_started = turn_started or time.perf_counter()
+                elif '"type": "response.audio.delta"' in head and turn_started is not None:
+                    latencies.append(time.perf_counter() - turn_started)
+                    turn_started = None
+
+        receive_task = asyncio.create_task(receiver())
+        started = time.perf_counter()
+        sent = 0
+        last_append = 0.0
+        last_append_t = 0.0
+        for record in load_recording(path):
+            payload = _to_send(record, target)
+            if payload is None:
+                continue
+            if last_append and record["t"] - last_append_t > AUDIO_GAP_SEC:
+                # The recorded speech ended with the last audio chunk
+                turn_started = turn_started or last_append
+                last_append = 0.0
+            if speed > 0:
+                delay = record["t"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await websocket.send(payload if isinstance(payload, str) else json.dumps(payload))
+            sent += 1
+            # A turn starts at response.create, at user text or at the end of an audio burst
+            now = time.perf_counter()
+            if isinstance(payload, str) or payload.get("type") in ("response.create", "conversation.item.create"):
+                turn_started = turn_started or now
+            elif payload.get("type") == "input_audio_buffer.append":
+                last_append, last_append_t = now, record["t"]
+        if last_append:
+            turn_started = turn_started or last_append
+        # Let the last answer arrive
+        await asyncio.sleep(2.0)
+        receive_task.cancel()
+
+    report = {"sent": sent, "received": received, "turns": len(latencies)}
+    if latencies:
+        ordered = sorted(latencies)
+        report["first_audio_p50_ms"] = round(ordered[len(ordered) // 2] * 1000)
+        report["first_audio_max_ms"] = round(ordered[-1] * 1000)
+    return report
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded realtime session")
+    parser.add_argument("file")
+    parser.add_argument("--target", choices=["upstream", "gateway"], default="upstream")
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--token", default=os.environ.get("AUTH_TOKEN"))
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    url = args.url or ("ws://localhost:8765" if args.target == "upstream" else "ws://localhost:3000/ws")
+    report = asyncio.run(replay(args.file, args.target, url, args.speed, args.token))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,216 @@
+"""
+Session lifecycle management for realtime_app.py
+
+- Reconnect grace period: when the WebSocket of a car drops (e.g. in a tunnel),
+  the upstream realtime session and driver assist tasks keep running for a while
+  so that reuse_session can reattach to them. A session is detached only when
+  the last of its subscriber sockets (displays) is gone.
+- Idle reaper: frees detached sessions whose grace period expired and sessions
+  without any traffic for too long, connected or not. Messages delivered to the
+  client count as activity too, so a display that only listens (audio, driver
+  assist pushes) is kept; half-open sockets are closed by the WebSocket
+  protocol pings and then go through the grace period.
+- Per-session resource usage (messages/bytes in and out, queue depths, lifetime),
+  logged when a session is freed and exposed via usage().
+
+Settings (environment variables):
+- SESSION_RECONNECT_GRACE_SEC: grace window after disconnect (default 60, 0 = free immediately)
+- SESSION_IDLE_TIMEOUT_SEC: max time without inbound or delivered outbound messages
+  (default 1800, 0 = disabled)
+- SESSION_REAP_INTERVAL_SEC: reaper period (default 10)
+- WS_PING_INTERVAL_SEC / WS_PING_TIMEOUT_SEC: WebSocket protocol heartbeat (default 20 / 20)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from starlette.websockets import WebSocket, WebSocketState
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        logging.error(f"{name} must be a number. Using default {default}.")
+        return default
+
+
+WS_PING_INTERVAL_SEC = _env_float("WS_PING_INTERVAL_SEC", 20.0)
+WS_PING_TIMEOUT_SEC = _env_float("WS_PING_TIMEOUT_SEC", 20.0)
+
+
+class SessionLifecycleManager:
+    """Tracks activity of sessions in connected_clients and frees them when they are gone for good."""
+
+    def __init__(
+        self,
+        sessions: dict[str, dict],
+        release: Callable[[str, dict], Awaitable[None]],
+        grace_sec: float = 60.0,
+        idle_timeout_sec: float = 1800.0,
+        reap_interval_sec: float = 10.0,
+    ) -> None:
+        self.sessions = sessions
+        self.release = release
+        self.grace_sec = grace_sec
+        self.idle_timeout_sec = idle_timeout_sec
+        self.reap_interval_sec = reap_interval_sec
+        self._reaper_task: asyncio.Task | None = None
+
+    @classmethod
+    def from_env(
+        cls, sessions: dict[str, dict], release: Callable[[str, dict], Awaitable[None]]
+    ) -> "SessionLifecycleManager":
+        return cls(
+            sessions,
+            release,
+            grace_sec=_env_float("SESSION_RECONNECT_GRACE_SEC", 60.0),
+            idle_timeout_sec=_env_float("SESSION_IDLE_TIMEOUT_SEC", 1800.0),
+            reap_interval_sec=_env_float("SESSION_REAP_INTERVAL_SEC", 10.0),
+        )
+
+    # --- activity tracking ---
+
+    @staticmethod
+    def init_session(session_data: dict) -> dict:
+        """Add lifecycle fields to a freshly created session."""
+        now = time.monotonic()
+        session_data.update({
+            "created_at": now,
+            "last_activity": now,
+            "detached_at": None,
+            "stats": {
+                "messages_in": 0,
+                "bytes_in": 0,
+                "messages_out": 0,
+                "bytes_out": 0,
+                "reconnects": 0,
+            },
+        })
+        return session_data
+
+    @staticmethod
+    def touch(session_data: dict, message: str) -> None:
+        """Record an inbound message."""
+        session_data["last_activity"] = time.monotonic()
+        stats = session_data["stats"]
+        stats["messages_in"] += 1
+        stats["bytes_in"] += len(message)
+
+    @staticmethod
+    def record_output(session_data: dict, message: str) -> None:
+        """Record an outbound message delivered to a subscriber (may be called from a shard thread)."""
+        session_data["last_activity"] = time.monotonic()
+        stats = session_data["stats"]
+        stats["messages_out"] += 1
+        stats["bytes_out"] += len(message)
+
+    def attach(self, client_id: str, websocket: WebSocket, role: str) -> dict:
+        """Attach a (re)connected WebSocket as an additional subscriber of an existing session."""
+        session_data = self.sessions[client_id]
+        if session_data["detached_at"] is not None:
+            detached_for = time.monotonic() - session_data["detached_at"]
+            logging.info(f"Reattaching client_id {client_id} after {detached_for:.1f}s")
+            session_data["stats"]["reconnects"] += 1
+        session_data["subscribers"][websocket] = role
+        session_data["detached_at"] = None
+        session_data["last_activity"] = time.monotonic()
+        return session_data
+
+    async def detach(self, client_id: str, websocket: WebSocket) -> None:
+        """
+        Called when the message loop of websocket exits.
+        Keeps the session alive for grace_sec once no subscriber is left.
+        """
+        session_data = self.sessions.get(client_id)
+        if not session_data or session_data["subscribers"].pop(websocket, None) is None:
+            # Already freed
+            return
+        if session_data["subscribers"]:
+            # Other displays of the car are still connected
+            return
+
+        if self.grace_sec <= 0:
+            await self.free(client_id, "disconnected")
+            return
+
+        session_data["detached_at"] = time.monotonic()
+        logging.info(f"Session {client_id} detached, kept for {self.grace_sec:.0f}s for reconnect")
+
+    async def free(self, client_id: str, reason: str) -> None:
+        """Release all resources of a session and log its usage."""
+        session_data = self.sessions.pop(client_id, None)
+        if not session_data:
+            return
+        usage = self.usage(session_data)
+        logging.info(f"Freeing session {client_id} ({reason}): {json.dumps(usage)}")
+
+        for websocket in list(session_data["subscribers"]):
+            if websocket.application_state == WebSocketState.CONNECTED:
+                try:
+                    await websocket.close(code=1001)
+                except Exception as e:
+                    logging.warning(f"Failed to close WebSocket of {client_id}: {e}")
+
+        try:
+            await self.release(client_id, session_data)
+        except Exception as e:
+            logging.error(f"Failed to release session {client_id}: {e}", exc_info=True)
+
+    # --- reporting ---
+
+    @staticmethod
+    def usage(session_data: dict) -> dict[str, Any]:
+        now = time.monotonic()
+        detached_at = session_data.get("detached_at")
+        return {
+            "age_sec": round(now - session_data["created_at"], 1),
+            "idle_sec": round(now - session_data["last_activity"], 1),
+            "detached_sec": round(now - detached_at, 1) if detached_at is not None else None,
+            "subscribers": sorted(session_data["subscribers"].values()),
+            "input_queue": session_data["input_queue"].qsize(),
+            "ai_input_queue": session_data["ai_input_queue"].qsize(),
+            **session_data["stats"],
+        }
+
+    def usage_report(self) -> dict[str, dict[str, Any]]:
+        return {client_id: self.usage(data) for client_id, data in list(self.sessions.items())}
+
+    # --- reaper ---
+
+    async def reap_once(self) -> None:
+        now = time.monotonic()
+        for client_id, session_data in list(self.sessions.items()):
+            detached_at = session_data.get("detached_at")
+            if detached_at is not None:
+                if now - detached_at >= self.grace_sec:
+                    await self.free(client_id, "reconnect grace period expired")
+            elif self.idle_timeout_sec > 0 and now - session_data["last_activity"] >= self.idle_timeout_sec:
+                await self.free(client_id, "idle timeout")
+
+    async def _reaper_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval_sec)
+            try:
+                await self.reap_once()
+            except Exception as e:
+                logging.error(f"Session reaper failed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reaper_loop())
+
+    async def stop(self) -> None:
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        for client_id in list(self.sessions):
+            await self.free(client_id, "server shutdown")
@@ -0,0 +1,143 @@
+"""
+Multi-loop sharding for realtime_app.py
+
+Runs K asyncio event loops on K threads inside one process and pins every
+client_id to one of them. Each shard owns the sessions, queues and upstream
+realtime connections of its cars, so audio relay, JSON work and driver assist
+of different cars can run on separate cores on free-threaded builds.
+
+The WebSocket of a client always stays on the server (main) loop; data crosses
+loops only through the thread-safe helpers below.
+
+Settings (environment variables):
+- REALTIME_LOOP_SHARDS: number of shard loops (0 or 1 = disabled, default)
+- REALTIME_LOOP_SHARDS_FORCE: run shards even when the GIL is enabled
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import zlib
+from typing import Any, Coroutine
+
+from model_factory import aclose_loop_clients
+
+
+def gil_enabled() -> bool:
+    """Return True unless running on a free-threaded build with the GIL disabled."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+class LoopShard:
+    """One event loop running forever on its own daemon thread."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name=f"realtime-shard-{index}", daemon=True
+        )
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            try:
+                # Chat model HTTP pools are bound to this loop: close them before it goes away
+                self.loop.run_until_complete(aclose_loop_clients())
+            except Exception:
+                logging.exception(f"Failed to close the HTTP clients of shard {self.index}")
+            self.loop.close()
+
+    def start(self) -> None:
+        self.thread.start()
+        self._ready.wait()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=timeout)
+
+
+class ShardedLoops:
+    """
+    Maps client_id to a shard loop.
+    When sharding is disabled every client runs on the main (server) loop.
+    """
+
+    def __init__(self, num_shards: int = 0) -> None:
+        self.num_shards = num_shards if num_shards > 1 else 0
+        self.shards: list[LoopShard] = []
+        self.main_loop: asyncio.AbstractEventLoop | None = None
+
+    @classmethod
+    def from_env(cls) -> "ShardedLoops":
+        try:
+            num_shards = int(os.environ.get("REALTIME_LOOP_SHARDS", "0"))
+        except ValueError:
+            logging.error("REALTIME_LOOP_SHARDS must be an integer. Sharding disabled.")
+            num_shards = 0
+
+        if num_shards > 1 and gil_enabled() and not os.environ.get("REALTIME_LOOP_SHARDS_FORCE"):
+            logging.warning(
+                f"REALTIME_LOOP_SHARDS={num_shards} requested but the GIL is enabled; "
+                "falling back to a single event loop (set REALTIME_LOOP_SHARDS_FORCE=1 to override)."
+            )
+            num_shards = 0
+        return cls(num_shards)
+
+    @property
+    def enabled(self) -> bool:
+        return self.num_shards > 1
+
+    def start(self) -> None:
+        """Start shard threads. Must be called from the main loop."""
+        self.main_loop = asyncio.get_running_loop()
+        if not self.enabled:
+            return
+        for index in range(self.num_shards):
+            shard = LoopShard(index)
+            shard.start()
+            self.shards.append(shard)
+        logging.info(f"Started {self.num_shards} realtime loop shards (GIL enabled: {gil_enabled()})")
+
+    def stop(self) -> None:
+        for shard in self.shards:
+            shard.stop()
+        self.shards.clear()
+
+    def shard_index(self, client_id: str) -> int:
+        """Stable shard index for client_id (independent of PYTHONHASHSEED)."""
+        if not self.enabled:
+            return 0
+        return zlib.crc32(client_id.encode()) % self.num_shards
+
+    def loop_for(self, client_id: str) -> asyncio.AbstractEventLoop:
+        if not self.shards:
+            return self.main_loop or asyncio.get_running_loop()
+        return self.shards[self.shard_index(client_id)].loop
+
+
+async def run_on_loop(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, Any]) -> Any:
+    """Await coro on loop, even if loop belongs to another thread."""
+    if loop is asyncio.get_running_loop():
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def put_threadsafe(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, item: Any) -> None:
+    """Put item into an (unbounded) asyncio.Queue owned by loop."""
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if loop is running_loop:
+        queue.put_nowait(item)
+    else:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
@@ -0,0 +1,300 @@
+"""
+Per-turn span tracing for the realtime voice agent
+
+A turn starts with an input_mic/input_text event in OpenAIVoiceReactAgent.aconnect
+and ends with the first output chunk sent back to the client. Its trace id (the
+turn id) is carried through VoiceToolExecutor, SupervisorTool._arun, the
+supervisor graph, each worker agent, each LLM call and each BaseTool run.
+
+Spans are appended to a JSONL file using OTLP field names
+(traceId, spanId, parentSpanId, startTimeUnixNano, ...).
+
+Settings (environment variables):
+- TRACE_FILE: path of the JSONL span file (tracing is disabled when unset)
+
+Render a waterfall of a turn:
+    python realtime_tracing.py traces.jsonl            # list recent turns
+    python realtime_tracing.py traces.jsonl <turn_id>  # waterfall of one turn
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_FILE = os.environ.get("TRACE_FILE")
+ENABLED = bool(TRACE_FILE)
+
+_current_span: ContextVar["Span | None"] = ContextVar("realtime_current_span", default=None)
+_UNSET: Any = object()
+
+
+class _JsonlExporter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+_exporter = _JsonlExporter(TRACE_FILE) if ENABLED else None
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict) -> None:
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = attributes
+
+    def end(self, **attributes: Any) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.attributes.update(attributes)
+        if _exporter is not None:
+            _exporter.export({
+                "traceId": self.trace_id,
+                "spanId": self.span_id,
+                "parentSpanId": self.parent_id,
+                "name": self.name,
+                "startTimeUnixNano": self.start_ns,
+                "endTimeUnixNano": self.end_ns,
+                "attributes": self.attributes,
+            })
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Span | None = _UNSET, **attributes: Any) -> Span | None:
+    """Start a span (child of parent, or of the current span). Returns None when tracing is disabled."""
+    if not ENABLED:
+        return None
+    if parent is _UNSET:
+        parent = _current_span.get()
+    if parent is None:
+        return Span(name, uuid.uuid4().hex, None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def start_turn(source: str, **attributes: Any) -> Span | None:
+    """Start the root span of a new turn. Its trace id is the turn id."""
+    return start_span("turn", parent=None, source=source, **attributes)
+
+
+@contextmanager
+def span(name: str, parent: Span | None = _UNSET, **attributes: Any) -> Iterator[Span | None]:
+    """Context manager that makes the new span current for nested calls."""
+    new_span = start_span(name, parent, **attributes)
+    if new_span is None:
+        yield None
+        return
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.attributes["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end()
+
+
+class TurnTracer:
+    """
+    Tracks the turn span of one realtime session inside aconnect.
+    The realtime model phases (until the function call, and from the tool output
+    until the answer) are recorded as "realtime_model" spans.
+    """
+
+    def __init__(self) -> None:
+        self.turn: Span | None = None
+        self.model: Span | None = None
+        self.awaiting_tool = False
+
+    def begin(self, source: str, **attributes: Any) -> None:
+        if self.turn is not None:
+            return
+        self.turn = start_turn(source, **attributes)
+        self.model = start_span("realtime_model", parent=self.turn, phase="input") if self.turn else None
+
+    def tool_call(self, name: str) -> Span | None:
+        """Model requested a tool. Returns the parent span for the tool run."""
+        if self.model is not None:
+            self.model.end(tool=name)
+            self.model = None
+        self.awaiting_tool = True
+        return self.turn
+
+    def tool_output(self) -> None:
+        self.awaiting_tool = False
+        if self.turn is not None:
+            self.model = start_span("realtime_model", parent=self.turn, phase="answer")
+
+    def first_output(self, kind: str) -> None:
+        """First output chunk of the turn has been sent to the client."""
+        if self.turn is None or self.awaiting_tool:
+            return
+        if self.model is not None:
+            self.model.end()
+            self.model = None
+        self.turn.end(first_output=kind)
+        self.turn = None
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that turns graph nodes, LLM calls and tool runs into spans.
+    Top-level runs become children of the span that was current when the handler was created.
+    """
+
+    def __init__(self) -> None:
+        self.root = current_span()
+        self._open: dict[UUID, Span] = {}
+        self._effective: dict[UUID, Span | None] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, name: str | None, record: bool, **attributes) -> None:
+        with self._lock:
+            parent = self._effective.get(parent_run_id, self.root) if parent_run_id else self.root
+            if record and parent is not None:
+                new_span = start_span(name or "unknown", parent=parent, **attributes)
+                self._open[run_id] = new_span
+                self._effective[run_id] = new_span
+            else:
+                # Not recorded: children attach to the nearest recorded ancestor
+                self._effective[run_id] = parent
+
+    def _end(self, run_id: UUID, **attributes) -> None:
+        with self._lock:
+            self._effective.pop(run_id, None)
+            ended = self._open.pop(run_id, None)
+        if ended is not None:
+            ended.end(**attributes)
+
+    # graph nodes (supervisor, worker agents and their inner nodes)
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        metadata = metadata or {}
+        record = parent_run_id is None or name == metadata.get("langgraph_node")
+        self._start(run_id, parent_run_id, f"node:{name}", record)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("kwargs", {}).get("model_name")
+        self._start(run_id, parent_run_id, "llm", True, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, "llm", True, model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage") if response is not None else None
+        self._end(run_id, token_usage=token_usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    # tools (BaseTool.run / arun -> _run / _arun)
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, f"tool:{name}", True)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+
+#
+# Waterfall CLI
+#
+def _load_spans(path: str) -> list[dict]:
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def render_waterfall(spans: list[dict], width: int = 50) -> str:
+    if not spans:
+        return "No spans."
+    t0 = min(s["startTimeUnixNano"] for s in spans)
+    t1 = max(s["endTimeUnixNano"] for s in spans)
+    total = max(t1 - t0, 1)
+
+    children: dict[str | None, list[dict]] = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        parent = s["parentSpanId"] if s["parentSpanId"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    lines = [f"turn {spans[0]['traceId']}  total {total / 1e6:.0f} ms"]
+
+    def walk(parent_id: str | None, depth: int) -> None:
+        for s in sorted(children.get(parent_id, []), key=lambda x: x["startTimeUnixNano"]):
+            offset = s["startTimeUnixNano"] - t0
+            duration = s["endTimeUnixNano"] - s["startTimeUnixNano"]
+            start_col = int(offset / total * width)
+            bar_len = max(1, int(duration / total * width))
+            bar = " " * start_col + "█" * min(bar_len, width - start_col)
+            label = ("  " * depth + s["name"])[:40]
+            lines.append(f"{label:<40} |{bar:<{width}}| {offset / 1e6:8.0f} ms +{duration / 1e6:8.0f} ms")
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> None:
+    if not argv:
+        print(__doc__)
+        return
+    spans = _load_spans(argv[0])
+    if len(argv) == 1:
+        # List turns, most recent last
+        turns = [s for s in spans if s["name"] == "turn"]
+        for s in turns[-20:]:
+            duration_ms = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6
+            print(f"{s['traceId']}  {duration_ms:8.0f} ms  {json.dumps(s['attributes'], ensure_ascii=False)}")
+        return
+    turn_spans = [s for s in spans if s["traceId"] == argv[1]]
+    print(render_waterfall(turn_spans))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
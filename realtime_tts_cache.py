@@ -0,0 +1,179 @@
+"""
+Phrase-level audio cache for fixed spoken outputs
+
+Fixed phrases (demo mode notices rendered from the realtime_messages catalog)
+would otherwise cost a realtime model generation every time. Only speak_phrase
+texts are cached: answers the model words from context (tool confirmations)
+differ per turn and are never cached.
+The first time a phrase is spoken, the response is created with
+metadata.phrase_key and its audio deltas are captured; when the response
+completes, the PCM16 audio is stored under (normalized text, language, voice).
+Next time the cached audio is sent straight to the client and no upstream
+response is created at all.
+
+The cache is shared by all sessions of the process and bounded in bytes
+(least recently used phrases are evicted first). With TTS_CACHE_DIR set, the
+audio is also kept on disk and survives restarts; disk reads and writes run in
+worker threads so they never stall the event loop.
+
+Settings (environment variables):
+- TTS_CACHE: "1" enables the cache (default off)
+- TTS_CACHE_MAX_MB: memory bound of the cached audio (default 32)
+- TTS_CACHE_DIR: optional directory for persistent <sha>.pcm files
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine
+
+from realtime_filler import audio_delta_events
+from realtime_metrics import PHRASE_CACHE_BYTES, PHRASE_CACHE_EVICTIONS, PHRASE_CACHE_LOOKUPS
+
+ENABLED = os.environ.get("TTS_CACHE", "0") == "1"
+MAX_BYTES = int(float(os.environ.get("TTS_CACHE_MAX_MB", "32")) * 1024 * 1024)
+CACHE_DIR = os.environ.get("TTS_CACHE_DIR")
+
+PhraseKey = tuple[str, str, str]
+
+
+def normalize(text: str) -> str:
+    """Text as compared by the cache: NFKC, case folded, single spaces."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def phrase_key(text: str, lang: str, voice: str) -> PhraseKey:
+    return normalize(text), lang, voice
+
+
+def _key_id(key: PhraseKey) -> str:
+    return hashlib.sha256("\x1f".join(key).encode("utf-8")).hexdigest()[:32]
+
+
+class PhraseAudioCache:
+    def __init__(self, max_bytes: int = MAX_BYTES, directory: str | None = CACHE_DIR) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries: OrderedDict[PhraseKey, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: PhraseKey) -> str:
+        return os.path.join(self.directory, f"{_key_id(key)}.pcm")
+
+    async def get(self, key: PhraseKey) -> bytes | None:
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+        if pcm is None and self.directory:
+            pcm = await asyncio.to_thread(self._load, key)
+        PHRASE_CACHE_LOOKUPS.labels("hit" if pcm is not None else "miss").inc()
+        return pcm
+
+    def _load(self, key: PhraseKey) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                pcm = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Failed to read cached phrase audio: {e}")
+            return None
+        self._insert(key, pcm)
+        return pcm
+
+    def put(self, key: PhraseKey, pcm: bytes) -> None:
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        self._insert(key, pcm)
+        if self.directory:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._persist, key, pcm)
+            except RuntimeError:
+                self._persist(key, pcm)
+
+    def _persist(self, key: PhraseKey, pcm: bytes) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(key), "wb") as f:
+                f.write(pcm)
+        except OSError as e:
+            logging.warning(f"Failed to persist cached phrase audio: {e}")
+
+    def _insert(self, key: PhraseKey, pcm: bytes) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = pcm
+            self._bytes += len(pcm)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                PHRASE_CACHE_EVICTIONS.inc()
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+phrase_cache = PhraseAudioCache()
+PHRASE_CACHE_BYTES.set_callback(phrase_cache.size_bytes)
+
+
+class PhraseResponder:
+    """Per session: serves cached phrases and captures the audio of phrase responses."""
+
+    def __init__(self, voice: str) -> None:
+        self.voice = voice
+        # key id -> key of phrase responses requested but not created yet
+        self._requested: dict[str, PhraseKey] = {}
+        # response id -> (key, captured PCM chunks)
+        self._captures: dict[str, tuple[PhraseKey, list[bytes]]] = {}
+
+    def key(self, text: str, lang: str) -> PhraseKey:
+        return phrase_key(text, lang, self.voice)
+
+    async def lookup(self, key: PhraseKey) -> bytes | None:
+        """Cached audio of key (None if it is not cached or the cache is off)."""
+        return await phrase_cache.get(key) if ENABLED else None
+
+    @staticmethod
+    async def play(key: PhraseKey, pcm: bytes, send: Callable[[str], Coroutine[Any, Any, None]]) -> None:
+        """Send cached audio to the client (all at once; the client buffers it)."""
+        for event in audio_delta_events(pcm, f"phrase_{_key_id(key)[:8]}"):
+            await send(event)
+
+    def response_create(self, event: dict, key: PhraseKey) -> dict:
+        """response.create event whose audio will be captured into the cache under key."""
+        if not ENABLED:
+            return event
+        key_id = _key_id(key)
+        self._requested[key_id] = key
+        response = dict(event.get("response", {}))
+        response["metadata"] = {**response.get("metadata", {}), "phrase_key": key_id}
+        return {**event, "response": response}
+
+    def on_response_created(self, data: dict) -> None:
+        response = data.get("response") or {}
+        key = self._requested.pop((response.get("metadata") or {}).get("phrase_key", ""), None)
+        if key is not None:
+            self._captures[response.get("id", "")] = (key, [])
+
+    def on_audio_delta(self, data: dict) -> None:
+        capture = self._captures.get(data.get("response_id", ""))
+        if capture is not None:
+            capture[1].append(base64.b64decode(data.get("delta", "")))
+
+    def on_response_done(self, data: dict) -> None:
+        response = data.get("response") or {}
+        capture = self._captures.pop(response.get("id", ""), None)
+        # Interrupted or cancelled phrases are incomplete: do not cache them
+        if capture is not None and response.get("status") == "completed":
+            phrase_cache.put(capture[0], b"".join(capture[1]))
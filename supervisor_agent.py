@@ -1,7 +1,7 @@
 import logging
+import os
 from langgraph_supervisor import create_supervisor
-from langchain.chat_models import init_chat_model
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 
 # Import TMDB agent (installed via uv add --editable ./tmdb_agent)
 from tmdb_agent.agent import create_tmdb_agent
@@ -21,10 +21,19 @@ from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Any, Dict
 import json
+import time
+
+from realtime_metrics import SUPERVISOR_AGENT_SECONDS
+import realtime_tracing
+from realtime_tracing import TracingCallbackHandler
+from llm_scheduler import Priority, llm_deadline, llm_priority
+
+# Per-turn deadline of a supervisor call; every model and tool call of the turn gets the time left as its timeout
+SUPERVISOR_TURN_TIMEOUT_SEC = float(os.environ.get("SUPERVISOR_TURN_TIMEOUT_SEC", "20"))
 
 # TMDBエージェントの初期化
 tmdb_agent = create_tmdb_agent(
-    llm=ChatOpenAI(model="gpt-4o-mini", temperature=0.1),
+    llm=get_chat_model("gpt-4o-mini", temperature=0.1),
     verbose=True,
 )
 
@@ -51,7 +60,7 @@ agents_list = [
 
 
 supervisor = create_supervisor(
-    model=init_chat_model("openai:gpt-4o"),
+    model=get_chat_model("gpt-4o"),
     agents=agents_list,
     prompt=(
         "You are a professional and friendly agents:\n"
@@ -110,18 +119,36 @@ class SupervisorTool(BaseTool):
     description: str = "A supervisor agent that can handle automotive control requests, entertainment searches, navigation requests, and movie/TV show information queries. Use this tool for complex tasks that require routing to specialized agents."
     args_schema: type[BaseModel] = SupervisorInput
 
+    async def _astream_supervisor(self, query: str) -> list:
+        """Stream the supervisor graph and collect the messages of all nodes.
+
+        Runs on the event loop with astream: LLM calls take llm_scheduler slots with aslot, and
+        sync worker nodes run in executor threads, so a queued call never blocks the loop.
+        """
+        # Graph nodes, LLM calls and tool runs become child spans of the current span
+        config = {"callbacks": [TracingCallbackHandler()]} if realtime_tracing.ENABLED else {}
+        result_messages = []
+        node_started_at = time.perf_counter()
+        async for chunk in supervisor.astream({
+            "messages": [{"role": "user", "content": query}]
+        }, config=config):
+            # Each chunk is emitted when a node (supervisor or worker agent) finishes
+            now = time.perf_counter()
+            for node_name, node_update in chunk.items():
+                SUPERVISOR_AGENT_SECONDS.labels(node_name).observe(now - node_started_at)
+                if "messages" in node_update and node_update["messages"]:
+                    result_messages.extend(node_update["messages"])
+            node_started_at = now
+        return result_messages
+
     async def _arun(self, query: str) -> Dict[str, Any]:
         """Run the supervisor with the given query"""
         try:
             print(f"[SupervisorTool] query: {query}")
-            # Supervisorに送信
-            result_messages = []
-            for chunk in supervisor.stream({
-                "messages": [{"role": "user", "content": query}]
-            }):
-                for node_name, node_update in chunk.items():
-                    if "messages" in node_update and node_update["messages"]:
-                        result_messages.extend(node_update["messages"])
+            # User command: highest priority in llm_scheduler, bounded by the turn deadline
+            with realtime_tracing.span("supervisor_tool"), llm_priority(Priority.USER), \
+                    llm_deadline(SUPERVISOR_TURN_TIMEOUT_SEC):
+                result_messages = await self._astream_supervisor(query)
             
             # 最終レスポンスを取得
             final_response = None
@@ -322,7 +349,7 @@ async def main():
         
         # Supervisorに送信
         result_messages = []
-        for chunk in supervisor.stream({
+        async for chunk in supervisor.astream({
             "messages": [{"role": "user", "content": message}]
         }):
             for node_name, node_update in chunk.items():
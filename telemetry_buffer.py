@@ -0,0 +1,124 @@
+"""
+Per-session telemetry ring buffer with rolling trend features
+
+Driver assist sees one vehicle status at a time, so drain rate, average speed
+or ETA drift had to be guessed by the LLM. TelemetryBuffer keeps the last
+TELEMETRY_WINDOW vehicle statuses of a session in preallocated float arrays
+(one per field, constant memory per car) and computes the trends with
+vectorized NumPy operations:
+- driven_km / drain_pct_per_km: battery % used per km over the segments
+  driven towards the destination without charging
+- avg_speed_kmh: mean vehicle_speed
+- eta_drift: slope of eta_sec over time plus 1; 0 on schedule, > 0 when the
+  arrival slips (0.2 = 12 minutes lost per hour)
+- time_in_state_sec: time since driving_status last changed
+
+The buffer is fed by the gateway for every vehicle_status (before any
+coalescing) and read by driver assist; features() is safe to call from
+another thread.
+
+Settings (environment variables):
+- TELEMETRY_WINDOW: statuses kept per session (default 300)
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+WINDOW = int(os.environ.get("TELEMETRY_WINDOW", "300"))
+
+# Numeric fields (dotted paths of vehicle_data); driving_status and charging are stored as codes
+FIELDS = {
+    "battery_level": "energy_status.battery_level",
+    "distance_km": "destination_info.distance_km",
+    "eta_sec": "destination_info.eta_sec",
+    "vehicle_speed": "vehicle_speed",
+}
+# Samples needed before a slope is computed
+MIN_SLOPE_SAMPLES = 3
+
+
+def _get(data: dict, path: str) -> float:
+    for key in path.split("."):
+        if not isinstance(data, dict):
+            return np.nan
+        data = data.get(key)
+    return float(data) if isinstance(data, (int, float)) and not isinstance(data, bool) else np.nan
+
+
+class TelemetryBuffer:
+    def __init__(self, capacity: int = WINDOW) -> None:
+        self.capacity = capacity
+        self._t = np.zeros(capacity)
+        self._fields = {name: np.full(capacity, np.nan) for name in FIELDS}
+        self._state = np.full(capacity, -1, dtype=np.int16)
+        self._charging = np.zeros(capacity, dtype=bool)
+        self._state_codes: dict[str, int] = {}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, vehicle_data: dict, t: float | None = None) -> None:
+        """Record one vehicle_data (t: monotonic seconds, now by default)."""
+        status = vehicle_data.get("driving_status")
+        with self._lock:
+            i = self._next
+            self._t[i] = time.monotonic() if t is None else t
+            for name, path in FIELDS.items():
+                self._fields[name][i] = _get(vehicle_data, path)
+            if isinstance(status, str):
+                self._state[i] = self._state_codes.setdefault(status, len(self._state_codes))
+            else:
+                self._state[i] = -1
+            self._charging[i] = bool((vehicle_data.get("energy_status") or {}).get("charging")) or status == "charging"
+            self._next = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _ordered(self, array: np.ndarray) -> np.ndarray:
+        """Copy of the recorded part of array, oldest first."""
+        if self._count < self.capacity:
+            return array[:self._count].copy()
+        return np.concatenate((array[self._next:], array[:self._next]))
+
+    def features(self, now: float | None = None) -> dict[str, float]:
+        """Rolling trend features (features that cannot be computed yet are left out)."""
+        with self._lock:
+            if self._count == 0:
+                return {}
+            t = self._ordered(self._t)
+            fields = {name: self._ordered(array) for name, array in self._fields.items()}
+            state = self._ordered(self._state)
+            charging = self._ordered(self._charging)
+
+        features = {"samples": float(len(t)), "span_sec": float(t[-1] - t[0])}
+
+        speed = fields["vehicle_speed"]
+        if np.isfinite(speed).any():
+            features["avg_speed_kmh"] = float(np.nanmean(speed))
+
+        if len(t) >= 2:
+            driven = -np.diff(fields["distance_km"])
+            used = -np.diff(fields["battery_level"])
+            # Segments towards the same destination, without charging at either end
+            valid = (np.isfinite(driven) & np.isfinite(used) & (driven > 0) & (used >= 0)
+                     & ~charging[1:] & ~charging[:-1])
+            driven_km = float(driven[valid].sum())
+            if driven_km > 0:
+                features["driven_km"] = driven_km
+                features["drain_pct_per_km"] = float(used[valid].sum() / driven_km)
+
+        eta = fields["eta_sec"]
+        finite = np.isfinite(eta)
+        if finite.sum() >= MIN_SLOPE_SAMPLES and np.ptp(t[finite]) > 0:
+            features["eta_drift"] = float(np.polyfit(t[finite], eta[finite], 1)[0] + 1.0)
+
+        # Start of the trailing run of the current driving_status
+        changes = np.flatnonzero(state[1:] != state[:-1])
+        run_start = t[changes[-1] + 1] if len(changes) else t[0]
+        features["time_in_state_sec"] = float((time.monotonic() if now is None else now) - run_start)
+        return features
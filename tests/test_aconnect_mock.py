@@ -0,0 +1,95 @@
+"""A full realtime session of OpenAIVoiceReactAgent.aconnect against realtime_mock_server.py."""
+
+import asyncio
+import json
+from typing import Callable
+
+import websockets
+from langchain_core.tools import tool
+
+import realtime_mock_server
+from langchain_openai_voice import OpenAIVoiceReactAgent, VoiceToolExecutor
+from realtime_api_utils import direct_text_event, text_to_realtime_api_json_as_role
+
+
+@tool
+def supervisor(query: str) -> str:
+    """Answers the user's query."""
+    return f"answer to {query}"
+
+
+async def _run_session(monkeypatch, messages: list[dict], done: Callable[[list], bool]) -> list:
+    """Outputs sent to the client until done(outputs) holds (JSON chunks decoded)."""
+    monkeypatch.setattr(realtime_mock_server, "FIRST_EVENT_SEC", 0.01)
+    monkeypatch.setattr(realtime_mock_server, "AUDIO_CHUNKS", 3)
+    monkeypatch.setattr(realtime_mock_server, "CHUNK_INTERVAL_SEC", 0.0)
+
+    outputs: list = []
+    finished = asyncio.Event()
+
+    async def send_output_chunk(chunk: str) -> None:
+        try:
+            outputs.append(json.loads(chunk))
+        except json.JSONDecodeError:
+            outputs.append(chunk)
+        if done(outputs):
+            finished.set()
+
+    inputs: asyncio.Queue = asyncio.Queue()
+
+    async def input_stream():
+        while True:
+            yield await inputs.get()
+
+    async with websockets.serve(realtime_mock_server.handle_connection, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        agent = OpenAIVoiceReactAgent(
+            model="gpt-4o-realtime-preview",
+            openai_api_key="test",
+            url=f"ws://127.0.0.1:{port}",
+            tools=[supervisor],
+        )
+        session = asyncio.create_task(agent.aconnect(input_stream(), send_output_chunk))
+        for message in messages:
+            await inputs.put(json.dumps(message))
+        waiter = asyncio.ensure_future(finished.wait())
+        try:
+            await asyncio.wait({session, waiter}, timeout=10, return_when=asyncio.FIRST_COMPLETED)
+            if session.done():
+                session.result()  # raises whatever ended the session early
+            assert finished.is_set(), f"session did not finish within 10 s: {outputs}"
+        finally:
+            waiter.cancel()
+            session.cancel()
+            try:
+                await session
+            except asyncio.CancelledError:
+                pass
+    return outputs
+
+
+def _has_audio(outputs: list) -> bool:
+    return any(isinstance(event, dict) and event.get("type") == "response.audio.delta" for event in outputs)
+
+
+def test_aconnect_session_completes_a_tool_turn(monkeypatch):
+    outputs = asyncio.run(_run_session(
+        monkeypatch, [text_to_realtime_api_json_as_role("user", "hello")], _has_audio))
+    assert _has_audio(outputs)
+
+
+def test_direct_text_inputs_back_to_back_are_both_answered(monkeypatch):
+    trigger = VoiceToolExecutor._trigger_func
+
+    async def slow_trigger(self) -> dict:
+        # The executor takes a while to pick up a call, so the second input finds it busy
+        tool_call = await trigger(self)
+        await asyncio.sleep(0.05)
+        return tool_call
+
+    monkeypatch.setattr(VoiceToolExecutor, "_trigger_func", slow_trigger)
+    answers = ["answer to first", "answer to second"]
+    outputs = asyncio.run(_run_session(
+        monkeypatch, [direct_text_event("first"), direct_text_event("second")],
+        lambda outputs: [output for output in outputs if output in answers] == answers))
+    assert [output for output in outputs if output in answers] == answers
@@ -0,0 +1,69 @@
+"""agent_driver_assist_ai: the combined structured output is split back into the per-mode results."""
+
+import asyncio
+import json
+
+import agent_driver_assist_ai
+from agent_driver_assist_ai import COMBINED_MODE, COMBINED_SCHEMA, AgentDriverAssistAI, _split_combined
+
+VIDEO_SEARCH_PARAMS = {
+    "max_duration_sec": 1200, "viewer_role": "passenger", "viewer_age": 10, "preferred_genres": ["anime"],
+    "avoid_recently_watched": True, "driving_status": "charging", "network_condition": "good",
+    "session_id": "s1", "reason": "charging for 20 minutes",
+}
+
+
+def _combined(need_ev_charge: bool = True, reason: str = "battery low") -> dict:
+    return {"video_search_params": dict(VIDEO_SEARCH_PARAMS), "need_ev_charge": need_ev_charge, "reason": reason}
+
+
+def test_schema_requires_every_field_split_into_the_modes():
+    schema = COMBINED_SCHEMA["schema"]
+    assert sorted(schema["required"]) == sorted(schema["properties"])
+    video = schema["properties"]["video_search_params"]
+    assert sorted(video["required"]) == sorted(VIDEO_SEARCH_PARAMS)
+
+
+def test_combined_result_is_split_per_mode():
+    assert _split_combined(_combined()) == {
+        "video": {"video_search_params": VIDEO_SEARCH_PARAMS},
+        "ev_charge": {"need_ev_charge": True, "reason": "battery low"},
+    }
+
+
+def test_video_reason_does_not_leak_into_ev_charge():
+    split = _split_combined(_combined(need_ev_charge=False, reason="enough range"))
+    assert split["ev_charge"] == {"need_ev_charge": False, "reason": "enough range"}
+    assert split["video"]["video_search_params"]["reason"] == "charging for 20 minutes"
+
+
+def test_shed_or_partial_result_yields_empty_modes():
+    assert _split_combined({}) == {"video": {}, "ev_charge": {}}
+    assert _split_combined({"need_ev_charge": True}) == {"video": {}, "ev_charge": {"need_ev_charge": True}}
+
+
+def test_run_agent_turns_one_combined_call_into_both_proposals(monkeypatch):
+    invoked = []
+
+    class _Chain:
+        async def ainvoke(self, inputs: dict) -> dict:
+            invoked.append(inputs["system_prompt"])
+            return _combined()
+
+    class _Recommender:
+        async def recommend(self, params: dict) -> dict:
+            return {"title": "video", "params": params}
+
+    monkeypatch.setattr(agent_driver_assist_ai, "DRIVER_ASSIST_LLM_MODE", COMBINED_MODE)
+    monkeypatch.setattr(agent_driver_assist_ai, "get_chat_model", lambda model_name: object())
+    monkeypatch.setattr(agent_driver_assist_ai, "_chain", lambda mode, model: _Chain())
+    monkeypatch.setattr(agent_driver_assist_ai, "get_video_recommender", lambda: _Recommender())
+
+    agent = AgentDriverAssistAI()
+    thread_id = agent.create_agent()
+    result = json.loads(asyncio.run(agent.run_agent(json.dumps({"type": "vehicle_status"}), thread_id)))
+
+    assert invoked == [agent_driver_assist_ai.SYSTEM_PROMPT[COMBINED_MODE]]
+    assert result["proposal_video"]["params"] == VIDEO_SEARCH_PARAMS
+    assert result["proposal_video"]["type"] == "proposal_video"
+    assert result["proposal_ev_charge"]["reason"] == "battery low"
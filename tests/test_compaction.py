@@ -0,0 +1,41 @@
+"""realtime_compaction: tool call items never lose their partner."""
+
+from realtime_compaction import ConversationCompactor
+
+
+def _message(item_id: str, role: str = "user") -> dict:
+    return {"id": item_id, "type": "message", "role": role, "content": [{"type": "input_text", "text": item_id}]}
+
+
+def _call(item_id: str, call_id: str) -> dict:
+    return {"id": item_id, "type": "function_call", "call_id": call_id, "name": "supervisor", "arguments": "{}"}
+
+
+def _output(item_id: str, call_id: str) -> dict:
+    return {"id": item_id, "type": "function_call_output", "call_id": call_id, "output": "done"}
+
+
+def _deleted(events: list[dict]) -> list[str]:
+    return [event["item_id"] for event in events if event["type"] == "conversation.item.delete"]
+
+
+def test_tool_call_pair_at_the_eviction_boundary_is_evicted_together():
+    compactor = ConversationCompactor(max_items=4, keep_items=2)
+    for item in (_message("m1"), _message("m2"), _call("c1", "call_1"), _output("o1", "call_1"), _message("m3")):
+        compactor.on_item_created(item)
+
+    # The boundary falls between c1 (evicted) and o1 (kept): o1 goes with its call
+    assert _deleted(compactor.compact()) == ["m1", "m2", "c1", "o1"]
+
+
+def test_pending_tool_call_is_not_evicted():
+    compactor = ConversationCompactor(max_items=3, keep_items=1)
+    for item in (_message("m1"), _message("m2"), _call("c1", "call_1"), _message("m3")):
+        compactor.on_item_created(item)
+
+    assert _deleted(compactor.compact()) == ["m1", "m2"]
+    # Its output arrives after the compaction and still has its call upstream
+    compactor.on_item_created(_output("o1", "call_1"))
+    for item in (_message("m4"), _message("m5")):
+        compactor.on_item_created(item)
+    assert _deleted(compactor.compact())[:3] == ["c1", "m3", "o1"]
@@ -0,0 +1,116 @@
+"""realtime_driver_assist_ai: queued statuses are coalesced and superseded runs are never delivered."""
+
+import asyncio
+import json
+
+import realtime_driver_assist_ai
+from realtime_driver_assist_ai import STOP_SIGNAL, driver_assist_ai
+
+
+class _Agent:
+    """run_agent blocks until released; records which driving_status each run was for."""
+
+    def __init__(self) -> None:
+        self.started: list[str] = []
+        self.cancelled: list[str] = []
+        self.gates: dict[str, asyncio.Event] = {}
+
+    def create_agent(self) -> str:
+        return "thread"
+
+    async def run_agent(self, message: str, thread_id: str) -> str:
+        status = json.loads(message)["vehicle_data"]["driving_status"]
+        self.started.append(status)
+        gate = self.gates.setdefault(status, asyncio.Event())
+        try:
+            await gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(status)
+            raise
+        return json.dumps({"proposal_ev_charge": {
+            "type": "proposal_ev_charge", "need_ev_charge": True, "reason": status, "return_direct": True}})
+
+    def release(self, status: str) -> None:
+        self.gates.setdefault(status, asyncio.Event()).set()
+
+
+def _status(driving_status: str, trigger: str | None = None) -> str:
+    data = {"type": "vehicle_status", "vehicle_data": {"driving_status": driving_status},
+            "user_data": {"name": "test"}}
+    if trigger:
+        data["trigger"] = trigger
+    return json.dumps(data)
+
+
+async def _until(condition) -> None:
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+def _run(monkeypatch, scenario) -> tuple[_Agent, list[str]]:
+    agent = _Agent()
+    monkeypatch.setattr(realtime_driver_assist_ai, "AgentDriverAssistAI", lambda: agent)
+    delivered: list[str] = []
+
+    async def send_output_chunk(chunk: str) -> None:
+        delivered.append(json.loads(chunk)["reason"])
+
+    async def main() -> None:
+        ai_input_queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(driver_assist_ai(ai_input_queue, asyncio.Queue(), send_output_chunk))
+        await scenario(agent, ai_input_queue, delivered)
+        await ai_input_queue.put(STOP_SIGNAL)
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(main())
+    return agent, delivered
+
+
+def test_triggering_status_cancels_the_run_in_flight(monkeypatch):
+    async def scenario(agent, ai_input_queue, delivered):
+        await ai_input_queue.put(_status("manual"))
+        await _until(lambda: agent.started == ["manual"])
+        await ai_input_queue.put(_status("charging"))
+        await _until(lambda: agent.started == ["manual", "charging"])
+        agent.release("manual")
+        agent.release("charging")
+        await _until(lambda: delivered)
+
+    agent, delivered = _run(monkeypatch, scenario)
+    assert agent.cancelled == ["manual"]
+    assert delivered == ["charging"]
+
+
+def test_status_without_trigger_lets_the_run_finish(monkeypatch):
+    async def scenario(agent, ai_input_queue, delivered):
+        await ai_input_queue.put(_status("manual"))
+        await _until(lambda: agent.started == ["manual"])
+        await ai_input_queue.put(_status("manual"))
+        await asyncio.sleep(0.01)
+        agent.release("manual")
+        await _until(lambda: delivered)
+
+    agent, delivered = _run(monkeypatch, scenario)
+    assert agent.started == ["manual"]
+    assert agent.cancelled == []
+    assert delivered == ["manual"]
+
+
+def test_queued_statuses_are_coalesced_and_keep_a_forced_trigger(monkeypatch):
+    async def scenario(agent, ai_input_queue, delivered):
+        await ai_input_queue.put(_status("manual"))
+        await _until(lambda: agent.started == ["manual"])
+        agent.release("manual")
+        await _until(lambda: delivered == ["manual"])
+        # Read in one batch: only the newest status runs, and the demo trigger carries over to it
+        for status in (_status("charging", trigger="demo"), _status("autonomous"), _status("manual")):
+            ai_input_queue.put_nowait(status)
+        await _until(lambda: len(agent.started) == 2)
+        await _until(lambda: len(delivered) == 2)
+
+    agent, delivered = _run(monkeypatch, scenario)
+    assert agent.started == ["manual", "manual"]
+    assert delivered == ["manual", "manual"]
@@ -0,0 +1,35 @@
+"""realtime_driver_assist_ai: what an EV charging proposal asks the voice agent to say, in order."""
+
+import asyncio
+import json
+
+from realtime_driver_assist_ai import handle_proposal_json
+from realtime_messages import render
+
+
+def _proposal_events(lang: str) -> tuple[list[str], list[dict]]:
+    proposal_json = {"proposal_ev_charge": {
+        "type": "proposal_ev_charge", "need_ev_charge": True, "reason": "battery low", "return_direct": True}}
+    output_queue: asyncio.Queue = asyncio.Queue()
+    sent: list[str] = []
+
+    async def send_output_chunk(chunk: str) -> None:
+        sent.append(chunk)
+
+    asyncio.run(handle_proposal_json(proposal_json, lang, output_queue, send_output_chunk))
+    events = []
+    while not output_queue.empty():
+        events.append(output_queue.get_nowait())
+    return sent, events
+
+
+def test_ev_charge_preamble_is_spoken_after_the_explanation_in_one_response():
+    sent, events = _proposal_events("ja")
+
+    assert [json.loads(chunk)["type"] for chunk in sent] == ["proposal_ev_charge"]
+    # One user item, one response: no separate speak_phrase that could overtake or interleave with it
+    assert [(event["type"], event["item"]["role"]) for event in events] == [("conversation.item.create", "user")]
+    text = events[0]["item"]["content"][0]["text"]
+    preamble, _ = render("proposal.ev_charge.preamble", "ja")
+    assert text.index("why EV charging is being suggested") < text.index(preamble)
+    assert text.rstrip().endswith(preamble)
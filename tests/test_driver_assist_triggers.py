@@ -0,0 +1,89 @@
+"""driver_assist_triggers: only meaningful changes run driver assist, and flapping is debounced."""
+
+import driver_assist_triggers
+from driver_assist_triggers import DEFAULT_DEBOUNCE_SEC, TriggerEngine
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _status(driving_status: str = "manual", battery_level: float = 80, eta_sec: float = 1500,
+            network_status: str = "online") -> dict:
+    return {
+        "driving_status": driving_status,
+        "energy_status": {"battery_level": battery_level},
+        "destination_info": {"eta_sec": eta_sec},
+        "network_status": network_status,
+    }
+
+
+def _engine(monkeypatch) -> tuple[TriggerEngine, _Clock]:
+    monkeypatch.setattr(driver_assist_triggers, "ENABLED", True)
+    monkeypatch.setattr(driver_assist_triggers, "BATTERY_LEVELS", [15.0, 30.0, 50.0])
+    monkeypatch.setattr(driver_assist_triggers, "ETA_BUCKET_SEC", 600.0)
+    monkeypatch.setattr(driver_assist_triggers, "ETA_DRIFT", 0.2)
+    clock = _Clock()
+    return TriggerEngine(debounce=dict(DEFAULT_DEBOUNCE_SEC), clock=clock), clock
+
+
+def test_first_status_fires_and_unchanged_status_is_skipped(monkeypatch):
+    engine, _ = _engine(monkeypatch)
+    assert engine.evaluate(_status()) == ["initial"]
+    # Telemetry noise within the same battery range and ETA bucket
+    assert engine.evaluate(_status(battery_level=79, eta_sec=1450)) == []
+
+
+def test_battery_threshold_crossing_fires_in_both_directions(monkeypatch):
+    engine, clock = _engine(monkeypatch)
+    engine.evaluate(_status(battery_level=52))
+    assert engine.evaluate(_status(battery_level=49)) == ["battery"]
+    assert engine.evaluate(_status(battery_level=40)) == []  # no level between 49 and 40
+
+    clock.now += DEFAULT_DEBOUNCE_SEC["battery"]
+    # Charging back over the level is as relevant as passing it while driving
+    assert engine.evaluate(_status(battery_level=55)) == ["battery"]
+
+
+def test_eta_bucket_and_driving_status_changes_fire_together(monkeypatch):
+    engine, _ = _engine(monkeypatch)
+    engine.evaluate(_status(eta_sec=1300))
+    assert engine.evaluate(_status(driving_status="charging", eta_sec=1100)) == ["driving_status", "eta"]
+
+
+def test_flapping_network_is_debounced_and_not_replayed(monkeypatch):
+    engine, clock = _engine(monkeypatch)
+    engine.evaluate(_status())
+    assert engine.evaluate(_status(network_status="offline")) == ["network"]
+    clock.now += 5
+    assert engine.evaluate(_status(network_status="online")) == []
+    # The debounced transition is the new baseline: a later unchanged status does not replay it
+    clock.now += DEFAULT_DEBOUNCE_SEC["network"]
+    assert engine.evaluate(_status(network_status="online")) == []
+
+
+def test_eta_drift_fires_once_when_rising_above_the_threshold(monkeypatch):
+    engine, clock = _engine(monkeypatch)
+    engine.evaluate(_status(), features={"eta_drift": 0.1})
+    assert engine.evaluate(_status(), features={"eta_drift": 0.3}) == ["eta_drift"]
+    clock.now += DEFAULT_DEBOUNCE_SEC["eta_drift"]
+    # Staying above the threshold is not a new crossing
+    assert engine.evaluate(_status(), features={"eta_drift": 0.4}) == []
+
+
+def test_forced_trigger_bypasses_rules_and_debounce(monkeypatch):
+    engine, _ = _engine(monkeypatch)
+    engine.evaluate(_status())
+    assert engine.evaluate(_status(), forced="demo") == ["demo"]
+    assert engine.evaluate(_status(), forced="demo") == ["demo"]
+
+
+def test_disabled_engine_runs_for_every_status(monkeypatch):
+    engine, _ = _engine(monkeypatch)
+    monkeypatch.setattr(driver_assist_triggers, "ENABLED", False)
+    assert engine.evaluate(_status()) == ["always"]
+    assert engine.evaluate(_status()) == ["always"]
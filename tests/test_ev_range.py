@@ -0,0 +1,61 @@
+"""ev_range: the three verdicts of the local range gate and how "charge" overrides the LLM."""
+
+import ev_range
+from agent_driver_assist_ai import _apply_range_verdict
+from ev_range import RangeEstimator
+
+
+def _status(battery: float, distance_km: float, charging: bool = False) -> dict:
+    return {
+        "energy_status": {"battery_level": battery, "charging": charging},
+        "destination_info": {"distance_km": distance_km},
+    }
+
+
+def test_range_well_above_the_distance_needs_no_charge():
+    # 80% of 60 kWh above the 10% reserve at the default 0.17 kWh/km: about 247 km
+    estimate = RangeEstimator().estimate(_status(80, 50))
+    assert estimate.verdict == "no_charge"
+    assert round(estimate.range_km) == 247
+    assert "covers" in estimate.reason() and "does not" not in estimate.reason()
+
+
+def test_charging_vehicle_needs_no_charge():
+    assert RangeEstimator().estimate(_status(20, 500, charging=True)).verdict == "no_charge"
+
+
+def test_range_well_below_the_distance_needs_a_charge():
+    estimate = RangeEstimator().estimate(_status(20, 200))
+    assert estimate.verdict == "charge"
+    assert "does not cover" in estimate.reason()
+
+
+def test_range_close_to_the_distance_is_left_to_the_llm():
+    # About 247 km for 247 km: inside the +-25% band
+    assert RangeEstimator().estimate(_status(80, 247)).verdict == "borderline"
+
+
+def test_missing_fields_are_unknown():
+    assert RangeEstimator().estimate({"energy_status": {"battery_level": 50}}).verdict == "unknown"
+
+
+def test_learned_consumption_replaces_the_default():
+    estimator = RangeEstimator()
+    estimator.estimate(_status(80, 100))
+    estimator.estimate(_status(70, 80))  # 10% of 60 kWh over 20 km: 0.3 kWh/km
+    assert estimator.consumption() == 0.3
+
+
+def test_charge_verdict_forces_need_ev_charge_whatever_the_llm_said(monkeypatch):
+    monkeypatch.setattr(ev_range, "ENABLED", True)
+    estimate = RangeEstimator().estimate(_status(20, 200))
+    assert _apply_range_verdict(estimate, {"need_ev_charge": False, "reason": "Battery is low."}) == {
+        "need_ev_charge": True, "reason": "Battery is low."}
+    # The LLM call was shed or gave no reason: the local reason is used
+    assert _apply_range_verdict(estimate, {}) == {"need_ev_charge": True, "reason": estimate.reason()}
+
+
+def test_borderline_verdict_keeps_the_llm_decision(monkeypatch):
+    monkeypatch.setattr(ev_range, "ENABLED", True)
+    estimate = RangeEstimator().estimate(_status(80, 247))
+    assert _apply_range_verdict(estimate, {"need_ev_charge": False}) == {"need_ev_charge": False}
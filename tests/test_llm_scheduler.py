@@ -0,0 +1,101 @@
+"""llm_scheduler: priority order, load shedding, and sync slots that must never block an event loop."""
+
+import asyncio
+import time
+
+import pytest
+
+from llm_scheduler import LLMScheduler, LLMShedError, Priority, current_priority, llm_deadline, llm_priority
+
+
+async def _hold(scheduler: LLMScheduler, seconds: float, held: asyncio.Event) -> None:
+    async with scheduler.aslot("m"):
+        held.set()
+        await asyncio.sleep(seconds)
+
+
+def test_sync_slot_on_the_loop_is_shed_instead_of_blocking():
+    scheduler = LLMScheduler(limits={"m": 1})
+
+    async def main() -> float:
+        held = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, 0.2, held))
+        await held.wait()
+        started = time.perf_counter()
+        with llm_deadline(5), pytest.raises(LLMShedError):
+            with scheduler.slot("m"):
+                pass
+        elapsed = time.perf_counter() - started
+        await holder
+        return elapsed
+
+    assert asyncio.run(main()) < 0.1
+
+
+def test_sync_slot_off_the_loop_waits_for_release():
+    scheduler = LLMScheduler(limits={"m": 1})
+
+    def use_slot() -> bool:
+        with llm_deadline(5), scheduler.slot("m"):
+            return True
+
+    async def main() -> bool:
+        held = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, 0.1, held))
+        await held.wait()
+        result = await asyncio.to_thread(use_slot)
+        await holder
+        return result
+
+    assert asyncio.run(main())
+
+
+async def _call(scheduler: LLMScheduler, priority: Priority, served: list) -> None:
+    with llm_priority(priority):
+        async with scheduler.aslot("m"):
+            served.append(priority)
+
+
+def test_untagged_calls_run_as_background():
+    assert current_priority() == Priority.BACKGROUND
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(limits={"m": 1})
+
+    async def main() -> list:
+        served: list = []
+        held = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, 0.05, held))
+        await held.wait()
+        calls = [asyncio.create_task(_call(scheduler, priority, served))
+                 for priority in (Priority.BACKGROUND, Priority.PROPOSAL_VIDEO, Priority.USER)]
+        await asyncio.gather(holder, *calls)
+        return served
+
+    assert asyncio.run(main()) == [Priority.USER, Priority.PROPOSAL_VIDEO, Priority.BACKGROUND]
+
+
+def test_full_queue_evicts_lower_priorities_and_never_sheds_user_calls():
+    scheduler = LLMScheduler(limits={"m": 1}, queue_max=1)
+
+    async def main() -> tuple:
+        served: list = []
+        held = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, 0.05, held))
+        await held.wait()
+        background = asyncio.create_task(_call(scheduler, Priority.BACKGROUND, served))
+        await asyncio.sleep(0)
+        # A USER call evicts the background waiter from the full queue
+        first_user = asyncio.create_task(_call(scheduler, Priority.USER, served))
+        await asyncio.sleep(0)
+        # The queue is full of USER calls: another USER call still queues, a background call is shed
+        second_user = asyncio.create_task(_call(scheduler, Priority.USER, served))
+        late = asyncio.create_task(_call(scheduler, Priority.BACKGROUND, served))
+        results = await asyncio.gather(holder, background, first_user, second_user, late, return_exceptions=True)
+        return served, results
+
+    served, results = asyncio.run(main())
+    assert served == [Priority.USER, Priority.USER]
+    assert isinstance(results[1], LLMShedError) and "evicted" in str(results[1])
+    assert isinstance(results[4], LLMShedError) and "queue full" in str(results[4])
@@ -0,0 +1,70 @@
+"""model_factory: HTTP patches are opt-in, and cassettes replay off the event loop."""
+
+import asyncio
+import threading
+
+import httpx
+from requests.adapters import HTTPAdapter
+
+import model_factory
+from model_factory import AsyncCassetteTransport, Cassette
+
+
+def test_import_does_not_patch_requests_but_the_startup_hook_does(monkeypatch, tmp_path):
+    original_send = HTTPAdapter.send
+    assert getattr(original_send, "__module__", "") != "model_factory"
+
+    cassette = Cassette(str(tmp_path))
+    cassette.record("GET", "https://api.example.com/forecast?api_key=secret&lat=1", None, 200,
+                    {"content-type": "application/json"}, b'{"ok": true}')
+    monkeypatch.setattr(HTTPAdapter, "send", original_send)  # restored after the test
+    monkeypatch.setattr(model_factory, "_cassette", cassette)
+    monkeypatch.setattr(model_factory, "CASSETTE_MODE", "replay")
+    monkeypatch.setattr(model_factory, "_requests_installed", False)
+    monkeypatch.setattr(model_factory, "_deadline_installed", False)
+
+    model_factory.install_http_patches()
+    response = model_factory.get_http_session().get("https://api.example.com/forecast", params={"lat": 1})
+    assert response.json() == {"ok": True}
+
+
+def test_async_cassette_replay_reads_files_off_the_event_loop(monkeypatch, tmp_path):
+    cassette = Cassette(str(tmp_path))
+    cassette.record("POST", "https://api.example.com/v1/chat", b'{"a": 1}', 200, {}, b"ok")
+    threads = []
+    replay = cassette.replay
+
+    def recording_replay(*args):
+        threads.append(threading.current_thread())
+        return replay(*args)
+
+    monkeypatch.setattr(cassette, "replay", recording_replay)
+
+    async def main() -> str:
+        transport = AsyncCassetteTransport("replay", cassette, httpx.AsyncHTTPTransport())
+        async with httpx.AsyncClient(transport=transport) as client:
+            return (await client.post("https://api.example.com/v1/chat", content=b'{"a": 1}')).text
+
+    assert asyncio.run(main()) == "ok"
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_shard_shutdown_closes_the_loop_clients(monkeypatch):
+    from realtime_shards import LoopShard
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    shard = LoopShard(0)
+    shard.start()
+
+    async def create():
+        return model_factory.get_chat_model("gpt-test")
+
+    chat_model = asyncio.run_coroutine_threadsafe(create(), shard.loop).result(timeout=5)
+    assert shard.loop in model_factory._loop_models
+    async_client = model_factory._loop_async_clients[shard.loop]["gpt-test"]
+    assert chat_model is asyncio.run_coroutine_threadsafe(create(), shard.loop).result(timeout=5)
+
+    shard.stop()
+    assert async_client.is_closed
+    assert shard.loop not in model_factory._loop_models
+    assert shard.loop not in model_factory._loop_async_clients
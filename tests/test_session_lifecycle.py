@@ -0,0 +1,55 @@
+"""realtime_session_lifecycle: reaping and reconnect accounting."""
+
+import asyncio
+import time
+
+from starlette.websockets import WebSocketState
+
+from realtime_session_lifecycle import SessionLifecycleManager
+
+
+def _session() -> dict:
+    return SessionLifecycleManager.init_session({
+        "subscribers": {}, "input_queue": asyncio.Queue(), "ai_input_queue": asyncio.Queue()})
+
+
+class _WebSocket:
+    def __init__(self, state: WebSocketState = WebSocketState.CONNECTED) -> None:
+        self.client_state = self.application_state = state
+
+
+def _manager(sessions: dict, released: list) -> SessionLifecycleManager:
+    async def release(client_id: str, session_data: dict) -> None:
+        released.append(client_id)
+    return SessionLifecycleManager(sessions, release, idle_timeout_sec=1.0)
+
+
+def test_idle_reaper_frees_silent_sessions_even_when_connected():
+    released = []
+    sessions = {"silent": _session(), "half_open": _session(), "listening": _session()}
+    manager = _manager(sessions, released)
+    manager.attach("silent", _WebSocket(), "speaker")
+    manager.attach("half_open", _WebSocket(WebSocketState.DISCONNECTED), "display")
+    manager.attach("listening", _WebSocket(), "display")
+    for session_data in sessions.values():
+        session_data["last_activity"] = time.monotonic() - 10
+    SessionLifecycleManager.record_output(sessions["listening"], "hello")
+
+    asyncio.run(manager.reap_once())
+
+    assert sorted(released) == ["half_open", "silent"]
+    assert list(sessions) == ["listening"]
+
+
+def test_reconnects_count_only_reattached_sessions():
+    sessions = {"c1": _session()}
+    manager = _manager(sessions, [])
+    first, second = _WebSocket(), _WebSocket()
+    manager.attach("c1", first, "speaker")
+    manager.attach("c1", second, "display")
+    assert sessions["c1"]["stats"]["reconnects"] == 0
+
+    asyncio.run(manager.detach("c1", first))
+    asyncio.run(manager.detach("c1", second))
+    manager.attach("c1", _WebSocket(), "speaker")
+    assert sessions["c1"]["stats"]["reconnects"] == 1
@@ -0,0 +1,66 @@
+"""telemetry_buffer: the ring buffer keeps the newest statuses in order across wraparound."""
+
+import pytest
+
+from telemetry_buffer import TelemetryBuffer
+
+
+def _vehicle_data(battery_level: float, distance_km: float, eta_sec: float, speed: float = 60,
+                  driving_status: str = "manual") -> dict:
+    return {
+        "driving_status": driving_status,
+        "vehicle_speed": speed,
+        "energy_status": {"battery_level": battery_level},
+        "destination_info": {"distance_km": distance_km, "eta_sec": eta_sec},
+    }
+
+
+def test_wraparound_keeps_only_the_newest_samples_oldest_first():
+    buffer = TelemetryBuffer(capacity=4)
+    for t in range(6):
+        buffer.append(_vehicle_data(90 - t, 100 - t, 3600 - t), t=float(t))
+
+    assert len(buffer) == 4
+    features = buffer.features(now=5.0)
+    # Samples 2..5 survive: the span is measured oldest to newest, not across the write position
+    assert features["samples"] == 4.0
+    assert features["span_sec"] == 3.0
+    assert features["driven_km"] == pytest.approx(3.0)
+    assert features["drain_pct_per_km"] == pytest.approx(1.0)
+
+
+def test_wraparound_at_the_exact_capacity_boundary():
+    buffer = TelemetryBuffer(capacity=3)
+    for t, speed in enumerate((10, 20, 30, 40, 50, 60)):
+        buffer.append(_vehicle_data(80, 50, 1000, speed=speed), t=float(t))
+
+    # The write position is back at 0: the whole array is in order
+    assert buffer.features(now=5.0)["avg_speed_kmh"] == pytest.approx(50.0)
+
+
+def test_eta_drift_after_wraparound_ignores_evicted_samples():
+    buffer = TelemetryBuffer(capacity=4)
+    # An old stretch where the ETA slipped badly, then on schedule (eta falls 1 s per second)
+    for t in range(3):
+        buffer.append(_vehicle_data(80, 50, 1000 + 100 * t), t=float(t))
+    for t in range(3, 7):
+        buffer.append(_vehicle_data(80, 50, 2000 - t), t=float(t))
+
+    assert buffer.features(now=6.0)["eta_drift"] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_time_in_state_and_charging_segments_across_wraparound():
+    buffer = TelemetryBuffer(capacity=3)
+    buffer.append(_vehicle_data(50, 20, 600, driving_status="manual"), t=0.0)
+    buffer.append(_vehicle_data(49, 19, 590, driving_status="manual"), t=1.0)
+    buffer.append(_vehicle_data(60, 19, 590, driving_status="charging"), t=2.0)
+    buffer.append(_vehicle_data(70, 19, 590, driving_status="charging"), t=3.0)
+
+    features = buffer.features(now=10.0)
+    assert features["time_in_state_sec"] == pytest.approx(8.0)
+    # Battery gained while charging is not counted as driving
+    assert "drain_pct_per_km" not in features
+
+
+def test_empty_buffer_has_no_features():
+    assert TelemetryBuffer(capacity=2).features() == {}
@@ -0,0 +1,60 @@
+"""vehicle_state: deltas for the realtime model and what reaches driver assist."""
+
+import json
+
+from dummy_data.vehicle_data import vehicle_data as demo_scenarios
+from vehicle_state import VehicleStateStore
+
+
+def _text(item: dict) -> dict:
+    return json.loads(item["item"]["content"][0]["text"])
+
+
+def test_first_report_is_a_snapshot_then_only_moved_fields_are_sent():
+    store = VehicleStateStore(thresholds={"vehicle_speed": 10.0}, resync=10)
+    store.merge({"vehicle_speed": 50, "energy_status": {"battery_level": 80}})
+    assert _text(store.realtime_item())["type"] == "vehicle_status"
+
+    store.merge({"vehicle_speed": 55})
+    assert store.realtime_item() is None  # below its threshold
+
+    store.merge({"vehicle_speed": 62, "energy_status": {"battery_level": 79}})
+    item = store.realtime_item()
+    assert item["item"]["id"].startswith("delta_")
+    assert _text(item)["changed"] == {"vehicle_speed": 62, "energy_status.battery_level": 79}
+
+
+def test_snapshot_is_sent_again_after_resync_reports():
+    store = VehicleStateStore(thresholds={}, resync=2)
+    kinds = []
+    for speed in range(4):
+        store.merge({"vehicle_speed": speed})
+        kinds.append(store.realtime_item()["item"]["id"].partition("_")[0])
+    assert kinds == ["status", "delta", "delta", "status"]
+
+
+def test_merge_reports_changed_nested_fields_only():
+    store = VehicleStateStore()
+    store.merge({"destination_info": {"eta_sec": 600, "distance_km": 10}})
+    assert store.merge({"destination_info": {"eta_sec": 540}}) == {"destination_info.eta_sec": 540}
+    assert store.state == {"destination_info": {"eta_sec": 540, "distance_km": 10}}
+
+
+def test_driver_assist_gets_updates_that_change_only_user_data():
+    store = VehicleStateStore()
+    _, message = store.driver_assist_update({"vehicle_speed": 40}, {"name": "A"})
+    assert json.loads(message)["user_data"] == {"name": "A"}
+
+    assert store.driver_assist_update({"vehicle_speed": 40}, {"name": "A"}) == ({}, None)
+    changed, message = store.driver_assist_update({"vehicle_speed": 40}, {"name": "B"})
+    assert changed == {}
+    assert json.loads(message)["user_data"] == {"name": "B"}
+
+
+def test_demo_action_scenarios_always_reach_driver_assist():
+    store = VehicleStateStore()
+    for scenario in [*demo_scenarios, demo_scenarios[0]]:
+        # The same scenario twice: the demo trigger forwards it although nothing changed
+        _, message = store.driver_assist_update(scenario["vehicle_data"], trigger="demo")
+        assert json.loads(message) == {
+            "type": "vehicle_status", "vehicle_data": store.state, "trigger": "demo"}
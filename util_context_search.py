@@ -1,6 +1,6 @@
 import os
 import json
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 from langchain_core.prompts import PromptTemplate
 from langchain_community.retrievers import TavilySearchAPIRetriever
 from langchain_core.runnables import RunnableSequence
@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+llm = get_chat_model("gpt-4o", temperature=0.7)
 
 # 🔹 検索キーワード生成プロンプト
 keyword_prompt = PromptTemplate.from_template("""
@@ -0,0 +1,155 @@
+"""
+Per-session vehicle state store
+
+A vehicle_status carries the whole vehicle_data even when only vehicle_speed
+changed, and used to be forwarded in full, pretty-printed, to both the
+realtime model and driver assist. VehicleStateStore merges every update into
+the state of the session and computes field-level diffs (fields are dotted
+paths such as "energy_status.battery_level"):
+- the realtime model only gets a system item when a field moved by at least
+  its threshold since it was last reported: a full snapshot ("status_" item)
+  for the first report and every VEHICLE_STATUS_RESYNC reports, a delta
+  ("delta_" item) otherwise. realtime_compaction drops the deltas when the
+  next snapshot arrives.
+- driver assist gets the merged state as compact canonical JSON (sorted keys,
+  no whitespace), and nothing when the update changed neither a field nor the
+  user_data sent with it (a trigger such as a demo action always forwards it).
+
+Settings (environment variables):
+- VEHICLE_DELTA_THRESHOLDS: comma separated field=threshold pairs overriding
+  the defaults below; numeric fields without a threshold report any change
+- VEHICLE_STATUS_RESYNC: reports after which a full snapshot is sent again (default 10)
+"""
+
+import json
+import logging
+import os
+from typing import Any
+
+from realtime_api_utils import text_to_realtime_api_json_as_role
+from realtime_metrics import VEHICLE_STATUS_FORWARDED
+
+DEFAULT_THRESHOLDS = {
+    "vehicle_speed": 10.0,
+    "energy_status.battery_level": 2.0,
+    "destination_info.eta_sec": 120.0,
+    "destination_info.distance_km": 1.0,
+    "current_location.lat": 0.005,
+    "current_location.lon": 0.005,
+}
+
+
+def _parse_thresholds(spec: str) -> dict[str, float]:
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        field, _, value = pair.partition("=")
+        try:
+            thresholds[field.strip()] = float(value)
+        except ValueError:
+            logging.warning(f"Ignoring invalid VEHICLE_DELTA_THRESHOLDS entry: {pair!r}")
+    return thresholds
+
+
+THRESHOLDS = _parse_thresholds(os.environ.get("VEHICLE_DELTA_THRESHOLDS", ""))
+RESYNC = int(os.environ.get("VEHICLE_STATUS_RESYNC", "10"))
+
+
+def canonical_json(data: Any) -> str:
+    """Compact JSON with sorted keys: equal data always gives the same text."""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def flatten(data: dict, prefix: str = "") -> dict[str, Any]:
+    """Leaf fields of nested dicts keyed by dotted path."""
+    fields = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            fields.update(flatten(value, path + "."))
+        else:
+            fields[path] = value
+    return fields
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class VehicleStateStore:
+    """Merged vehicle_data of one session and what the realtime model was last told."""
+
+    def __init__(self, thresholds: dict[str, float] | None = None, resync: int = RESYNC) -> None:
+        self.thresholds = THRESHOLDS if thresholds is None else thresholds
+        self.resync = resync
+        self.state: dict[str, Any] = {}
+        # Field values as last reported to the realtime model
+        self._reported: dict[str, Any] | None = None
+        self._reports_since_snapshot = 0
+        # user_data last forwarded to driver assist
+        self.user_data: dict | None = None
+
+    def merge(self, vehicle_data: dict) -> dict[str, Any]:
+        """Merge an update into the state; returns the fields it changed (dotted path -> new value)."""
+        before = flatten(self.state)
+        self._merge_into(self.state, vehicle_data)
+        after = flatten(self.state)
+        return {path: value for path, value in after.items() if path not in before or before[path] != value}
+
+    @classmethod
+    def _merge_into(cls, target: dict, update: dict) -> None:
+        for key, value in update.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                cls._merge_into(target[key], value)
+            else:
+                target[key] = value
+
+    def _meaningful(self, path: str, value: Any) -> bool:
+        previous = self._reported.get(path)
+        if _is_number(value) and _is_number(previous):
+            return abs(value - previous) >= self.thresholds.get(path, 0.0) and value != previous
+        return path not in self._reported or value != previous
+
+    def realtime_item(self) -> dict | None:
+        """conversation.item.create to send to the realtime model, None if no field moved enough."""
+        current = flatten(self.state)
+        if self._reported is None or self._reports_since_snapshot >= self.resync:
+            self._reported = current
+            self._reports_since_snapshot = 0
+            VEHICLE_STATUS_FORWARDED.labels("realtime", "snapshot").inc()
+            text = canonical_json({"type": "vehicle_status", "vehicle_data": self.state})
+            return text_to_realtime_api_json_as_role("system", text, kind="status")
+
+        changed = {path: value for path, value in current.items() if self._meaningful(path, value)}
+        if not changed:
+            VEHICLE_STATUS_FORWARDED.labels("realtime", "none").inc()
+            return None
+        self._reported.update(changed)
+        self._reports_since_snapshot += 1
+        VEHICLE_STATUS_FORWARDED.labels("realtime", "delta").inc()
+        text = canonical_json({"type": "vehicle_status_delta", "changed": changed})
+        return text_to_realtime_api_json_as_role("system", text, kind="delta")
+
+    def driver_assist_update(self, vehicle_data: dict, user_data: dict | None = None,
+                             trigger: str | None = None) -> tuple[dict[str, Any], str | None]:
+        """Merge an update; returns the fields it changed and the message for driver assist (None: nothing new)."""
+        changed = self.merge(vehicle_data)
+        user_changed = user_data is not None and user_data != self.user_data
+        if user_data is not None:
+            self.user_data = user_data
+        if not (changed or user_changed or trigger):
+            VEHICLE_STATUS_FORWARDED.labels("driver_assist", "none").inc()
+            return changed, None
+        VEHICLE_STATUS_FORWARDED.labels("driver_assist", "snapshot").inc()
+        return changed, self.snapshot(user_data, trigger)
+
+    def snapshot(self, user_data: dict | None = None, trigger: str | None = None) -> str:
+        """vehicle_status message of the merged state for driver assist (compact canonical JSON).
+
+        trigger forces a driver assist run (driver_assist_triggers) whatever changed.
+        """
+        message = {"type": "vehicle_status", "vehicle_data": self.state}
+        if user_data:
+            message["user_data"] = user_data
+        if trigger:
+            message["trigger"] = trigger
+        return canonical_json(message)
@@ -15,7 +15,7 @@ LangGraph's create_react_agent pattern.
 import asyncio
 import logging
 
-from langchain_openai import ChatOpenAI
+from model_factory import get_chat_model
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
@@ -90,7 +90,7 @@ return the tool output exactly as provided by the tool.
     
     # Initialize components
     memory = MemorySaver()
-    model = ChatOpenAI(model_name=model_name, temperature=temperature)
+    model = get_chat_model(model_name, temperature=temperature)
     tools = [SearchVideos()]
     
     # Create and return react agent with name